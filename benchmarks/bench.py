@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the modules against a simulated VPP
+
+Every scenario runs a module in-process against a SimulatedVPP of a given
+size, wrapped in a MeteredVPP that counts the API calls and delays each one by
+the latency of a round trip to VPP. The wall time is the best of a few runs,
+peak memory is measured in one more run with tracemalloc, as tracing slows a
+run down.
+
+Results are compared with benchmarks/baselines.json. A scenario regresses
+when it makes more API calls than its baseline, or takes more time or memory
+than the tolerances allow. Times depend on the machine and on its load, so
+record the baselines on the machine that checks against them; the default
+time tolerance only catches a run that takes twice as long.
+
+Usage:
+    benchmarks/bench.py [--sizes 10 100 1000] [--scenarios vpp_bd_create] [--update]
+
+Needs ansible-core, vpp_papi is not needed.
+"""
+
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+COLLECTION = ROOT / "surfnet.vpp"
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+
+SIZES = [10, 100, 1000, 10000, 100000]
+# Seconds per API call, about a round trip over the VPP API socket
+LATENCY = 0.0001
+TOLERANCE = 0.25
+TIME_TOLERANCE = 1.0
+# Runs per scenario and size, the fastest counts
+REPEAT = 3
+# Differences in time below this are noise
+MIN_SECONDS = 0.05
+# Differences in peak memory below this are noise
+MIN_KIB = 256
+# Size of the untimed run that imports a module before it is measured
+WARMUP_SIZE = 10
+
+
+def _setup_facts(vpp, size):
+    vpp.populate(vhost_user=size, bridge_domains=max(size // 10, 1), routes=size)
+    return dict(
+        filter=[
+            "sw_interface_dump",
+            "sw_interface_vhost_user_dump",
+            "bridge_domain_dump",
+            "ip_route_dump",
+        ],
+        fields=dict(ip_route_dump="route.table_id,route.prefix,route.paths"),
+    )
+
+
+def _setup_bd_create(vpp, size):
+    return dict(bds=[dict(bd=n + 1, bd_tag=str(n + 1)) for n in range(size)])
+
+
+def _setup_bd_unchanged(vpp, size):
+    vpp.populate(bridge_domains=size)
+    return _setup_bd_create(vpp, size)
+
+
+def _setup_vhostuser_create(vpp, size):
+    return dict(
+        interfaces=[
+            dict(sock_filename=f"/var/sockets/bench-{n}.sock", tag=f"bench-{n}")
+            for n in range(size)
+        ]
+    )
+
+
+def _setup_vhostuser_unchanged(vpp, size):
+    vpp.populate(vhost_user=size)
+    return dict(
+        interfaces=[
+            dict(sock_filename=f"/var/sockets/sim-{n}.sock", tag=f"sim-{n}")
+            for n in range(size)
+        ]
+    )
+
+
+# name: (module, setup), setup fills the simulated VPP and returns the args
+SCENARIOS = {
+    "vpp_facts": ("vpp_facts", _setup_facts),
+    "vpp_bd_create": ("vpp_bd", _setup_bd_create),
+    "vpp_bd_unchanged": ("vpp_bd", _setup_bd_unchanged),
+    "vpp_vhostuser_create": ("vpp_vhostuser", _setup_vhostuser_create),
+    "vpp_vhostuser_unchanged": ("vpp_vhostuser", _setup_vhostuser_unchanged),
+}
+
+
+@contextlib.contextmanager
+def _collection_path():
+    """Make this checkout importable as ansible_collections.surfnet.vpp"""
+
+    root = tempfile.mkdtemp(prefix="vpp-bench-")
+    namespace = Path(root) / "ansible_collections" / "surfnet"
+    namespace.mkdir(parents=True)
+    (namespace / "vpp").symlink_to(COLLECTION)
+    sys.path.insert(0, root)
+    try:
+        yield
+    finally:
+        sys.path.remove(root)
+        shutil.rmtree(root)
+
+
+def _run_module(name, args, client):
+    """Run a module in-process on a client, return its result"""
+
+    from ansible.module_utils import basic
+    from ansible.module_utils.common.text.converters import to_bytes
+
+    module = importlib.import_module(
+        f"ansible_collections.surfnet.vpp.plugins.modules.{name}"
+    )
+    module.connect = lambda *a, **kw: client
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps({"ANSIBLE_MODULE_ARGS": args}))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            module.main()
+        except SystemExit:
+            pass
+    return json.loads(out.getvalue())
+
+
+_warm = set()
+
+
+def measure(scenario, size, latency, memory=True, repeat=REPEAT):
+    """
+    Run a scenario at a size
+
+    :return: seconds, calls, the calls per message, and unless memory is
+             False, peak_kib
+    """
+
+    from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import (
+        SimulatedVPP,
+        SimulatedVPPApiClient,
+        MeteredVPP,
+    )
+
+    module, setup = SCENARIOS[scenario]
+
+    def run(trace, size=size):
+        vpp = SimulatedVPP()
+        args = setup(vpp, size)
+        metered = MeteredVPP(vpp, latency=0.0 if trace else latency)
+        client = SimulatedVPPApiClient(vpp=metered)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = _run_module(module, args, client)
+        seconds = time.perf_counter() - start
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if result.get("failed"):
+            raise RuntimeError(f"{scenario} at {size} failed: {result.get('msg')}")
+        return seconds, metered.calls, peak
+
+    # The first run of a module also imports it and its module_utils
+    if module not in _warm:
+        run(False, WARMUP_SIZE)
+        _warm.add(module)
+
+    seconds, calls, _ = min(
+        (run(False) for _ in range(repeat)), key=lambda outcome: outcome[0]
+    )
+    measurement = dict(
+        seconds=round(seconds, 4),
+        calls=sum(calls.values()),
+        messages=dict(sorted(calls.items())),
+    )
+    if memory:
+        measurement["peak_kib"] = run(True)[2] // 1024
+    return measurement
+
+
+def regressions(measurement, baseline, tolerance, time_tolerance):
+    """What got worse than the baseline, as messages"""
+
+    found = []
+    if measurement["calls"] > baseline["calls"]:
+        found.append(f"calls {baseline['calls']} -> {measurement['calls']}")
+    limit = baseline["seconds"] * (1 + time_tolerance)
+    if measurement["seconds"] > max(limit, baseline["seconds"] + MIN_SECONDS):
+        found.append(f"seconds {baseline['seconds']} -> {measurement['seconds']}")
+    if "peak_kib" in measurement and "peak_kib" in baseline:
+        limit = baseline["peak_kib"] * (1 + tolerance)
+        if measurement["peak_kib"] > max(limit, baseline["peak_kib"] + MIN_KIB):
+            found.append(
+                f"peak_kib {baseline['peak_kib']} -> {measurement['peak_kib']}"
+            )
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--latency", type=float, default=LATENCY, help="seconds per call"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=TOLERANCE, help="for peak memory"
+    )
+    parser.add_argument(
+        "--time-tolerance", type=float, default=TIME_TOLERANCE, help="for wall time"
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per size")
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the tracemalloc run"
+    )
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    parser.add_argument(
+        "--update", action="store_true", help="store the results as baselines"
+    )
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    stored = {}
+    if args.baselines.exists():
+        stored = json.loads(args.baselines.read_text())
+    baselines = {}
+    if stored.get("latency") == args.latency:
+        baselines = stored["results"]
+    elif stored and not args.update:
+        print(
+            f"Baselines are for a latency of {stored.get('latency')}, not comparing",
+            file=sys.stderr,
+        )
+
+    results = {}
+    failed = []
+    with _collection_path():
+        for scenario in args.scenarios:
+            for size in args.sizes:
+                key = f"{scenario}/{size}"
+                measurement = measure(
+                    scenario, size, args.latency, not args.no_memory, args.repeat
+                )
+                results[key] = measurement
+                found = (
+                    regressions(
+                        measurement, baselines[key], args.tolerance, args.time_tolerance
+                    )
+                    if key in baselines
+                    else []
+                )
+                if found:
+                    failed.append(key)
+                print(
+                    f"{key:32} {measurement['seconds']:9.3f}s {measurement['calls']:8} calls"
+                    f" {measurement.get('peak_kib', '-'):>9} KiB"
+                    f"{'  REGRESSION: ' + ', '.join(found) if found else ''}"
+                )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+    if args.update:
+        baselines = dict(baselines, **results)
+        args.baselines.write_text(
+            json.dumps(
+                dict(latency=args.latency, results=dict(sorted(baselines.items()))),
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"Stored {len(results)} baselines in {args.baselines}")
+        return 0
+    if failed:
+        print(f"{len(failed)} regressions: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from ansible_collections.surfnet.vpp.plugins.plugin_utils.vpp_loop import (
+    CoalescingAction,
+)
+
+
+class ActionModule(CoalescingAction):
+    """Run a loop of vpp_bd tasks as one run with bds"""
+
+    MODULE = "surfnet.vpp.vpp_bd"
+    LIST_OPTION = "bds"
+    ITEM_OPTIONS = (
+        "state",
+        "bd",
+        "flood",
+        "uu_flood",
+        "learn",
+        "forward",
+        "arp_term",
+        "arp_ufwd",
+        "mac_age",
+        "bd_tag",
+    )
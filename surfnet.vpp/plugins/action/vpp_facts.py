@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import json
+import hashlib
+from typing import Dict, List
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+from ansible.plugins.loader import cache_loader, vars_loader
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.const import GatherDetails
+
+MODULE = "surfnet.vpp.vpp_facts"
+CACHE_PLUGIN = "surfnet.vpp.vpp_facts"
+VARS_PLUGIN = "surfnet.vpp.vpp_state"
+
+# Options handled here, everything else decides what the facts look like
+CACHE_OPTIONS = (
+    "cache",
+    "cache_ttl",
+    "cache_dir",
+    "fingerprint",
+    "snapshot",
+    "snapshot_dir",
+)
+# Options that change how facts are gathered or ordered, but not the facts
+GATHER_OPTIONS = ("all", "filter", "concurrency", "operation", "sorting")
+# Groups of GatherDetails that are made up of other groups
+COMPOUND_GROUPS = ("COMMON", "CORE", "ALL")
+
+
+def requested_dumps(args: Dict) -> List[str]:
+    """The dumps vpp_facts runs for a set of module arguments"""
+
+    if boolean(args.get("all", False)):
+        return list(GatherDetails.ALL)
+    wanted = args.get("filter") or []
+    if isinstance(wanted, str):
+        wanted = [name.strip() for name in wanted.split(",")]
+    if not wanted:
+        return list(GatherDetails.COMMON)
+    return [name for name in wanted if name in GatherDetails.ALL]
+
+
+def group_of(dump: str) -> str:
+    """The GatherDetails group a dump belongs to"""
+
+    for group, dumps in vars(GatherDetails).items():
+        if group.isupper() and group not in COMPOUND_GROUPS and dump in dumps:
+            return group
+    return "OTHER"
+
+
+class ActionModule(ActionBase):
+    """
+    Serve vpp_facts from the controller side cache while VPP state is unchanged
+
+    Facts are cached per host and per group of GatherDetails. Before cached
+    facts are used, the module is run in fingerprint mode, which costs a ping
+    and two dumps instead of all of them. When a group is missing, expired or
+    was stored with another fingerprint, the facts are gathered again.
+
+    A snapshot of VPP state is written to a file on the controller, for the
+    vpp_state vars plugin.
+    """
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        args = dict(self._task.args)
+        if args.get("snapshot", "skip") != "skip":
+            # A snapshot has to be of the current state, it bypasses the cache
+            result.update(self._run_module(args, task_vars))
+            if not result.get("failed") and "vpp_snapshot" in result:
+                self._write_snapshot(result, args, task_vars)
+            return result
+
+        # An export or a delta is kept on the target, there is nothing to cache
+        if (
+            not boolean(args.get("cache", False))
+            or args.get("export_dir")
+            or boolean(args.get("delta", False))
+        ):
+            result.update(self._run_module(args, task_vars))
+            return result
+
+        direct = {}
+        if args.get("cache_dir"):
+            direct["_uri"] = args["cache_dir"]
+        if args.get("cache_ttl") is not None:
+            direct["_timeout"] = int(args["cache_ttl"])
+        try:
+            cache = cache_loader.get(CACHE_PLUGIN, **direct)
+        except AnsibleError as e:
+            result.update(failed=True, msg=f"Could not load the fact cache: {e}")
+            return result
+        if cache is None:
+            result.update(
+                failed=True, msg=f"Could not load cache plugin {CACHE_PLUGIN}"
+            )
+            return result
+
+        host = task_vars.get("inventory_hostname", "localhost")
+        digest = hashlib.sha1(
+            json.dumps(
+                {
+                    k: v
+                    for k, v in args.items()
+                    if k not in CACHE_OPTIONS + GATHER_OPTIONS
+                },
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+        groups = {}
+        for dump in requested_dumps(args):
+            groups.setdefault(group_of(dump), []).append(dump)
+
+        entries = {}
+        for group, dumps in groups.items():
+            if not cache.contains(f"{host}--{group}"):
+                continue
+            try:
+                entry = cache.get(f"{host}--{group}")
+            except (KeyError, AnsibleError):
+                continue
+            if entry and entry["args"] == digest and set(dumps) <= set(entry["dumps"]):
+                entries[group] = entry
+
+        if groups and len(entries) == len(groups):
+            reply = self._run_module(dict(args, fingerprint="only"), task_vars)
+            fingerprint = reply.get("vpp_fingerprint")
+            if not reply.get("failed") and all(
+                entry["fingerprint"] == fingerprint for entry in entries.values()
+            ):
+                facts = {}
+                for dump in requested_dumps(args):
+                    fact_name = f"vpp_{dump}"
+                    if fact_name in entries[group_of(dump)]["facts"]:
+                        facts[fact_name] = entries[group_of(dump)]["facts"][fact_name]
+                if args.get("sorting") in ("asc", "desc"):
+                    facts = dict(
+                        sorted(facts.items(), reverse=args["sorting"] == "desc")
+                    )
+                result.update(
+                    changed=False,
+                    message="",
+                    cached=True,
+                    vpp_fingerprint=fingerprint,
+                    **facts,
+                )
+                return result
+
+        reply = self._run_module(dict(args, fingerprint="include"), task_vars)
+        result.update(reply)
+        if reply.get("failed"):
+            return result
+
+        for group, dumps in groups.items():
+            facts = {
+                f"vpp_{dump}": reply[f"vpp_{dump}"]
+                for dump in dumps
+                if f"vpp_{dump}" in reply
+            }
+            cache.set(
+                f"{host}--{group}",
+                {
+                    "fingerprint": reply.get("vpp_fingerprint"),
+                    "args": digest,
+                    "dumps": dumps,
+                    "facts": facts,
+                },
+            )
+        result["cached"] = False
+        return result
+
+    def _write_snapshot(self, result: Dict, args: Dict, task_vars: Dict) -> None:
+        """Move the snapshot out of the result into its file on the controller"""
+
+        directory = args.get("snapshot_dir")
+        if not directory:
+            plugin = vars_loader.get(VARS_PLUGIN)
+            if plugin is None:
+                result.update(
+                    failed=True, msg=f"Could not load vars plugin {VARS_PLUGIN}"
+                )
+                return
+            directory = plugin.get_option("snapshot_dir")
+        directory = os.path.expanduser(directory)
+
+        host = task_vars.get("inventory_hostname", "localhost")
+        path = os.path.join(directory, f"{host}.json")
+        snapshot = result.pop("vpp_snapshot")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path + ".tmp", "w") as fh:
+                json.dump(snapshot, fh, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+        except (IOError, OSError) as e:
+            result.update(failed=True, msg=f"Could not write the snapshot: {e}")
+            return
+        result["vpp_snapshot_file"] = path
+
+    def _run_module(self, args: Dict, task_vars: Dict) -> Dict:
+        return self._execute_module(
+            module_name=MODULE, module_args=args, task_vars=task_vars
+        )
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from ansible_collections.surfnet.vpp.plugins.plugin_utils.vpp_loop import (
+    CoalescingAction,
+)
+
+
+class ActionModule(CoalescingAction):
+    """Run a loop of vpp_vhostuser tasks as one run with interfaces"""
+
+    MODULE = "surfnet.vpp.vpp_vhostuser"
+    LIST_OPTION = "interfaces"
+    ITEM_OPTIONS = ("state", "sock_filename", "if_idx", "is_server", "tag")
+    REQUIRED = ("sock_filename",)
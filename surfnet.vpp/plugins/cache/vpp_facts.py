@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+name: vpp_facts
+short_description: Compressed file cache for VPP facts
+description:
+  - Stores every key as a zlib compressed JSON file.
+  - Used by the action plugin of M(surfnet.vpp.vpp_facts) to keep facts per host and
+    per group of facts, but it works as a general fact cache as well.
+  - It only reads its own settings, not the C(fact_caching_*) ones, which belong to
+    the fact cache plugin and would put these files in its directory.
+version_added: 1.0.0
+author: SURF B.V. (@surfnet)
+
+options:
+  _uri:
+    description: Directory to store the cache files in
+    default: ~/.ansible/vpp_facts_cache
+    env:
+      - name: ANSIBLE_VPP_FACTS_CACHE_DIR
+    ini:
+      - key: cache_dir
+        section: vpp_facts
+    type: path
+  _prefix:
+    description: Prefix for the names of the cache files
+    env:
+      - name: ANSIBLE_VPP_FACTS_CACHE_PREFIX
+    ini:
+      - key: cache_prefix
+        section: vpp_facts
+  _timeout:
+    description: Seconds an entry stays valid, 0 never expires entries
+    default: 3600
+    env:
+      - name: ANSIBLE_VPP_FACTS_CACHE_TTL
+    ini:
+      - key: cache_ttl
+        section: vpp_facts
+    type: integer
+"""
+
+import json
+import zlib
+
+from ansible.parsing.ajson import AnsibleJSONEncoder, AnsibleJSONDecoder
+from ansible.plugins.cache import BaseFileCacheModule
+
+
+class CacheModule(BaseFileCacheModule):
+    """
+    A caching module backed by zlib compressed JSON files.
+    """
+
+    def _load(self, filepath):
+        with open(filepath, "rb") as f:
+            data = f.read()
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as e:
+            raise ValueError(f"not a compressed cache file: {e}")
+        return json.loads(data.decode("utf-8"), cls=AnsibleJSONDecoder)
+
+    def _dump(self, value, filepath):
+        data = json.dumps(value, cls=AnsibleJSONEncoder, separators=(",", ":"))
+        with open(filepath, "wb") as f:
+            f.write(zlib.compress(data.encode("utf-8")))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+
+class ModuleDocFragment(object):
+    # The journal and rollback options of the modules that apply an L2 plan
+    DOCUMENTATION = r"""
+options:
+    journal:
+      description:
+        - Name of a journal to keep the plan and every confirmed change in,
+          under C(/var/cache/ansible-vpp/journal) on the target.
+        - When the previous run with this journal was interrupted, the changes
+          it did not get to are made, without dumping VPP again. The journal is
+          not resumed when VPP restarted or the declaration changed since, or
+          when VPP refused a change, then the next run plans again.
+      type: str
+    rollback:
+      description:
+        - Revert the changes made so far, last one first, when VPP refuses one.
+        - Deleted ports and bridge domains are created again with their former
+          settings, interfaces go back to the bridge domain they were in before.
+      type: bool
+      default: false
+"""
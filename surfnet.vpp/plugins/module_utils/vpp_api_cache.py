@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import json
+import fnmatch
+import hashlib
+import tempfile
+from typing import List, Dict, Union
+
+from .const import VPP_DEFAULT_DIR, VPP_CACHE_DIR
+
+# Bump when the layout of the manifest or the artifact changes
+CACHE_FORMAT = 1
+
+# Sections of an .api.json file that are lists of named definitions
+LIST_SECTIONS = ("enums", "enumflags", "unions", "types", "messages")
+# Sections of an .api.json file that are mappings
+DICT_SECTIONS = ("aliases", "services")
+
+
+def find_api_files(api_dir: str = VPP_DEFAULT_DIR) -> List[str]:
+    """
+    Find all API definition files below a directory
+
+    :param api_dir: Directory holding the VPP API definitions
+    :return: Sorted list of paths to *.api.json files
+    """
+
+    definitions = []
+    for root, dirnames, filenames in os.walk(api_dir):
+        for filename in fnmatch.filter(filenames, "*.api.json"):
+            definitions.append(os.path.join(root, filename))
+
+    return sorted(definitions)
+
+
+def api_family(path: str) -> str:
+    """Return the family of an API definition file, e.g. l2 for .../core/l2.api.json"""
+
+    return os.path.basename(path)[: -len(".api.json")]
+
+
+def select_api_files(files: List[str], families: List[str]) -> List[str]:
+    """
+    Select the API definition files of the requested families
+
+    :param files: List of paths to *.api.json files
+    :param families: List of API families to keep
+    :return: The subset of files that belong to one of the families
+    """
+
+    wanted = set(families)
+    return [path for path in files if api_family(path) in wanted]
+
+
+def family_set_name(families: List[str]) -> str:
+    """Return a short, stable cache name for a set of API families"""
+
+    return hashlib.sha1(",".join(sorted(set(families))).encode()).hexdigest()[:12]
+
+
+def _file_digest(path: str) -> str:
+    """Return the sha256 hex digest of the contents of a file"""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_json(path: str) -> Union[Dict, None]:
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: Dict) -> None:
+    """Atomically replace path with data, so concurrent runs never see half a file"""
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def merge_definitions(files: List[str]) -> Dict:
+    """
+    Merge a set of API definition files into one definition
+
+    Every .api.json file carries the types it imports, so the first definition
+    seen for a name wins and later duplicates are dropped. Message comments are
+    stripped as VPPApiClient does not use them.
+
+    :param files: List of paths to *.api.json files
+    :return: A single API definition in the .api.json layout
+    """
+
+    merged = {section: [] for section in LIST_SECTIONS}
+    merged.update({section: {} for section in DICT_SECTIONS})
+    seen = {section: set() for section in LIST_SECTIONS}
+
+    for path in files:
+        with open(path) as fh:
+            api = json.load(fh)
+
+        for section in LIST_SECTIONS:
+            for definition in api.get(section, []):
+                if definition[0] in seen[section]:
+                    continue
+                seen[section].add(definition[0])
+                if section == "messages" and isinstance(definition[-1], dict):
+                    definition[-1].pop("comment", None)
+                merged[section].append(definition)
+
+        for section in DICT_SECTIONS:
+            for name, definition in api.get(section, {}).items():
+                merged[section].setdefault(name, definition)
+
+    return merged
+
+
+def cached_definitions(
+    files: List[str], name: str = "all", cache_dir: str = VPP_CACHE_DIR
+) -> List[str]:
+    """
+    Return a prebuilt, merged artifact for a set of API definition files
+
+    The artifact is keyed by the path, mtime, size and content hash of every
+    source file. A file that was only touched keeps the artifact valid; any
+    change in content or in the set of files (e.g. a VPP upgrade) rebuilds it.
+
+    The parsed VPPMessage/VPPType objects cannot be persisted themselves (they
+    hold struct.Struct instances and register into a process global type table),
+    so the artifact is the merged JSON definition set VPPApiClient loads in one go.
+
+    :param files: List of paths to *.api.json files
+    :param name: Name of this set of definitions, used to key the cache
+    :param cache_dir: Directory to store the cache in
+    :return: List with the path to the artifact, or the original files if the
+             cache cannot be used
+    """
+
+    manifest_path = os.path.join(cache_dir, f"api-{name}.manifest.json")
+    artifact_path = os.path.join(cache_dir, f"api-{name}.defs.json")
+
+    try:
+        manifest = _read_json(manifest_path) or {}
+        cached_files = (
+            manifest.get("files", {}) if manifest.get("format") == CACHE_FORMAT else {}
+        )
+
+        current_files = {}
+        stale = False
+        for path in files:
+            st = os.stat(path)
+            entry = cached_files.get(path)
+            if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                current_files[path] = entry
+                continue
+            # New or touched file, only the content decides if it changed
+            digest = _file_digest(path)
+            current_files[path] = [st.st_mtime_ns, st.st_size, digest]
+            stale = True
+
+        key = hashlib.sha256(
+            "\n".join(
+                f"{p}:{current_files[p][2]}" for p in sorted(current_files)
+            ).encode()
+        ).hexdigest()
+
+        if manifest.get("key") == key and os.path.exists(artifact_path):
+            if stale:
+                # Only mtimes moved, remember them to skip hashing next time
+                manifest["files"] = current_files
+                _write_json(manifest_path, manifest)
+            return [artifact_path]
+
+        os.makedirs(cache_dir, mode=0o755, exist_ok=True)
+        _write_json(artifact_path, merge_definitions(files))
+        _write_json(
+            manifest_path,
+            {"format": CACHE_FORMAT, "key": key, "files": current_files},
+        )
+        return [artifact_path]
+    except (OSError, ValueError):
+        return files
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from enum import Enum
+from typing import Any, Callable, Dict, List
+
+from .const import VPP_BROKER_SOCKET, VPP_BROKER_IDLE_TIMEOUT
+
+# Every frame on the broker socket is a JSON document prefixed with its length
+_FRAME_HEADER = struct.Struct("!I")
+
+
+class VPPBrokerError(IOError):
+    """Raised when the broker cannot be reached or a call through it fails"""
+
+
+class BrokerRecord:
+    """
+    A decoded VPP message as returned through the broker
+
+    Behaves like the namedtuples vpp_papi returns as far as modules use them:
+    fields are attributes and _asdict() returns them as a dict.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict):
+        object.__setattr__(self, "_data", data)
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, BrokerRecord) and self._data == other._data
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v!r}" for k, v in self._data.items())
+        return f"BrokerRecord({fields})"
+
+    def __getstate__(self):
+        return self._data
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "_data", state)
+
+    @property
+    def _fields(self):
+        return tuple(self._data)
+
+    def _asdict(self) -> Dict:
+        return dict(self._data)
+
+
+def encode_value(value: Any) -> Any:
+    """Turn a vpp_papi reply into something JSON can carry"""
+
+    if value is None or isinstance(value, (bool, str, float)):
+        return value
+    if isinstance(value, Enum):
+        return int(value.value)
+    if isinstance(value, int):
+        return int(value)
+    if hasattr(value, "_asdict"):
+        return {"__r": {k: encode_value(v) for k, v in value._asdict().items()}}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__b": bytes(value).hex()}
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    # MACAddress and the ipaddress types all print as their canonical form
+    return str(value)
+
+
+def decode_value(value: Any) -> Any:
+    """Reverse of encode_value, records come back as BrokerRecord"""
+
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        if "__r" in value:
+            return BrokerRecord({k: decode_value(v) for k, v in value["__r"].items()})
+        if "__b" in value:
+            return bytes.fromhex(value["__b"])
+        return {k: decode_value(v) for k, v in value.items()}
+    return value
+
+
+def _send_frame(sock: socket.socket, payload: Dict) -> None:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    sock.sendall(_FRAME_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise EOFError
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> Dict:
+    (size,) = _FRAME_HEADER.unpack(_recv_exact(sock, _FRAME_HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+class _BrokerApi:
+    def __init__(self, client: "BrokerClient"):
+        self._client = client
+
+    def __getattr__(self, funcname: str):
+        if funcname.startswith("_"):
+            raise AttributeError(funcname)
+
+        def call(**kwargs: Any) -> Any:
+            return self._client.call(funcname, **kwargs)
+
+        call.__name__ = funcname
+        return call
+
+
+class BrokerClient:
+    """
+    Connection to a running broker, usable wherever a VPPApiClient is
+
+    API calls go through the api attribute just like on VPPApiClient.
+    """
+
+    def __init__(self, socket_path: str = VPP_BROKER_SOCKET, timeout: float = 30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.api = _BrokerApi(self)
+
+    def connect(self, name: str = None) -> int:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return -1
+        self.sock = sock
+        return 0
+
+    def disconnect(self) -> int:
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        return 0
+
+    def _request(self, request: Dict, funcname: str) -> Any:
+        if not self.sock:
+            raise VPPBrokerError(errno.ENOTCONN, "Not connected to the VPP broker")
+        try:
+            _send_frame(self.sock, request)
+            reply = _recv_frame(self.sock)
+        except (OSError, EOFError, ValueError) as e:
+            self.disconnect()
+            raise VPPBrokerError(errno.EIO, f"VPP broker connection failed: {e}")
+
+        if "error" in reply:
+            if reply.get("missing"):
+                raise AttributeError(funcname)
+            raise VPPBrokerError(errno.EIO, reply["error"])
+        return decode_value(reply["value"])
+
+    def call(self, funcname: str, **kwargs: Any) -> Any:
+        return self._request({"call": funcname, "kwargs": kwargs}, funcname)
+
+    def variants(self) -> Dict[str, str]:
+        """The messages the broker resolved for APIVariants, see resolve_variants"""
+
+        return self._request({"variants": True}, "variants")
+
+    def known(self, funcnames: List[str]) -> List[str]:
+        """The messages of funcnames the VPP session of the broker has"""
+
+        return self._request({"known": funcnames}, "known")
+
+
+def broker_connect(socket_path: str = VPP_BROKER_SOCKET) -> BrokerClient:
+    """
+    Connect to a running broker
+
+    :param socket_path: Unix socket the broker listens on
+    :return: BrokerClient instance, or None when no broker is running
+    """
+
+    if not os.path.exists(socket_path):
+        return None
+    client = BrokerClient(socket_path)
+    if client.connect() != 0:
+        return None
+    return client
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        server.touch(+1)
+        try:
+            while True:
+                try:
+                    request = _recv_frame(self.request)
+                except (EOFError, OSError, ValueError):
+                    return
+                server.touch()
+                _send_frame(self.request, server.dispatch(request))
+        finally:
+            server.touch(-1)
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve API calls for modules from one long-lived VPP session
+
+    Calls from concurrent module runs are serialized, as a VPPApiClient can only
+    have one request in flight. The server stops once it has had no clients
+    for idle_timeout seconds.
+
+    When a call fails the session is checked with a control ping. A session
+    that no longer answers, because VPP restarted, is replaced by a new one
+    from reconnect. When that fails too the server stops, so the next module
+    connects directly or spawns a fresh broker.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        backend: Any,
+        socket_path: str,
+        idle_timeout: float,
+        reconnect: Callable[[], Any] = None,
+    ):
+        self.backend = backend
+        self.reconnect = reconnect
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.call_lock = threading.Lock()
+        self.active = 0
+        self.variants = None
+        self.last_activity = time.monotonic()
+
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o750, exist_ok=True)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _BrokerHandler)
+        os.chmod(socket_path, 0o600)
+
+    def touch(self, delta: int = 0) -> None:
+        with self.lock:
+            self.active += delta
+            self.last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        with self.lock:
+            return (
+                self.active == 0
+                and time.monotonic() - self.last_activity > self.idle_timeout
+            )
+
+    def dispatch(self, request: Dict) -> Dict:
+        if request.get("variants"):
+            if self.variants is None:
+                from .vpp_common import resolve_variants
+
+                with self.call_lock:
+                    self.variants = resolve_variants(self.backend)
+            return {"value": self.variants}
+        if "known" in request:
+            return {
+                "value": [
+                    funcname
+                    for funcname in request["known"]
+                    if hasattr(self.backend.api, funcname)
+                ]
+            }
+
+        funcname = request.get("call", "")
+        try:
+            func = getattr(self.backend.api, funcname)
+        except AttributeError:
+            return {"error": f"Unknown VPP API call {funcname}", "missing": True}
+        try:
+            with self.call_lock:
+                value = func(**request.get("kwargs", {}))
+        except Exception as e:
+            self.check_backend()
+            return {"error": f"{funcname} failed: {e}"}
+        return {"value": encode_value(value)}
+
+    def check_backend(self) -> bool:
+        """
+        Make sure the VPP session still answers, reconnect when it does not
+
+        :return: True when the session is usable, False when the server stops
+        """
+
+        with self.call_lock:
+            try:
+                self.backend.api.control_ping()
+                return True
+            except Exception:
+                pass
+
+            try:
+                self.backend.disconnect()
+            except Exception:
+                pass
+            # Another VPP may have other messages
+            self.variants = None
+            try:
+                if self.reconnect is not None:
+                    self.backend = self.reconnect()
+                    return True
+            except Exception:
+                pass
+
+        # shutdown() waits for serve_forever, which must not block on this call
+        threading.Thread(target=self.shutdown, daemon=True).start()
+        return False
+
+    def serve_until_idle(self) -> None:
+        def watchdog():
+            while not self.idle():
+                time.sleep(min(1.0, self.idle_timeout))
+            self.shutdown()
+
+        threading.Thread(target=watchdog, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                pass
+
+
+def _vpp_backend() -> Any:
+    from .vpp_common import connect
+
+    client = connect(broker=False)
+    if not client:
+        raise VPPBrokerError(errno.ECONNREFUSED, "Could not connect to VPP")
+    return client
+
+
+def _sim_backend() -> Any:
+    from .vpp_sim import SimulatedVPPApiClient
+
+    client = SimulatedVPPApiClient()
+    client.connect("python-ansible-vpp-broker")
+    return client
+
+
+BACKENDS = {"vpp": _vpp_backend, "sim": _sim_backend}
+
+
+def serve(
+    backend: str = "vpp",
+    socket_path: str = VPP_BROKER_SOCKET,
+    idle_timeout: float = VPP_BROKER_IDLE_TIMEOUT,
+) -> None:
+    """
+    Run a broker in the foreground until it has been idle for idle_timeout
+
+    :param backend: vpp for a real VPP session, sim for the simulator
+    :param socket_path: Unix socket to listen on
+    :param idle_timeout: Seconds without clients before shutting down
+    """
+
+    connect = BACKENDS[backend]
+    server = None
+    client = connect()
+    try:
+        server = BrokerServer(client, socket_path, idle_timeout, connect)
+        server.serve_until_idle()
+    finally:
+        (server.backend if server else client).disconnect()
+
+
+def spawn_broker(
+    socket_path: str = VPP_BROKER_SOCKET,
+    idle_timeout: float = VPP_BROKER_IDLE_TIMEOUT,
+    backend: str = "vpp",
+    wait: float = 10,
+) -> bool:
+    """
+    Start a detached broker and wait for it to accept connections
+
+    The broker is forked off the calling process, so it keeps running after the
+    module that started it has exited.
+
+    :return: True if the broker is accepting connections
+    """
+
+    pid = os.fork()
+    if pid == 0:
+        # Double fork so the broker is reparented and never becomes a zombie
+        os.setsid()
+        if os.fork() != 0:
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        try:
+            serve(backend, socket_path, idle_timeout)
+        finally:
+            os._exit(0)
+
+    os.waitpid(pid, 0)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        client = broker_connect(socket_path)
+        if client:
+            client.disconnect()
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Shared VPP API session for modules")
+    parser.add_argument("--socket", default=VPP_BROKER_SOCKET)
+    parser.add_argument("--idle-timeout", type=float, default=VPP_BROKER_IDLE_TIMEOUT)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="vpp")
+    args = parser.parse_args(argv)
+
+    serve(args.backend, args.socket, args.idle_timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
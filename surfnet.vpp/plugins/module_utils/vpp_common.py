@@ -6,40 +6,156 @@ __metaclass__ = type
 
 import os
 import sys
-import fnmatch
-from typing import List, Union, Tuple, Any, Callable, cast, Dict
+import time
+import heapq
+import hashlib
+import ipaddress
+import threading
+from enum import Enum
+from itertools import islice
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, Tuple, Any, Callable, cast, Dict, Iterator
 
 try:
     from vpp_papi import VPPApiClient
 except ImportError:
     VPPApiClient = None
-from .const import VPP_DEFAULT_DIR, VPPErrors, FactFormats
+from .const import (
+    VPP_DEFAULT_DIR,
+    VPP_BROKER_ENV,
+    VPP_BATCH_WINDOW,
+    VPP_CACHE_DIR,
+    FactFormats,
+    APIFamilies,
+    APIVariants,
+    GatherDetails,
+    GatherFamilies,
+)
+from .vpp_api_cache import (
+    find_api_files,
+    cached_definitions,
+    select_api_files,
+    family_set_name,
+    _read_json,
+    _write_json,
+)
+from .vpp_broker import BrokerClient, broker_connect, spawn_broker
+from .vpp_errors import ERRORS
 from ansible.module_utils.errors import AnsibleValidationError
 from ansible.module_utils.six.moves.collections_abc import Iterable
 
 
-def connect(definitions: List = None) -> Union[VPPApiClient, bool]:
+def _load_client(
+    definitions: List = None,
+    cache: bool = True,
+    families: List[str] = None,
+    messages: List[str] = None,
+) -> VPPApiClient:
+    """
+    Create a VPPApiClient for the requested API definitions
+
+    When families are given, only their definition files (plus APIFamilies.BASE)
+    are loaded. If that subset cannot be loaded or lacks any of the messages, the
+    full set of definitions is loaded instead.
+    """
+
+    if definitions:
+        return VPPApiClient(apifiles=definitions)
+
+    all_definitions = find_api_files(VPP_DEFAULT_DIR)
+
+    if families:
+        families = APIFamilies.BASE + list(families)
+        selected = select_api_files(all_definitions, families)
+        if cache:
+            selected = cached_definitions(selected, name=family_set_name(families))
+        try:
+            client = VPPApiClient(apifiles=selected)
+        except (ValueError, RuntimeError):
+            client = None
+        if client and all(msg in client.messages for msg in messages or []):
+            return client
+
+    if cache:
+        all_definitions = cached_definitions(all_definitions)
+
+    return VPPApiClient(apifiles=all_definitions)
+
+
+def _broker_client() -> Union[BrokerClient, None]:
+    """
+    Return a connection to the local broker, if it is in use
+
+    ANSIBLE_VPP_BROKER=off never uses the broker, spawn starts one when none is
+    running and auto (the default) only uses an already running broker.
+    """
+
+    mode = os.environ.get(VPP_BROKER_ENV, "auto")
+    if mode == "off":
+        return None
+
+    client = broker_connect()
+    if client is None and mode == "spawn" and spawn_broker():
+        client = broker_connect()
+    return client
+
+
+def connect(
+    definitions: List = None,
+    cache: bool = True,
+    families: List[str] = None,
+    messages: List[str] = None,
+    broker: bool = True,
+    name: str = "python-ansible-vpp",
+) -> Union[VPPApiClient, BrokerClient, bool]:
     """
     Connect to the VPP API
 
     :param definitions: List of API definitions
-    :return: VPPApiClient instance
+    :param cache: Load the default definitions from the on-disk cache
+    :param families: Only load these API families (see APIFamilies)
+    :param messages: Messages that have to be available when loading families
+    :param broker: Use the session of a local broker when one is available
+    :param name: Client name to register with VPP
+    :return: VPPApiClient instance, or BrokerClient when going through the broker
     :rtype: VPPApiClient
     """
-    if not definitions:
-        definitions = []
-        for root, dirnames, filenames in os.walk(VPP_DEFAULT_DIR):
-            for filename in fnmatch.filter(filenames, "*.api.json"):
-                definitions.append(os.path.join(root, filename))
 
-    client = VPPApiClient(apifiles=definitions)
-    r = client.connect("python-ansible-vpp")
+    if broker and not definitions:
+        client = _broker_client()
+        if client:
+            return client
+
+    client = _load_client(
+        definitions=definitions, cache=cache, families=families, messages=messages
+    )
+    r = client.connect(name)
     if r == 0:
         return client
     else:
         return False
 
 
+def gather_families(dumps: List[str]) -> List[str]:
+    """
+    Find the API families needed to call a list of dump messages
+
+    :param dumps: Dump messages from GatherDetails
+    :return: List of API families, see GatherFamilies
+    """
+
+    wanted = set(dumps)
+    families = []
+    for group, group_families in vars(GatherFamilies).items():
+        if group.startswith("_"):
+            continue
+        if wanted.intersection(getattr(GatherDetails, group, [])):
+            families.extend(f for f in group_families if f not in families)
+
+    return families
+
+
 def disconnect(connection: VPPApiClient) -> int:
     """
     Disconnect from the VPP Api
@@ -74,15 +190,152 @@ def get_version(connection: VPPApiClient) -> Tuple[int, int, bool]:
     return yy, mm, plus
 
 
+VPP_VARIANT_CACHE = os.path.join(VPP_CACHE_DIR, "api_variants.json")
+# Builds kept in the variant cache, the oldest is dropped first
+VARIANT_CACHE_BUILDS = 8
+
+
+def api_build(connection: VPPApiClient) -> Union[str, None]:
+    """
+    Identify the VPP build by the message table it registered the client with
+
+    The table lists every message VPP knows with its CRC, so any change to the
+    API (an upgrade, a point release, another set of plugins) changes it. It is
+    sent when the client connects, so this costs no round trip.
+
+    :param connection: VPPApiClient instance that holds an active connection
+    :return: Hex digest of the message table, None when the client has none
+    """
+
+    table = getattr(getattr(connection, "transport", None), "message_table", None)
+    if not table:
+        return None
+    return hashlib.sha1("\n".join(sorted(table)).encode()).hexdigest()[:16]
+
+
+def _probe_variants(connection: VPPApiClient) -> Dict[str, str]:
+    # vpp_papi only binds the messages VPP has with a matching CRC to api
+    variants = {}
+    for operation, candidates in APIVariants.items():
+        for candidate in candidates:
+            if hasattr(connection.api, candidate):
+                variants[operation] = candidate
+                break
+    return variants
+
+
+def known_messages(
+    connection: Union[VPPApiClient, BrokerClient], funcnames: List[str]
+) -> List[str]:
+    """
+    The messages of funcnames VPP and the loaded definitions both have
+
+    :param connection: Reference to the connection
+    :param funcnames: Messages to look for
+    :return: The messages found, in the order given
+    """
+
+    if isinstance(connection, BrokerClient):
+        try:
+            return connection.known(funcnames)
+        except AttributeError:
+            # A broker from before it could tell, calls fail as before
+            return list(funcnames)
+    # vpp_papi only binds the messages VPP has with a matching CRC to api
+    return [funcname for funcname in funcnames if hasattr(connection.api, funcname)]
+
+
+def resolve_variants(
+    connection: Union[VPPApiClient, BrokerClient],
+    cache_path: str = VPP_VARIANT_CACHE,
+) -> Dict[str, str]:
+    """
+    Pick the message to use for each operation in APIVariants
+
+    The best variant that VPP and the loaded definitions both have is used.
+    The choice is cached on disk per VPP build (see api_build). Through the
+    broker, the broker resolves them for its own session.
+
+    :param connection: Reference to the connection
+    :param cache_path: File the choices are cached in
+    :return: Message name per operation. Operations that have no variant
+             available map to their oldest variant, calling it fails as
+             before.
+    """
+
+    fallback = {operation: names[-1] for operation, names in APIVariants.items()}
+
+    if isinstance(connection, BrokerClient):
+        try:
+            return dict(fallback, **connection.variants())
+        except AttributeError:
+            # A broker from before it could resolve them
+            v2 = get_version(connection)[0] > 22
+            return {
+                operation: names[0] if v2 else names[-1]
+                for operation, names in APIVariants.items()
+            }
+
+    build = api_build(connection)
+    cache = _read_json(cache_path) if build else None
+    if not isinstance(cache, dict):
+        cache = {}
+    variants = cache.get(build)
+    if variants is None or set(variants) != set(APIVariants):
+        variants = _probe_variants(connection)
+        if build and set(variants) == set(APIVariants):
+            cache.pop(build, None)
+            cache[build] = variants
+            while len(cache) > VARIANT_CACHE_BUILDS:
+                cache.pop(next(iter(cache)))
+            try:
+                os.makedirs(os.path.dirname(cache_path), mode=0o755, exist_ok=True)
+                _write_json(cache_path, cache)
+            except OSError:
+                pass
+
+    return dict(fallback, **variants)
+
+
+def state_fingerprint(connection: VPPApiClient) -> str:
+    """
+    Cheap summary of VPP state, used to tell if cached facts are still valid
+
+    Built from the VPP process id (a restart changes everything) and the number
+    and highest index of interfaces and bridge domains, plus the number of
+    bridge domain members. It does not see changes that keep those the same,
+    such as a changed tag, which is what the TTL of a cache is for.
+
+    :param connection: VPPApiClient instance that holds an active connection
+    :return: Hex digest of the state summary
+    """
+
+    pid = connection.api.control_ping().vpe_pid
+    interfaces = connection.api.sw_interface_dump()
+    bds = connection.api.bridge_domain_dump()
+
+    summary = [
+        pid,
+        len(interfaces),
+        max((intf.sw_if_index for intf in interfaces), default=-1),
+        len(bds),
+        max((bd.bd_id for bd in bds), default=-1),
+        sum(bd.n_sw_ifs for bd in bds),
+    ]
+    return hashlib.sha1(":".join(str(v) for v in summary).encode()).hexdigest()[:16]
+
+
 def get_error(errno: int) -> Tuple[str, int, str]:
     """Turn an errorcode into something a human can deal with
+    Unknown codes, e.g. of a newer VPP than vpp_errors was generated from, get
+    a generic description.
     :param errno: integer for the error
     :return: Tuple consisting of: Programmatic name, error id, human readable text
     """
 
-    err = next(err for err in VPPErrors.ERRORS if errno in err)
+    name, text = ERRORS.get(errno, ("UNKNOWN", f"Unknown error {errno}"))
 
-    return err[0], err[1], err[2]
+    return name, errno, text
 
 
 def to_vpp(connection: VPPApiClient, funcname: str, *args: Any, **kwargs: Any) -> Dict:
@@ -122,6 +375,612 @@ def to_vpp(connection: VPPApiClient, funcname: str, *args: Any, **kwargs: Any) -
     return reply
 
 
+def stream_dump(connection: VPPApiClient, funcname: str, **kwargs: Any) -> Iterator:
+    """
+    Yield the records of a dump one at a time, as VPP sends them
+
+    A regular call collects every record of a dump in a list before returning
+    it. This reads and decodes them one by one instead, so a dump of millions of
+    routes never has to fit in memory at once. Clients that cannot stream (the
+    broker, the simulator) return the whole dump, which is then iterated.
+
+    :param connection: VPPApiClient instance that holds an active connection
+    :param funcname: Dump message to send
+    :param kwargs: Arguments of the dump message
+    """
+
+    if not hasattr(connection, "read_blocking"):
+        yield from getattr(connection.api, funcname)(**kwargs)
+        return
+
+    try:
+        msg = connection.messages[funcname]
+        service = connection.services[funcname]
+    except KeyError:
+        raise AttributeError(funcname)
+    index = connection.transport.get_msg_index(f"{funcname}_{msg.crc[2:]}")
+    if index <= 0:
+        raise AttributeError(funcname)
+    # Older dumps have no reply of their own, a control ping marks their end
+    done = service["reply"] if "stream_msg" in service else "control_ping_reply"
+
+    connection.transport.suspend()
+    try:
+        context = connection._call_vpp_async(index, msg, **kwargs)
+        if done == "control_ping_reply":
+            connection._control_ping(context)
+        while True:
+            record = connection.read_blocking()
+            if record is None:
+                raise IOError(f"VPP API client: read failed during {funcname}")
+            if getattr(record, "context", 0) != context:
+                connection.message_queue.put_nowait(record)
+                continue
+            if type(record).__name__ == done:
+                return
+            yield record
+    finally:
+        connection.transport.resume()
+
+
+def record_to_dict(value: Any) -> Any:
+    """
+    Turn a decoded VPP message into plain JSON types
+
+    Fields are kept by name, without the message id and context. Enums and
+    flags become integers, bytes a hex string and addresses, prefixes and MAC
+    addresses their canonical string form.
+    """
+
+    if value is None or isinstance(value, (bool, str, float)):
+        return value
+    if isinstance(value, Enum):
+        return int(value.value)
+    if isinstance(value, int):
+        return int(value)
+    if hasattr(value, "_asdict"):
+        return {
+            k: record_to_dict(v)
+            for k, v in value._asdict().items()
+            if k not in ("_0", "context")
+        }
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    if isinstance(value, dict):
+        return {k: record_to_dict(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [record_to_dict(v) for v in value]
+    return str(value)
+
+
+def field_tree(fields: List[str]) -> Dict:
+    """
+    Turn a list of field paths into a tree of selected fields
+
+    ["sw_if_index", "route.prefix", "route.paths.sw_if_index"] becomes
+    {"sw_if_index": None, "route": {"prefix": None, "paths": {"sw_if_index": None}}},
+    where None selects the whole field.
+    """
+
+    tree = {}
+    for path in fields:
+        node = tree
+        *parents, leaf = path.split(".")
+        for part in parents:
+            if part in node and node[part] is None:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+def project_record(value: Any, tree: Union[Dict, None]) -> Any:
+    """
+    Keep the selected fields of a record, see field_tree
+
+    This is the fallback for records without a generated converter, selected
+    fields are converted with record_to_dict.
+    """
+
+    if tree is None:
+        return record_to_dict(value)
+    if isinstance(value, list):
+        return [project_record(v, tree) for v in value]
+    return {
+        name: project_record(getattr(value, name, None), sub)
+        for name, sub in tree.items()
+    }
+
+
+def dump_records(reply: Any) -> Any:
+    """The records of a dump reply, newer dumps reply with (reply, details)"""
+
+    if isinstance(reply, tuple) and not hasattr(reply, "_fields") and len(reply) == 2:
+        return reply[1]
+    return reply
+
+
+def _sortable(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return int(value.value)
+    if isinstance(value, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        return value.version, int(value.network_address), value.prefixlen
+    if isinstance(value, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        return value.version, int(value), 0
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def sort_key(path: str) -> Callable[[Any], Any]:
+    """
+    Key function sorting records on a field, nested fields given by their path
+
+    Addresses and prefixes sort numerically, IPv4 before IPv6.
+    """
+
+    names = path.split(".")
+
+    def key(record: Any) -> Any:
+        for name in names:
+            record = getattr(record, name)
+        return _sortable(record)
+
+    return key
+
+
+def select_records(
+    records: List, sort: List[str] = None, limit: int = None, offset: int = 0
+) -> List:
+    """
+    Order records and take a page of them
+
+    When only a page is needed, the records are ordered with a bounded heap
+    instead of a full sort. The records themselves are never copied.
+
+    :param records: Records of a dump
+    :param sort: Fields to sort on, the first one first. A field prefixed
+                 with - sorts in descending order.
+    :param limit: Number of records to return, all when None
+    :param offset: Number of records to skip
+    :return: The selected records
+    :raises AttributeError: When a record lacks a sort field
+    """
+
+    end = None if limit is None else offset + limit
+    if not sort:
+        return list(islice(records, offset, end))
+
+    keys = [(sort_key(field.lstrip("-")), field.startswith("-")) for field in sort]
+    descending = {reverse for key, reverse in keys}
+
+    if len(descending) == 1:
+        reverse = descending.pop()
+        funcs = [key for key, _ in keys]
+        key = funcs[0] if len(funcs) == 1 else lambda r: tuple(f(r) for f in funcs)
+        if end is not None and end < len(records):
+            pick = heapq.nlargest if reverse else heapq.nsmallest
+            return pick(end, records, key=key)[offset:]
+        return sorted(records, key=key, reverse=reverse)[offset:end]
+
+    # Mixed directions, sort on the least significant field first
+    ordered = list(records)
+    for key, reverse in reversed(keys):
+        ordered.sort(key=key, reverse=reverse)
+    return ordered[offset:end]
+
+
+def to_vpp_concurrent(
+    funcnames: List[str], concurrency: int, **connect_args: Any
+) -> Dict[str, Dict]:
+    """
+    Send argument-less calls (e.g. dumps) to VPP over several connections at once
+
+    Every worker thread gets its own API client, as a VPPApiClient only handles
+    one request at a time. Replies are the same as to_vpp would return.
+
+    :param funcnames: Calls to send
+    :param concurrency: Maximum number of connections (and calls in flight)
+    :param connect_args: Arguments passed on to connect() for each connection
+    :return: Reply per call, in the order of funcnames
+    """
+
+    local = threading.local()
+    lock = threading.Lock()
+    connections = []
+
+    def call(funcname: str) -> Dict:
+        if not hasattr(local, "conn"):
+            with lock:
+                worker = len(connections)
+                connections.append(None)
+            local.conn = connect(
+                broker=False, name=f"python-ansible-vpp-{worker}", **connect_args
+            )
+            if not local.conn:
+                raise IOError(f"Could not open VPP connection {worker}")
+            with lock:
+                connections[worker] = local.conn
+        return to_vpp(local.conn, funcname)
+
+    workers = max(1, min(concurrency, len(funcnames)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            replies = list(pool.map(call, funcnames))
+    finally:
+        for conn in connections:
+            if conn:
+                disconnect(conn)
+
+    return dict(zip(funcnames, replies))
+
+
+# Outcome of one call of a batch, error is the text of a non-zero retval
+BatchResult = namedtuple(
+    "BatchResult", ["funcname", "kwargs", "retval", "error", "reply"]
+)
+
+
+class BatchExecutor:
+    """
+    Send many API calls pipelined and collect their replies
+
+    Calls are queued with add and sent by run. Up to window requests, each with
+    its own context, are on the wire at any time; replies are matched to their
+    call by context as they arrive. Only calls with a single reply can be
+    batched, not dumps. Clients that cannot pipeline (the broker, the
+    simulator) run the calls one by one.
+    """
+
+    def __init__(self, connection: VPPApiClient, window: int = VPP_BATCH_WINDOW):
+        """
+        :param connection: VPPApiClient instance that holds an active connection
+        :param window: Maximum number of requests awaiting their reply
+        """
+
+        self.connection = connection
+        self.window = max(1, window)
+        self._calls = []
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def add(self, funcname: str, **kwargs: Any) -> int:
+        """Queue a call, returns its position in the results"""
+
+        self._calls.append((funcname, kwargs))
+        return len(self._calls) - 1
+
+    @staticmethod
+    def _result(funcname: str, kwargs: Dict, reply: Any) -> BatchResult:
+        retval = getattr(reply, "retval", 0)
+        error = None
+        if retval != 0:
+            name, errid, error = get_error(retval)
+        return BatchResult(funcname, kwargs, retval, error, reply)
+
+    def _run_serial(self, received: Callable) -> List[BatchResult]:
+        results = []
+        for position, (funcname, kwargs) in enumerate(self._calls):
+            reply = getattr(self.connection.api, funcname)(**kwargs)
+            results.append(self._result(funcname, kwargs, reply))
+            if received:
+                received(position, results[-1])
+        return results
+
+    def _run_pipelined(self, received: Callable) -> List[BatchResult]:
+        connection = self.connection
+        messages = {}
+        for funcname, _ in self._calls:
+            if funcname in messages:
+                continue
+            try:
+                msg = connection.messages[funcname]
+                service = connection.services[funcname]
+            except KeyError:
+                raise AttributeError(funcname)
+            if "stream" in service or "stream_msg" in service:
+                raise ValueError(f"{funcname} is a dump, it cannot be batched")
+            index = connection.transport.get_msg_index(f"{funcname}_{msg.crc[2:]}")
+            if index <= 0:
+                raise AttributeError(funcname)
+            messages[funcname] = (index, msg)
+
+        results = [None] * len(self._calls)
+        pending = {}
+        queue = deque(enumerate(self._calls))
+        connection.transport.suspend()
+        try:
+            while queue or pending:
+                while queue and len(pending) < self.window:
+                    position, (funcname, kwargs) = queue.popleft()
+                    context = connection._call_vpp_async(*messages[funcname], **kwargs)
+                    pending[context] = position
+                reply = connection.read_blocking()
+                if reply is None:
+                    raise IOError("VPP API client: read failed during a batch")
+                position = pending.pop(getattr(reply, "context", 0), None)
+                if position is None:
+                    # An event or a reply to someone else, not ours to handle
+                    connection.message_queue.put_nowait(reply)
+                    continue
+                funcname, kwargs = self._calls[position]
+                results[position] = self._result(funcname, kwargs, reply)
+                if received:
+                    received(position, results[position])
+        finally:
+            connection.transport.resume()
+        return results
+
+    def run(self, received: Callable[[int, BatchResult], None] = None) -> Dict:
+        """
+        Send all queued calls and empty the queue
+
+        :param received: Called with the position and the BatchResult of every
+                         call as its reply arrives, so the replies before a
+                         lost connection are not lost as well
+        :return: The results, a BatchResult per call in the order they were
+                 added, the number of calls that failed, the elapsed seconds
+                 and the calls per second
+        :raises AttributeError: When a call is not known to this VPP
+        :raises ValueError: When a call is a dump
+        :raises IOError: When the connection fails during the batch
+        """
+
+        start = time.monotonic()
+        if hasattr(self.connection, "read_blocking"):
+            results = self._run_pipelined(received)
+        else:
+            results = self._run_serial(received)
+        self._calls = []
+        elapsed = time.monotonic() - start
+        return {
+            "results": results,
+            "failed": sum(1 for result in results if result.retval != 0),
+            "elapsed": elapsed,
+            "rate": len(results) / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class DeferredWrites:
+    """
+    The creates and deletes of a list of items, sent as one pipelined batch
+
+    Items are reconciled one by one against a snapshot, their writes are
+    queued with add and sent by flush, which hands every reply to the callback
+    that fills in the result of its item. A queued write is not in the
+    snapshot yet, so the objects it touches are remembered: an item that
+    refers to one of them has to flush the queue first, see touches.
+    """
+
+    def __init__(self, connection: VPPApiClient, window: int = VPP_BATCH_WINDOW):
+        """
+        :param connection: VPPApiClient instance that holds an active connection
+        :param window: Maximum number of requests awaiting their reply
+        """
+
+        self.batch = BatchExecutor(connection, window)
+        self._outcomes = []
+        self._keys = set()
+
+    def add(
+        self,
+        funcname: str,
+        kwargs: Dict,
+        outcome: Callable[[Any], Any],
+        keys: List = (),
+    ) -> None:
+        """
+        Queue a write
+
+        :param outcome: Called with the reply of VPP once the write was sent
+        :param keys: Ids of the objects the write touches, None is ignored
+        """
+
+        self.batch.add(funcname, **kwargs)
+        self._outcomes.append(outcome)
+        self._keys.update(key for key in keys if key is not None)
+
+    def touches(self, keys: List) -> bool:
+        """Whether a queued write touches one of these objects"""
+
+        return not self._keys.isdisjoint(keys)
+
+    def flush(self) -> None:
+        """Send the queued writes and hand their replies to their callbacks"""
+
+        outcomes = self._outcomes
+        self._outcomes = []
+        self._keys = set()
+        if not outcomes:
+            return
+        for outcome, result in zip(outcomes, self.batch.run()["results"]):
+            outcome(result.reply)
+
+
+class VPPSnapshot:
+    """
+    Indexed view of VPP state, fetched with one dump per table
+
+    Tables are dumped on first use and indexed by their key and by a few
+    secondary fields, so every lookup is a dict access. After a write, only
+    the tables (or single records) it touched are fetched again, and only when
+    they are read next.
+    """
+
+    # table: (dump message, key field, {index name: field})
+    TABLES = {
+        "interfaces": (
+            "sw_interface_dump",
+            "sw_if_index",
+            {"name": "interface_name", "tag": "tag"},
+        ),
+        "vhost_user": (
+            "sw_interface_vhost_user_dump",
+            "sw_if_index",
+            {"sock": "sock_filename"},
+        ),
+        "bridge_domains": ("bridge_domain_dump", "bd_id", {"tag": "bd_tag"}),
+        "bonds": ("sw_bond_interface_dump", "sw_if_index", {"name": "interface_name"}),
+    }
+
+    def __init__(self, connection: VPPApiClient, tables: List[str] = ()):
+        """
+        :param connection: VPPApiClient instance that holds an active connection
+        :param tables: Tables to fetch right away, others are fetched on first use
+        """
+
+        self.connection = connection
+        self._records = {}
+        self._indexes = {}
+        self._stale = {}
+        self._members = {}
+        for table in tables:
+            self.refresh(table)
+
+    def _table(self, table: str) -> Dict:
+        if table not in self._records:
+            self.refresh(table)
+        elif self._stale[table]:
+            for key in list(self._stale[table]):
+                self._fetch_record(table, key)
+        return self._records[table]
+
+    def _index(self, table: str, record: Any) -> None:
+        key = getattr(record, self.TABLES[table][1])
+        self._records[table][key] = record
+        for index, field in self.TABLES[table][2].items():
+            value = getattr(record, field, None)
+            if value:
+                self._indexes[table][index].setdefault(value, {})[key] = None
+        if table == "bridge_domains":
+            for member in getattr(record, "sw_if_details", []):
+                self._members[member.sw_if_index] = (key, member.shg)
+
+    def _unindex(self, table: str, key: Any) -> None:
+        record = self._records[table].pop(key, None)
+        if record is None:
+            return
+        for index, field in self.TABLES[table][2].items():
+            keys = self._indexes[table][index].get(getattr(record, field, None))
+            if keys is not None:
+                keys.pop(key, None)
+        if table == "bridge_domains":
+            for member in getattr(record, "sw_if_details", []):
+                if self._members.get(member.sw_if_index, (None,))[0] == key:
+                    del self._members[member.sw_if_index]
+
+    def _fetch_record(self, table: str, key: Any) -> None:
+        dump, key_field, indexes = self.TABLES[table]
+        self._stale[table].discard(key)
+        self._unindex(table, key)
+        for record in getattr(self.connection.api, dump)(**{key_field: key}):
+            if getattr(record, key_field) == key:
+                self._index(table, record)
+
+    def refresh(self, *tables: str) -> None:
+        """Dump the given tables again, or all loaded tables when none are given"""
+
+        for table in tables or list(self._records):
+            dump, key_field, indexes = self.TABLES[table]
+            self._records[table] = {}
+            self._indexes[table] = {index: {} for index in indexes}
+            self._stale[table] = set()
+            if table == "bridge_domains":
+                self._members = {}
+            for record in getattr(self.connection.api, dump)():
+                self._index(table, record)
+
+    def touch(self, table: str, key: Any = None) -> None:
+        """
+        Mark state as changed by a write
+
+        With a key, only that record is fetched again on the next read of the
+        table, otherwise the whole table is dumped again.
+        """
+
+        if table not in self._records:
+            return
+        if key is None:
+            del self._records[table]
+        else:
+            self._stale[table].add(key)
+
+    def put(self, table: str, record: Any) -> None:
+        """Store a record whose state is known from a write reply"""
+
+        self._table(table)
+        self._unindex(table, getattr(record, self.TABLES[table][1]))
+        self._index(table, record)
+
+    def discard(self, table: str, key: Any) -> None:
+        """Forget a record that a write removed"""
+
+        self._table(table)
+        self._unindex(table, key)
+
+    def records(self, table: str) -> List:
+        """All records of a table, in dump order"""
+
+        return list(self._table(table).values())
+
+    def get(self, table: str, key: Any) -> Union[Any, None]:
+        """Look up a record by its key (sw_if_index or bd_id)"""
+
+        if table not in self._records:
+            self.refresh(table)
+        elif key in self._stale[table]:
+            self._fetch_record(table, key)
+        return self._records[table].get(key)
+
+    def find(self, table: str, index: str, value: Any) -> List:
+        """All records of a table whose indexed field equals value"""
+
+        records = self._table(table)
+        return [records[key] for key in self._indexes[table][index].get(value, {})]
+
+    def find_one(self, table: str, index: str, value: Any) -> Union[Any, None]:
+        """The first record whose indexed field equals value, or None"""
+
+        found = self.find(table, index, value)
+        return found[0] if found else None
+
+    def interface(self, sw_if_index: int) -> Union[Any, None]:
+        return self.get("interfaces", sw_if_index)
+
+    def interface_by_name(self, name: str) -> Union[Any, None]:
+        return self.find_one("interfaces", "name", name)
+
+    def interfaces_by_tag(self, tag: str) -> List:
+        return self.find("interfaces", "tag", tag)
+
+    def vhost_user(
+        self, sw_if_index: int = None, sock_filename: str = None
+    ) -> Union[Any, None]:
+        if sw_if_index is not None:
+            return self.get("vhost_user", sw_if_index)
+        return self.find_one("vhost_user", "sock", sock_filename)
+
+    def bridge_domain(self, bd_id: int) -> Union[Any, None]:
+        return self.get("bridge_domains", bd_id)
+
+    def bridge_domains_by_tag(self, tag: str) -> List:
+        return self.find("bridge_domains", "tag", tag)
+
+    def bridge_domain_of(self, sw_if_index: int) -> Union[Tuple[int, int], None]:
+        """Return (bd_id, shg) of the bridge domain an interface is in, or None"""
+
+        self._table("bridge_domains")
+        return self._members.get(sw_if_index)
+
+    def bond(self, sw_if_index: int) -> Union[Any, None]:
+        return self.get("bonds", sw_if_index)
+
+    def bond_by_name(self, name: str) -> Union[Any, None]:
+        return self.find_one("bonds", "name", name)
+
+
 def get_vhost_if(
     connection: VPPApiClient, sock_filename: str = None, if_idx: int = None
 ) -> Union[None, Any]:
@@ -133,26 +992,19 @@ def get_vhost_if(
     :return: The fetched object or None if not found
     """
 
-    vhost_table = connection.api.sw_interface_vhost_user_dump()
-    vhost_if = None
-
-    try:
-        if sock_filename:
-            vhost_if = next(
-                intf for intf in vhost_table if intf.sock_filename == sock_filename
-            )
-        elif if_idx:
-            vhost_if = next(intf for intf in vhost_table if intf.sw_if_index == if_idx)
-        return vhost_if
-    except StopIteration:
-        return None
+    snapshot = VPPSnapshot(connection)
+    if sock_filename:
+        return snapshot.vhost_user(sock_filename=sock_filename)
+    elif if_idx:
+        return snapshot.vhost_user(sw_if_index=if_idx)
+    return None
 
 
-def add_tag_to_interface(connection: VPPApiClient.api, interface_id, value):
+def add_tag_to_interface(connection: Any, interface_id, value):
     """
     Add administrative tag to interface
 
-    :param connection: Reference to connection
+    :param connection: The api attribute of a connected VPPApiClient
     :param interface_id: Interface ID to tag
     :param value: Value of tag to set
     :return: True if success, False if not
@@ -207,8 +1059,27 @@ def todict(obj, limit=sys.getrecursionlimit(), classkey=None):
         return obj
 
 
-def format_fact(fact, fact_type):
-    """Formats a fact into a desired format"""
+def format_fact(fact, fact_type, serializers=None, fields=None):
+    """
+    Formats a fact into a desired format
+
+    :param fact: Reply of a call to VPP
+    :param fact_type: The call, e.g. sw_interface_dump
+    :param serializers: MessageSerializers to convert dumps not in FactFormats
+    :param fields: Only keep these fields (see field_tree), in their native type
+    """
+
+    fact = dump_records(fact)
+
+    if fields:
+        records = fact if isinstance(fact, list) else [fact]
+        convert = serializers.for_dump(fact_type, fields) if serializers else None
+        if convert:
+            try:
+                return convert(records)
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return project_record(records, field_tree(fields))
 
     if fact_type in FactFormats.keys():
         if isinstance(fact, Iterable):
@@ -225,5 +1096,12 @@ def format_fact(fact, fact_type):
             for fact_detail in FactFormats.get(fact_type):
                 reply.update({fact_detail: str(getattr(fact, fact_detail))})
         return reply
-    else:
-        return todict(fact)
+
+    convert = serializers.for_dump(fact_type) if serializers else None
+    if convert and isinstance(fact, list):
+        try:
+            return convert(fact)
+        except (AttributeError, TypeError, ValueError):
+            # Records that do not match their definition
+            return [record_to_dict(record) for record in fact]
+    return todict(fact)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+from .const import VPP_CACHE_DIR
+
+VPP_DELTA_STORE = os.path.join(VPP_CACHE_DIR, "vpp_facts_delta.json")
+STORE_VERSION = 1
+
+# Fields that identify a record of a dump, nested fields by their path. Dumps
+# that are not listed are keyed by the hash of the whole record, so a changed
+# record shows up as removed and added.
+KEY_FIELDS = {
+    "sw_interface_dump": ("sw_if_index",),
+    "sw_interface_vhost_user_dump": ("sw_if_index",),
+    "sw_bond_interface_dump": ("sw_if_index",),
+    "sw_interface_tap_v2_dump": ("sw_if_index",),
+    "sw_interface_virtio_pci_dump": ("sw_if_index",),
+    "bridge_domain_dump": ("bd_id",),
+    "ip_table_dump": ("table.table_id", "table.is_ip6"),
+    "ip_route_dump": ("route.table_id", "route.prefix"),
+    "ip_route_v2_dump": ("route.table_id", "route.prefix"),
+    "ip_mroute_dump": ("route.table_id", "route.prefix"),
+    "mpls_table_dump": ("mt_table.mt_table_id",),
+    "mpls_route_dump": ("mr_route.mr_table_id", "mr_route.mr_label"),
+    "ip_address_dump": ("sw_if_index", "prefix"),
+}
+
+
+def _digest(value: Any) -> str:
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+def options_digest(options: Dict) -> str:
+    """Digest of the module options that change the records of a run"""
+
+    return _digest(options)
+
+
+def _lookup(record: Dict, path: str) -> Any:
+    for name in path.split("."):
+        record = record[name]
+    return record
+
+
+def record_key(dump: str, record: Any) -> str:
+    """
+    The key of a formatted record: its key fields as a JSON list
+
+    Falls back to # and the digest of the whole record when the dump has no
+    key fields, or when they were not gathered (see the fields option).
+    """
+
+    try:
+        values = [_lookup(record, path) for path in KEY_FIELDS[dump]]
+    except (KeyError, TypeError):
+        return "#" + _digest(record)
+    return json.dumps(values, separators=(",", ":"), default=str)
+
+
+def key_fields(dump: str, key: str) -> Dict:
+    """Turn a key back into the fields it is made of"""
+
+    if key.startswith("#"):
+        return {"digest": key[1:]}
+    return dict(zip(KEY_FIELDS[dump], json.loads(key)))
+
+
+def load_store(path: str) -> Dict:
+    """The fingerprint store of the previous run, empty when there is none"""
+
+    try:
+        with open(path) as fh:
+            store = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(store, dict) or store.get("version") != STORE_VERSION:
+        return {}
+    return store
+
+
+def save_store(path: str, store: Dict) -> None:
+    """Write the store next to its final path and move it in place"""
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w") as fh:
+        json.dump(dict(store, version=STORE_VERSION), fh, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def resync_reason(store: Dict, vpe_pid: int, options: str) -> str:
+    """Why the store cannot be used as base for a delta, empty when it can"""
+
+    if not store:
+        return "no previous run"
+    if store.get("vpe_pid") != vpe_pid:
+        return "VPP restarted"
+    if store.get("options") != options:
+        return "gather options changed"
+    return ""
+
+
+def delta(dump: str, records: List, previous: Dict) -> Tuple[Dict, Dict]:
+    """
+    Compare the formatted records of a dump to their fingerprints of last run
+
+    :param dump: The dump, to find the key fields with
+    :param records: Formatted records (see format_fact)
+    :param previous: Fingerprint per key of the previous run, None when the
+                     dump was not gathered then
+    :return: The delta (added, changed and removed records, the latter by their
+             key) and the fingerprints to store for the next run
+    """
+
+    fingerprints = {}
+    added = []
+    changed = []
+    for record in records if isinstance(records, list) else [records]:
+        key = record_key(dump, record)
+        fingerprint = _digest(record)
+        fingerprints[key] = fingerprint
+        if previous is None or key not in previous:
+            added.append(record)
+        elif previous[key] != fingerprint:
+            changed.append(record)
+
+    removed = [
+        key_fields(dump, key) for key in previous or {} if key not in fingerprints
+    ]
+
+    return dict(added=added, changed=changed, removed=removed), fingerprints
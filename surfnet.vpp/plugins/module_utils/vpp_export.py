@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import json
+import ipaddress
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from .vpp_common import (
+    stream_dump,
+    record_to_dict,
+    project_record,
+    field_tree,
+    known_messages,
+)
+
+# How to split a dump into pages, one per table:
+# tables_dump lists the tables, table_field holds the table in its details,
+# route_field holds the route in the details of the dump itself.
+ExportPages = namedtuple(
+    "ExportPages", ["tables_dump", "table_field", "route_field", "label"]
+)
+
+
+def _ip_table_label(table: Any) -> str:
+    return f"ip{6 if table.is_ip6 else 4}-{table.table_id}"
+
+
+def _mpls_table_label(table: Any) -> str:
+    return f"mpls-{table.mt_table_id}"
+
+
+PAGINATED = {
+    "ip_route_dump": ExportPages("ip_table_dump", "table", "route", _ip_table_label),
+    "ip_route_v2_dump": ExportPages("ip_table_dump", "table", "route", _ip_table_label),
+    "ip_mroute_dump": ExportPages("ip_mtable_dump", "table", "route", _ip_table_label),
+    "mpls_route_dump": ExportPages(
+        "mpls_table_dump", "mt_table", "mr_route", _mpls_table_label
+    ),
+}
+
+# Dumps whose routes can be split further by prefix range
+PREFIX_RANGES = ("ip_route_dump", "ip_route_v2_dump")
+
+
+def _page(export_dir: str, dump: str, table: str = None, prefix=None) -> Dict:
+    parts = [dump] + [str(p).replace("/", "_") for p in (table, prefix) if p]
+    return {
+        "dump": dump,
+        "table": table,
+        "prefix": str(prefix) if prefix else None,
+        "path": os.path.join(export_dir, ".".join(parts) + ".jsonl"),
+        "count": 0,
+    }
+
+
+def _in_range(prefix: Any, network: Any) -> bool:
+    return prefix.version == network.version and prefix.subnet_of(network)
+
+
+def _write_pages(
+    records: Iterable,
+    pages: List[Dict],
+    route_field: str = None,
+    convert: Callable = record_to_dict,
+) -> None:
+    """
+    Write records to the JSON-lines files of pages, in a single pass
+
+    A page with a prefix only gets the routes that fall within that prefix.
+    Every file is written next to its final path and moved in place when
+    complete, so a reader never sees a partial export.
+    """
+
+    handles = [open(page["path"] + ".tmp", "w") for page in pages]
+    try:
+        for record in records:
+            line = None
+            for page, fh in zip(pages, handles):
+                if page["prefix"] and not _in_range(
+                    getattr(record, route_field).prefix, page["range"]
+                ):
+                    continue
+                if line is None:
+                    line = json.dumps(convert(record), separators=(",", ":"))
+                fh.write(line + "\n")
+                page["count"] += 1
+    except BaseException:
+        for page, fh in zip(pages, handles):
+            fh.close()
+            os.unlink(page["path"] + ".tmp")
+        raise
+
+    for page, fh in zip(pages, handles):
+        fh.close()
+        os.replace(page["path"] + ".tmp", page["path"])
+        page.pop("range", None)
+
+
+def _stream(connection: Any, dump: str, where: Tuple = None, **kwargs: Any):
+    if where is None:
+        return stream_dump(connection, dump, **kwargs)
+    matches, arguments = where
+    return filter(matches, stream_dump(connection, dump, **arguments, **kwargs))
+
+
+def export_dump(
+    connection: Any,
+    dump: str,
+    export_dir: str,
+    prefixes: List[str] = None,
+    serializers: Any = None,
+    fields: List[str] = None,
+    where: Tuple[Callable, Dict] = None,
+) -> List[Dict]:
+    """
+    Stream a dump to JSON-lines files, one record per line
+
+    Route dumps are exported per table (see PAGINATED), and unicast routes
+    optionally per prefix range as well. Only one record is held in memory at
+    any time.
+
+    :param connection: VPPApiClient instance that holds an active connection
+    :param dump: Dump message to export
+    :param export_dir: Directory to write the files to
+    :param prefixes: Prefix ranges to split unicast routes by, routes outside
+                     of every range are not exported
+    :param serializers: MessageSerializers to convert the records with
+    :param fields: Only export these fields of every record, see field_tree
+    :param where: Only export the records matching a predicate, as a tuple of
+                  the predicate and the dump arguments that push it down
+    :return: Manifest entry (dump, table, prefix, path, count) per file
+    """
+
+    convert = None
+    if serializers and serializers.details(dump):
+        convert = serializers.record_converter(serializers.details(dump), fields)
+    if convert is None and fields:
+        tree = field_tree(fields)
+        convert = lambda record: project_record(record, tree)
+    convert = convert or record_to_dict
+
+    pages = PAGINATED.get(dump)
+    if pages is None:
+        page = _page(export_dir, dump)
+        _write_pages(_stream(connection, dump, where), [page], convert=convert)
+        return [page]
+
+    ranges = []
+    if prefixes and dump in PREFIX_RANGES:
+        ranges = [ipaddress.ip_network(p, strict=False) for p in prefixes]
+
+    manifest = []
+    tables = [
+        getattr(details, pages.table_field)
+        for details in getattr(connection.api, pages.tables_dump)()
+    ]
+    for table in tables:
+        label = pages.label(table)
+        if not ranges:
+            table_pages = [_page(export_dir, dump, label)]
+        else:
+            table_pages = []
+            for prefix in ranges:
+                if (prefix.version == 6) != bool(table.is_ip6):
+                    continue
+                page = _page(export_dir, dump, label, prefix)
+                page["range"] = prefix
+                table_pages.append(page)
+            if not table_pages:
+                continue
+
+        records = _stream(connection, dump, where, table=table._asdict())
+        _write_pages(records, table_pages, pages.route_field, convert)
+        manifest.extend(table_pages)
+
+    return manifest
+
+
+def export_facts(
+    connection: Any,
+    dumps: List[str],
+    export_dir: str,
+    prefixes: List[str] = None,
+    serializers: Any = None,
+    fields: Dict[str, List[str]] = None,
+    where: Dict[str, Tuple[Callable, Dict]] = None,
+) -> Dict:
+    """
+    Export a list of dumps, see export_dump
+
+    :return: Manifest with the files written, the total number of records and
+             the dumps this VPP does not know
+    """
+
+    os.makedirs(export_dir, exist_ok=True)
+    files = []
+    skipped = []
+    needed = {
+        dump: [dump] + ([PAGINATED[dump].tables_dump] if dump in PAGINATED else [])
+        for dump in dumps
+    }
+    messages = sorted({funcname for names in needed.values() for funcname in names})
+    known = set(known_messages(connection, messages))
+    for dump in dumps:
+        if not known.issuperset(needed[dump]):
+            skipped.append(dump)
+            continue
+        files.extend(
+            export_dump(
+                connection,
+                dump,
+                export_dir,
+                prefixes,
+                serializers,
+                (fields or {}).get(dump),
+                (where or {}).get(dump),
+            )
+        )
+
+    return {
+        "directory": export_dir,
+        "files": files,
+        "records": sum(page["count"] for page in files),
+        "skipped": skipped,
+    }
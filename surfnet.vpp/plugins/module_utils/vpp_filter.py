@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import re
+import fnmatch
+import operator
+import ipaddress
+from enum import Enum
+from typing import Any, Callable, Dict, List
+
+from ansible.module_utils.parsing.convert_bool import boolean
+
+# Operators of a condition, they get the field value first
+OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "in": lambda value, wanted: value in wanted,
+    "range": lambda value, wanted: wanted[0] <= value <= wanted[1],
+    "glob": lambda value, wanted: fnmatch.fnmatchcase(str(value), wanted),
+    "within": lambda value, wanted: value.version == wanted.version
+    and value.subnet_of(wanted),
+}
+
+# Arguments of dump messages that let VPP do (part of) the filtering:
+# dump: {field: (argument, extra arguments)}
+PUSHDOWN = {
+    "sw_interface_dump": {
+        "sw_if_index": ("sw_if_index", {}),
+        "interface_name": ("name_filter", {"name_filter_valid": True}),
+    },
+    "sw_interface_vhost_user_dump": {"sw_if_index": ("sw_if_index", {})},
+    "sw_bond_interface_dump": {"sw_if_index": ("sw_if_index", {})},
+    "bridge_domain_dump": {"bd_id": ("bd_id", {})},
+}
+
+# Arguments that VPP matches as a substring, a glob can push down its longest
+# literal part there
+SUBSTRING_ARGUMENTS = ("name_filter",)
+
+
+def _coerce(sample: Any, value: Any) -> Any:
+    """Convert a value from a playbook to the type of a field of a record"""
+
+    if isinstance(value, (list, tuple)):
+        return [_coerce(sample, v) for v in value]
+    if isinstance(sample, bool):
+        return boolean(value)
+    if isinstance(sample, (int, Enum)):
+        return int(value)
+    if isinstance(sample, float):
+        return float(value)
+    if isinstance(sample, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        return ipaddress.ip_network(value, strict=False)
+    if isinstance(sample, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        return ipaddress.ip_address(value)
+    return str(value)
+
+
+def _native(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return int(value.value)
+    if isinstance(value, (bool, int, float, str)) or hasattr(value, "version"):
+        return value
+    return str(value)
+
+
+def _field_values(record: Any, names: List[str]) -> List:
+    """The values of a field path, a list along the way yields all its elements"""
+
+    values = [record]
+    for name in names:
+        found = []
+        for value in values:
+            value = getattr(value, name)
+            if isinstance(value, list):
+                found.extend(value)
+            else:
+                found.append(value)
+        values = found
+    return values
+
+
+class Condition:
+    """One condition on a field of the records of a dump"""
+
+    def __init__(self, field: str, op: str = "eq", value: Any = None):
+        if op not in OPERATORS:
+            raise ValueError(
+                f"Unknown operator {op}, use one of {', '.join(sorted(OPERATORS))}"
+            )
+        if op in ("in", "range") and not isinstance(value, (list, tuple)):
+            raise ValueError(f"Operator {op} needs a list as value")
+        if op == "range" and len(value) != 2:
+            raise ValueError("Operator range needs a list of two values")
+        self.field = field
+        self.names = field.split(".")
+        self.op = op
+        self.value = value
+        self._test = OPERATORS[op]
+        self._wanted = {}
+
+    def _coerced(self, sample: Any) -> Any:
+        kind = type(sample)
+        if kind not in self._wanted:
+            if self.op == "glob":
+                self._wanted[kind] = str(self.value)
+            elif self.op == "within":
+                self._wanted[kind] = ipaddress.ip_network(self.value, strict=False)
+            else:
+                self._wanted[kind] = _coerce(sample, self.value)
+        return self._wanted[kind]
+
+    def __call__(self, record: Any) -> bool:
+        """True when the field, or any element of a list along its path, matches"""
+
+        for value in _field_values(record, self.names):
+            try:
+                if self._test(_native(value), self._coerced(value)):
+                    return True
+            except (TypeError, ValueError, AttributeError):
+                # Values that cannot be compared (e.g. IPv4 to IPv6) do not match
+                continue
+        return False
+
+
+def compile_where(conditions: List[Dict]) -> Callable[[Any], bool]:
+    """
+    Turn a list of conditions into a predicate on records
+
+    Every condition is a dict with a field (nested fields by their path), an
+    op (eq when left out) and a value. A record matches when all conditions
+    hold.
+
+    :raises ValueError: On an unknown operator or a malformed value
+    """
+
+    compiled = [
+        Condition(c["field"], c.get("op") or "eq", c.get("value")) for c in conditions
+    ]
+    if len(compiled) == 1:
+        return compiled[0]
+    return lambda record: all(condition(record) for condition in compiled)
+
+
+def _literal(pattern: str) -> str:
+    """The longest part of a glob pattern without wildcards"""
+
+    # A bracket expression matches one character, as fnmatch parses it: a ]
+    # right after [ or [! is part of the set, a [ that is not closed a literal
+    pattern = re.sub(r"\[!?\]?[^\]]*\]", "?", pattern)
+    return max(re.split(r"[*?]", pattern), key=len)
+
+
+def pushdown(dump: str, conditions: List[Dict]) -> Dict:
+    """
+    Dump arguments that make VPP skip records the conditions would drop
+
+    Only equality (and a glob on a substring argument) can be pushed down. The
+    conditions still have to be applied to the records VPP returns.
+
+    :param dump: The dump message
+    :param conditions: Conditions as given to compile_where
+    :return: Keyword arguments for the dump
+    """
+
+    arguments = {}
+    supported = PUSHDOWN.get(dump, {})
+    for condition in conditions:
+        if condition["field"] not in supported:
+            continue
+        argument, extra = supported[condition["field"]]
+        op = condition.get("op") or "eq"
+        if op == "eq":
+            value = condition["value"]
+            if argument not in SUBSTRING_ARGUMENTS:
+                value = int(value)
+        elif op == "glob" and argument in SUBSTRING_ARGUMENTS:
+            value = _literal(str(condition["value"]))
+            if not value:
+                continue
+        else:
+            continue
+        arguments[argument] = value
+        arguments.update(extra)
+    return arguments
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import re
+import json
+from typing import Any, Dict, List, Tuple, Union
+
+from .const import VPP_CACHE_DIR, L2_API_PORT_TYPE
+from .vpp_common import VPPSnapshot
+from .vpp_l2 import Step, apply_plan
+
+VPP_JOURNAL_DIR = os.path.join(VPP_CACHE_DIR, "journal")
+JOURNAL_VERSION = 1
+
+VALID_NAME = re.compile(r"^[\w.-]+$")
+
+
+def journal_path(name: str) -> str:
+    """Path of the journal with this name"""
+
+    if not VALID_NAME.match(name or ""):
+        raise ValueError(f"Invalid journal name {name!r}")
+    return os.path.join(VPP_JOURNAL_DIR, f"{name}.journal")
+
+
+def _attach_back(snapshot: VPPSnapshot, target: Any, sw_if_index: int) -> Step:
+    """The step that puts an interface back in the bridge domain it is in now"""
+
+    membership = snapshot.bridge_domain_of(sw_if_index)
+    if membership is None:
+        return Step("detach", target, dict(sw_if_index=sw_if_index))
+    bd_id, shg = membership
+    port_type = L2_API_PORT_TYPE.L2_API_PORT_TYPE_NORMAL
+    if snapshot.bridge_domain(bd_id).bvi_sw_if_index == sw_if_index:
+        port_type = L2_API_PORT_TYPE.L2_API_PORT_TYPE_BVI
+    args = dict(sw_if_index=sw_if_index, bd_id=bd_id, shg=shg, port_type=port_type)
+    return Step("attach", target, args)
+
+
+def undo_step(snapshot: VPPSnapshot, step: Step) -> Union[Step, None]:
+    """
+    The step that reverts a step, from the state before the plan ran
+
+    Creates are undone by deleting and deletes by creating again with the
+    settings of the snapshot. A port created again gets a new sw_if_index, so
+    the steps that refer to it by socket pick that one up.
+
+    :param snapshot: Snapshot of VPP state the plan was made from
+    :param step: A step of the plan
+    :return: The reverting step, None when the snapshot does not tell how
+    """
+
+    sw_if_index = step.args.get("sw_if_index")
+    if step.action == "create_bridge_domain":
+        return Step(
+            "delete_bridge_domain", step.target, dict(bd_id=step.target, is_add=False)
+        )
+    if step.action == "delete_bridge_domain":
+        bd = snapshot.bridge_domain(step.target)
+        if bd is None:
+            return None
+        args = dict(
+            bd_id=bd.bd_id,
+            flood=bool(bd.flood),
+            uu_flood=bool(bd.uu_flood),
+            forward=bool(bd.forward),
+            learn=bool(bd.learn),
+            arp_term=bool(bd.arp_term),
+            arp_ufwd=bool(bd.arp_ufwd),
+            mac_age=bd.mac_age,
+            bd_tag=bd.bd_tag or "",
+            is_add=True,
+        )
+        return Step("create_bridge_domain", step.target, args)
+    if step.action == "create_vhost_user":
+        return Step("delete_vhost_user", step.target, {})
+    if step.action == "delete_vhost_user":
+        vhost = snapshot.vhost_user(sw_if_index)
+        interface = snapshot.interface(sw_if_index)
+        if vhost is None:
+            return None
+        args = dict(
+            sock_filename=vhost.sock_filename,
+            is_server=bool(vhost.is_server),
+            tag=interface.tag if interface else "",
+        )
+        return Step("create_vhost_user", step.target, args)
+    if step.action == "modify_vhost_user":
+        vhost = snapshot.vhost_user(sw_if_index)
+        if vhost is None:
+            return None
+        args = dict(step.args, is_server=bool(vhost.is_server))
+        return Step("modify_vhost_user", step.target, args)
+    if step.action == "tag":
+        interface = snapshot.interface(sw_if_index)
+        if interface is None:
+            return None
+        args = dict(
+            sw_if_index=sw_if_index, tag=interface.tag, is_add=bool(interface.tag)
+        )
+        return Step("tag", step.target, args)
+    if step.action in ("attach", "detach"):
+        if sw_if_index is None:
+            # A port this plan creates, it was in no bridge domain before
+            return Step("detach", step.target, {})
+        return _attach_back(snapshot, step.target, sw_if_index)
+    return None
+
+
+def _encode(step: Union[Step, None]) -> Union[List, None]:
+    return None if step is None else [step.action, step.target, step.args]
+
+
+def _decode(value: Union[List, None]) -> Union[Step, None]:
+    return None if value is None else Step(*value)
+
+
+class Journal:
+    """
+    Write-ahead journal of a plan and of the steps VPP confirmed
+
+    The plan, and the step that reverts each step, is written before the first
+    call, every window of steps VPP confirms is appended as it completes.
+    After an interrupted run, or one that lost its connection, the journal
+    tells which steps still have to run, and which ones to revert, in reverse
+    order, to roll back. A run that VPP refused a step of ends the journal,
+    unless its rollback failed.
+
+    The journal is a file of JSON lines, a line that was cut off while being
+    written is ignored. Without a path it is only kept in memory, which still
+    allows a rollback within the same run.
+    """
+
+    def __init__(self, path: Union[str, None] = None):
+        self.path = path
+        self.steps = []
+        self.undo = []
+        self.vpe_pid = None
+        self.digest = None
+        self.confirmed = []
+        self.reverted = set()
+        self.created = {}
+        self.status = None
+
+    @classmethod
+    def begin(
+        cls,
+        path: Union[str, None],
+        plan: List[Step],
+        undo: List[Union[Step, None]],
+        vpe_pid: int,
+        digest: str,
+    ) -> "Journal":
+        """
+        Start a journal for a plan, replacing an earlier one at the path
+
+        :param path: Journal file, None to keep it in memory
+        :param plan: Steps as returned by plan_l2 or plan_membership
+        :param undo: The reverting step of each step, see undo_step
+        :param vpe_pid: Process id of VPP, a journal of another VPP process
+                        cannot be resumed
+        :param digest: Digest of the declaration the plan was made from
+        """
+
+        journal = cls(path)
+        journal.steps = list(plan)
+        journal.undo = list(undo)
+        journal.vpe_pid = vpe_pid
+        journal.digest = digest
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as fh:
+                journal._write(
+                    fh,
+                    op="begin",
+                    version=JOURNAL_VERSION,
+                    vpe_pid=vpe_pid,
+                    digest=digest,
+                    steps=[_encode(step) for step in journal.steps],
+                    undo=[_encode(step) for step in journal.undo],
+                )
+            os.replace(path + ".tmp", path)
+        return journal
+
+    @classmethod
+    def load(cls, path: str) -> Union["Journal", None]:
+        """Replay a journal file, None when there is none or it is unusable"""
+
+        journal = cls(path)
+        try:
+            with open(path) as fh:
+                lines = fh.readlines()
+        except (IOError, OSError):
+            return None
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            if op == "begin":
+                if record.get("version") != JOURNAL_VERSION:
+                    return None
+                journal.vpe_pid = record["vpe_pid"]
+                journal.digest = record["digest"]
+                journal.steps = [_decode(step) for step in record["steps"]]
+                journal.undo = [_decode(step) for step in record["undo"]]
+            elif op == "done":
+                journal.confirmed.extend(record["steps"])
+                journal.reverted.difference_update(record["steps"])
+                journal.created.update(record["created"])
+            elif op == "undone":
+                journal.reverted.update(record["steps"])
+                journal.created.update(record["created"])
+            elif op == "end":
+                journal.status = record["status"]
+        return journal if journal.steps else None
+
+    @staticmethod
+    def _write(fh: Any, **record: Any) -> None:
+        fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def _append(self, **record: Any) -> None:
+        if not self.path:
+            return
+        with open(self.path, "a") as fh:
+            self._write(fh, **record)
+
+    @property
+    def unfinished(self) -> bool:
+        return self.status is None
+
+    def pending(self) -> List[int]:
+        """Positions of the steps not confirmed or reverted since, in plan order"""
+
+        done = set(self.confirmed) - self.reverted
+        return [position for position in range(len(self.steps)) if position not in done]
+
+    def revertible(self) -> List[int]:
+        """Positions of the confirmed steps to revert, in the order to do so"""
+
+        # A step that was reverted and ran again is in confirmed twice
+        positions = []
+        seen = set(self.reverted)
+        for position in reversed(self.confirmed):
+            if position not in seen and self.undo[position] is not None:
+                positions.append(position)
+            seen.add(position)
+        return positions
+
+    def stale(self, vpe_pid: int, digest: str) -> str:
+        """Why the journal cannot be resumed, empty when it can"""
+
+        if self.vpe_pid != vpe_pid:
+            return "VPP restarted since"
+        if self.digest != digest:
+            return "the declaration changed since"
+        return ""
+
+    def confirm(self, positions: List[int], created: Dict) -> None:
+        self.confirmed.extend(positions)
+        self.reverted.difference_update(positions)
+        self._append(op="done", steps=positions, created=created)
+
+    def revert(self, positions: List[int], created: Dict) -> None:
+        self.reverted.update(positions)
+        self._append(op="undone", steps=positions, created=created)
+
+    def end(self, status: str) -> None:
+        self.status = status
+        self._append(op="end", status=status)
+
+
+def open_journal(
+    path: Union[str, None], vpe_pid: int, digest: str
+) -> Tuple[Union[Journal, None], str]:
+    """
+    The unfinished journal at a path, to resume
+
+    :return: The journal, or None and why it cannot be resumed when there is
+             an unfinished one
+    """
+
+    journal = Journal.load(path) if path else None
+    if journal is None or not journal.unfinished or not journal.pending():
+        return None, ""
+    reason = journal.stale(vpe_pid, digest)
+    if reason:
+        return None, reason
+    return journal, ""
+
+
+def _run(
+    conn: Any,
+    variants: Dict,
+    journal: Journal,
+    plan: List[Step],
+    positions: List[int],
+    record: Any,
+) -> Tuple[int, Union[str, None]]:
+    def confirm(done: List[int], created: Dict) -> None:
+        record([positions[i] for i in done], created)
+
+    return apply_plan(conn, variants, plan, journal.created, confirm)
+
+
+def rollback(
+    conn: Any, variants: Dict, journal: Journal
+) -> Tuple[int, Union[str, None]]:
+    """
+    Revert the confirmed steps of a journal, last one first
+
+    :return: The number of steps reverted, and the error of the first revert
+             that failed, or of the connection, or None
+    """
+
+    positions = journal.revertible()
+    plan = [journal.undo[position] for position in positions]
+    before = len(journal.reverted)
+    try:
+        reverted, error = _run(conn, variants, journal, plan, positions, journal.revert)
+    except IOError as e:
+        return len(journal.reverted) - before, f"Lost the connection to VPP: {e}"
+    if error is None:
+        journal.end("rolled back")
+    return reverted, error
+
+
+def apply_journaled(
+    conn: Any, variants: Dict, journal: Journal, revert: bool = False
+) -> Dict:
+    """
+    Run the steps of a journal that have not been confirmed yet
+
+    :param conn: Reference to the connection
+    :param variants: Messages to use, as returned by resolve_variants
+    :param journal: The journal of a new plan, or one loaded to resume
+    :param revert: Roll back all confirmed steps when a step fails
+    :return: applied, the number of steps applied, error, the error that
+             stopped the run or None, and with revert, rolled_back and
+             rollback_error
+    """
+
+    positions = journal.pending()
+    plan = [journal.steps[position] for position in positions]
+    before = len(journal.confirmed)
+    lost = False
+    try:
+        applied, error = _run(conn, variants, journal, plan, positions, journal.confirm)
+    except IOError as e:
+        # The replies that did arrive are journaled, the run can be resumed
+        applied = len(journal.confirmed) - before
+        error = f"Lost the connection to VPP: {e}"
+        lost = True
+    outcome = dict(applied=applied, error=error)
+    if error is None:
+        journal.end("complete")
+    elif revert:
+        outcome["rolled_back"], outcome["rollback_error"] = rollback(
+            conn, variants, journal
+        )
+    elif not lost:
+        # VPP refused a step, resuming would only send it again: the next run
+        # plans from a fresh dump instead
+        journal.end("failed")
+    return outcome
+
+
+def run_journaled(
+    conn: Any,
+    variants: Dict,
+    plan: List[Step],
+    journal: Union[Journal, None],
+    snapshot: Union[VPPSnapshot, None],
+    path: Union[str, None],
+    vpe_pid: int,
+    digest: str,
+    revert: bool,
+    result: Dict,
+) -> Union[str, None]:
+    """
+    Apply a plan under a journal, for the modules with a journal option
+
+    :param conn: Reference to the connection
+    :param variants: Messages to use, as returned by resolve_variants
+    :param plan: The steps to run, the pending ones of a resumed journal
+    :param journal: The journal to resume, None to start one for the plan
+    :param snapshot: Snapshot the plan was made from, to undo its steps with
+    :param path: Journal file, None to keep it in memory
+    :param vpe_pid: Process id of VPP
+    :param digest: Digest of the declaration the plan was made from
+    :param revert: Roll back all confirmed steps when a step fails
+    :param result: Result of the module, applied, changed, message and
+                   rolled_back are filled in
+    :return: The message to fail the module with, None when the plan applied
+    :raises OSError: When the journal cannot be written
+    """
+
+    if journal is None:
+        undo = [undo_step(snapshot, step) for step in plan]
+        journal = Journal.begin(path, plan, undo, vpe_pid, digest)
+    outcome = apply_journaled(conn, variants, journal, revert)
+
+    result["applied"] = outcome["applied"]
+    if not outcome["error"]:
+        result["message"] = f"Applied {len(plan)} changes"
+        return None
+
+    result["changed"] = result["applied"] > 0
+    msg = outcome["error"]
+    if "rolled_back" in outcome:
+        result["rolled_back"] = outcome["rolled_back"]
+        if outcome["rollback_error"]:
+            msg += f", rollback failed: {outcome['rollback_error']}"
+        else:
+            msg += f", rolled back {outcome['rolled_back']} changes"
+    return msg
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+from collections import namedtuple
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from .vpp_common import VPPSnapshot, BatchExecutor, BatchResult
+from .const import VPP_SOCKET_DIR, L2_API_PORT_TYPE
+
+INDEX_ANY = 0xFFFFFFFF
+
+# Order the steps of a plan run in: members leave a bridge domain before it or
+# the port is deleted, and ports and bridge domains exist before members join
+STEP_ORDER = (
+    "detach",
+    "delete_vhost_user",
+    "delete_bridge_domain",
+    "create_bridge_domain",
+    "create_vhost_user",
+    "modify_vhost_user",
+    "tag",
+    "attach",
+)
+
+# One call of a plan. Target is the bridge domain id or the socket of a port,
+# args the call arguments, apart from the sw_if_index of ports created by an
+# earlier step of the same plan.
+Step = namedtuple("Step", ["action", "target", "args"])
+
+
+def socket_path(sock_filename: str) -> str:
+    """Full path of a vhost-user socket, as vpp_vhostuser stores it"""
+
+    return os.path.join(VPP_SOCKET_DIR, str(sock_filename))
+
+
+def _index_specs(specs: List[Dict], key: str, name: str) -> Dict:
+    indexed = {}
+    for spec in specs:
+        value = socket_path(spec[key]) if key == "sock_filename" else spec[key]
+        if value in indexed:
+            raise ValueError(f"Duplicate {name} {spec[key]}")
+        indexed[value] = spec
+    return indexed
+
+
+def plan_l2(
+    snapshot: VPPSnapshot,
+    bridge_domains: List[Dict],
+    ports: List[Dict],
+    purge_tag: str = None,
+) -> List[Step]:
+    """
+    Compute the calls that bring VPP in line with the desired L2 state
+
+    Only what differs is planned: bridge domains and ports that do not exist
+    are created, the server mode, tag and bridge domain of existing ports
+    corrected, and with purge_tag, ports and bridge domains whose tag starts
+    with it but that are not declared are removed. Options that are left out
+    (tag, bd) are not managed.
+
+    :param snapshot: Snapshot of VPP state
+    :param bridge_domains: Desired bridge domains (bd, bd_tag, flood, ...)
+    :param ports: Desired vhost-user ports (sock_filename, is_server, tag, bd, shg)
+    :param purge_tag: Tag prefix of the objects this declaration owns
+    :return: The steps, in the order they have to run in
+    :raises ValueError: On duplicates or a port in an unknown bridge domain
+    """
+
+    wanted_bds = _index_specs(bridge_domains, "bd", "bridge domain")
+    wanted_ports = _index_specs(ports, "sock_filename", "vhost-user port")
+    steps = {action: [] for action in STEP_ORDER}
+
+    for bd_id, spec in wanted_bds.items():
+        if snapshot.bridge_domain(bd_id) is None:
+            args = dict(
+                bd_id=bd_id,
+                flood=bool(spec.get("flood", True)),
+                uu_flood=bool(spec.get("uu_flood", True)),
+                learn=bool(spec.get("learn", True)),
+                bd_tag=spec.get("bd_tag") or "",
+                is_add=True,
+            )
+            steps["create_bridge_domain"].append(
+                Step("create_bridge_domain", bd_id, args)
+            )
+
+    existing = {v.sock_filename: v for v in snapshot.records("vhost_user")}
+    for sock, spec in wanted_ports.items():
+        bd_id = spec.get("bd")
+        if bd_id is not None and bd_id not in wanted_bds:
+            if snapshot.bridge_domain(bd_id) is None:
+                raise ValueError(
+                    f"Bridge domain {bd_id} of {spec['sock_filename']} is not "
+                    "declared and does not exist"
+                )
+        membership = None if bd_id is None else (bd_id, spec.get("shg") or 0)
+
+        vhost = existing.get(sock)
+        if vhost is None:
+            args = dict(
+                sock_filename=sock,
+                is_server=bool(spec.get("is_server")),
+                tag=spec.get("tag") or "",
+            )
+            steps["create_vhost_user"].append(Step("create_vhost_user", sock, args))
+            if membership:
+                steps["attach"].append(
+                    Step("attach", sock, dict(bd_id=bd_id, shg=membership[1]))
+                )
+            continue
+
+        sw_if_index = vhost.sw_if_index
+        if bool(vhost.is_server) != bool(spec.get("is_server")):
+            args = dict(
+                sw_if_index=sw_if_index,
+                sock_filename=sock,
+                is_server=bool(spec.get("is_server")),
+            )
+            steps["modify_vhost_user"].append(Step("modify_vhost_user", sock, args))
+
+        tag = spec.get("tag")
+        interface = snapshot.interface(sw_if_index)
+        if tag is not None and (interface is None or interface.tag != tag):
+            args = dict(sw_if_index=sw_if_index, tag=tag, is_add=bool(tag))
+            steps["tag"].append(Step("tag", sock, args))
+
+        if membership and snapshot.bridge_domain_of(sw_if_index) != membership:
+            args = dict(sw_if_index=sw_if_index, bd_id=bd_id, shg=membership[1])
+            steps["attach"].append(Step("attach", sock, args))
+
+    if purge_tag:
+        detached = set()
+        for sock, vhost in existing.items():
+            interface = snapshot.interface(vhost.sw_if_index)
+            if sock in wanted_ports or interface is None:
+                continue
+            if not interface.tag.startswith(purge_tag):
+                continue
+            if snapshot.bridge_domain_of(vhost.sw_if_index):
+                args = dict(sw_if_index=vhost.sw_if_index)
+                steps["detach"].append(Step("detach", sock, args))
+                detached.add(vhost.sw_if_index)
+            args = dict(sw_if_index=vhost.sw_if_index)
+            steps["delete_vhost_user"].append(Step("delete_vhost_user", sock, args))
+
+        # Bridge domains a declared port joins are kept, declared or not
+        kept = set(wanted_bds) | {spec.get("bd") for spec in wanted_ports.values()}
+        for bd in snapshot.records("bridge_domains"):
+            if bd.bd_id in kept or bd.bd_id == 0:
+                continue
+            if not (bd.bd_tag or "").startswith(purge_tag):
+                continue
+            # Ports that move to another bridge domain rejoin after the delete
+            for member in bd.sw_if_details:
+                index = member.sw_if_index
+                if index in detached:
+                    continue
+                steps["detach"].append(Step("detach", index, dict(sw_if_index=index)))
+                detached.add(index)
+            args = dict(bd_id=bd.bd_id, is_add=False)
+            steps["delete_bridge_domain"].append(
+                Step("delete_bridge_domain", bd.bd_id, args)
+            )
+
+    return [step for action in STEP_ORDER for step in steps[action]]
+
+
+def _interface(snapshot: VPPSnapshot, ref: Any) -> Any:
+    """An interface by sw_if_index or name"""
+
+    if isinstance(ref, int) or str(ref).isdigit():
+        return snapshot.interface(int(ref))
+    return snapshot.interface_by_name(str(ref))
+
+
+def plan_membership(
+    snapshot: VPPSnapshot, bridge_domains: List[Dict], exclusive: bool = True
+) -> List[Step]:
+    """
+    Compute the attach and detach calls for the desired bridge domain members
+
+    Membership is compared with the sw_if_details and bvi_sw_if_index of the
+    dumped bridge domains. An interface that moves to another bridge domain is
+    only attached there, VPP takes it out of the old one.
+
+    :param snapshot: Snapshot of VPP state
+    :param bridge_domains: Desired membership per bridge domain: bd, members
+                           (interface or sw_if_index, shg) and bvi
+    :param exclusive: Detach members that are not listed
+    :return: The steps, detaches first
+    :raises ValueError: On unknown bridge domains or interfaces, or an
+                        interface in more than one bridge domain
+    """
+
+    wanted = _index_specs(bridge_domains, "bd", "bridge domain")
+    # sw_if_index: (bd_id, shg, port_type, name)
+    desired = {}
+    for bd_id, spec in wanted.items():
+        if snapshot.bridge_domain(bd_id) is None:
+            raise ValueError(f"Bridge domain {bd_id} does not exist")
+        entries = [
+            (
+                m["sw_if_index"] if m.get("interface") is None else m["interface"],
+                m.get("shg") or 0,
+                False,
+            )
+            for m in spec.get("members") or []
+        ]
+        if spec.get("bvi") is not None:
+            entries.append((spec["bvi"], 0, True))
+        for ref, shg, bvi in entries:
+            interface = _interface(snapshot, ref)
+            if interface is None:
+                raise ValueError(f"Interface {ref} of bridge domain {bd_id} not found")
+            if interface.sw_if_index in desired:
+                raise ValueError(
+                    f"Interface {ref} is listed for bridge domains "
+                    f"{desired[interface.sw_if_index][0]} and {bd_id}"
+                )
+            port_type = (
+                L2_API_PORT_TYPE.L2_API_PORT_TYPE_BVI
+                if bvi
+                else L2_API_PORT_TYPE.L2_API_PORT_TYPE_NORMAL
+            )
+            desired[interface.sw_if_index] = (
+                bd_id,
+                shg,
+                port_type,
+                interface.interface_name,
+            )
+
+    steps = {"detach": [], "attach": []}
+    for sw_if_index, (bd_id, shg, port_type, name) in desired.items():
+        current = snapshot.bridge_domain_of(sw_if_index)
+        bd = snapshot.bridge_domain(bd_id)
+        is_bvi = bd.bvi_sw_if_index == sw_if_index
+        if current == (bd_id, shg) and is_bvi == bool(port_type):
+            continue
+        args = dict(sw_if_index=sw_if_index, bd_id=bd_id, shg=shg, port_type=port_type)
+        steps["attach"].append(Step("attach", name, args))
+
+    if exclusive:
+        for bd_id in wanted:
+            bd = snapshot.bridge_domain(bd_id)
+            members = [m.sw_if_index for m in bd.sw_if_details]
+            if bd.bvi_sw_if_index != INDEX_ANY and bd.bvi_sw_if_index not in members:
+                members.append(bd.bvi_sw_if_index)
+            for sw_if_index in members:
+                if sw_if_index in desired:
+                    continue
+                interface = snapshot.interface(sw_if_index)
+                name = interface.interface_name if interface else sw_if_index
+                steps["detach"].append(
+                    Step("detach", name, dict(sw_if_index=sw_if_index))
+                )
+
+    return steps["detach"] + steps["attach"]
+
+
+def _request(variants: Dict, step: Step, sw_if_index: int) -> Tuple[str, Dict]:
+    args = dict(step.args)
+    if step.action in ("detach", "attach"):
+        return "sw_interface_set_l2_bridge", dict(
+            rx_sw_if_index=sw_if_index,
+            bd_id=args.get("bd_id", 0),
+            shg=args.get("shg", 0),
+            port_type=args.get("port_type", L2_API_PORT_TYPE.L2_API_PORT_TYPE_NORMAL),
+            enable=step.action == "attach",
+        )
+    if step.action == "delete_vhost_user":
+        return "delete_vhost_user_if", dict(sw_if_index=sw_if_index)
+    if step.action in ("create_bridge_domain", "delete_bridge_domain"):
+        return variants["bridge_domain_add_del"], args
+    if step.action == "create_vhost_user":
+        return variants["create_vhost_user_if"], args
+    if step.action == "modify_vhost_user":
+        args["sw_if_index"] = sw_if_index
+        return variants["modify_vhost_user_if"], args
+    if step.action == "tag":
+        args["sw_if_index"] = sw_if_index
+        return "sw_interface_tag_add_del", args
+    raise ValueError(f"Unknown step {step.action}")
+
+
+def apply_plan(
+    conn: Any,
+    variants: Dict,
+    plan: List[Step],
+    created: Dict = None,
+    confirm: Callable[[List[int], Dict], None] = None,
+) -> Tuple[int, Union[str, None]]:
+    """
+    Run the steps of a plan in order, on one connection
+
+    The steps of one action do not depend on each other, so each run of them
+    is sent as a pipelined batch, confirmed as the replies come in. Stops
+    after a batch VPP refused a step of, later steps may depend on it.
+
+    :param conn: Reference to the connection
+    :param variants: Messages to use, as returned by resolve_variants
+    :param plan: Steps as returned by plan_l2 or plan_membership
+    :param created: sw_if_index per socket of the ports created so far, it is
+                    updated with the ports this plan creates
+    :param confirm: Called with the positions in the plan of the steps VPP
+                    confirmed, and created, after every window of replies and
+                    at the end of each batch, also when the connection fails
+    :return: The number of steps applied, and the error of the first step that
+             failed or None
+    :raises IOError: When the connection fails, the steps confirmed until
+                     then are passed to confirm first
+    """
+
+    # Ports created by this plan only get their sw_if_index once they exist
+    created = {} if created is None else created
+    applied = 0
+    for action, group in groupby(enumerate(plan), key=lambda item: item[1].action):
+        positions, steps = zip(*group)
+        batch = BatchExecutor(conn)
+        for step in steps:
+            sw_if_index = created.get(step.target, step.args.get("sw_if_index"))
+            funcname, kwargs = _request(variants, step, sw_if_index)
+            batch.add(funcname, **kwargs)
+
+        failed = []
+        confirmed = []
+
+        def received(i: int, result: BatchResult) -> None:
+            nonlocal applied
+            if result.retval != 0:
+                failed.append((i, f"{describe(steps[i])} failed: {result.error}"))
+                return
+            applied += 1
+            confirmed.append(positions[i])
+            if action == "create_vhost_user":
+                created[steps[i].target] = result.reply.sw_if_index
+            # Confirmed a window at a time, a run cut short loses at most one
+            if confirm and len(confirmed) >= batch.window:
+                confirm(list(confirmed), created)
+                del confirmed[:]
+
+        try:
+            batch.run(received)
+        finally:
+            if confirm and confirmed:
+                confirm(confirmed, created)
+        if failed:
+            failed.sort()
+            more = f" (and {len(failed) - 1} more)" if len(failed) > 1 else ""
+            return applied, failed[0][1] + more
+    return applied, None
+
+
+def describe(step: Step) -> str:
+    """A step as a line of the plan shown to the user"""
+
+    if step.action == "detach":
+        return f"detach {step.target}"
+    if step.action == "attach":
+        kind = "BVI of" if step.args.get("port_type") else "to"
+        return f"attach {step.target} {kind} bridge domain {step.args['bd_id']}"
+    if step.action == "tag":
+        return f"tag {step.target} as {step.args['tag']!r}"
+    return f"{step.action.replace('_', ' ')} {step.target}"
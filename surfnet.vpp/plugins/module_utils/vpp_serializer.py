@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+import keyword
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from .vpp_api_cache import find_api_files, cached_definitions
+from .vpp_common import record_to_dict, field_tree
+
+# Plain types vpp_papi hands out as python values that JSON can carry as is
+SCALARS = {
+    "u8",
+    "u16",
+    "u32",
+    "u64",
+    "i8",
+    "i16",
+    "i32",
+    "i64",
+    "f64",
+    "bool",
+    "string",
+}
+
+# Types vpp_papi turns into ipaddress, MACAddress or datetime objects, which
+# all print in their canonical form
+FORMATTED = {
+    "vl_api_address_t",
+    "vl_api_prefix_t",
+    "vl_api_ip4_address_t",
+    "vl_api_ip6_address_t",
+    "vl_api_ip4_prefix_t",
+    "vl_api_ip6_prefix_t",
+    "vl_api_address_with_prefix_t",
+    "vl_api_ip4_address_with_prefix_t",
+    "vl_api_ip6_address_with_prefix_t",
+    "vl_api_mac_address_t",
+    "vl_api_timestamp_t",
+    "vl_api_timedelta_t",
+}
+
+# Message header fields that say nothing about the record itself
+SKIP_FIELDS = ("_vl_msg_id", "context", "client_index")
+
+# VPP types do not nest this deep, anything beyond is a broken definition
+MAX_DEPTH = 16
+
+
+def _fields(definition: List) -> List[List]:
+    """The field definitions of a type or message, without the trailing options"""
+
+    return [field for field in definition[1:] if isinstance(field, list)]
+
+
+def _attributes(fields: List[List]) -> List[str]:
+    """
+    Attribute names vpp_papi gives the fields of a record
+
+    Records are namedtuples created with rename=True, which replaces names that
+    are keywords, start with an underscore or repeat by _<position>.
+    """
+
+    seen = set()
+    names = []
+    for index, field in enumerate(fields):
+        name = field[1]
+        if (
+            not name.isidentifier()
+            or keyword.iskeyword(name)
+            or name.startswith("_")
+            or name in seen
+        ):
+            name = f"_{index}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+class MessageSerializers:
+    """
+    Converters from decoded VPP messages to plain JSON types
+
+    For every message a converter is generated from its definition in the
+    .api.json files: a flat list comprehension over the records, with one
+    expression per field that already knows the field's type. Enums and flags
+    become integers, addresses, prefixes and MAC addresses their canonical
+    string, u8 arrays a hex string and nested types and arrays dicts and lists.
+    Converters are generated on first use and kept for the lifetime of the
+    instance.
+    """
+
+    def __init__(self, definitions: Dict):
+        """
+        :param definitions: API definitions in the .api.json layout, see
+                            vpp_api_cache.merge_definitions
+        """
+
+        self.messages = {d[0]: d for d in definitions.get("messages", [])}
+        self.services = definitions.get("services", {})
+        self.aliases = definitions.get("aliases", {})
+        self.types = {
+            d[0]: d
+            for section in ("types", "unions")
+            for d in definitions.get(section, [])
+        }
+        self.enums = {
+            d[0]
+            for section in ("enums", "enumflags")
+            for d in definitions.get(section, [])
+        }
+        self._converters = {}
+
+    @classmethod
+    def from_files(cls, files: List[str]) -> "MessageSerializers":
+        """Load the definitions of a list of .api.json files"""
+
+        definitions = {}
+        for path in files:
+            with open(path) as fh:
+                api = json.load(fh)
+            for section, value in api.items():
+                if isinstance(value, list):
+                    definitions.setdefault(section, []).extend(value)
+                elif isinstance(value, dict):
+                    definitions.setdefault(section, {}).update(value)
+        return cls(definitions)
+
+    def _value(self, ftype: str, src: str, depth: int, select: Dict = None) -> str:
+        if depth > MAX_DEPTH:
+            raise ValueError(f"Type {ftype} nests too deep")
+
+        name = (
+            ftype[len("vl_api_") : -len("_t")] if ftype.startswith("vl_api_") else ftype
+        )
+        # Before the aliases: addresses are u8 arrays in the definitions, but
+        # vpp_papi hands them out as objects
+        if ftype in FORMATTED or f"vl_api_{name}_t" in FORMATTED:
+            if select:
+                raise ValueError(f"{ftype} has no fields {', '.join(select)}")
+            return f"str({src})"
+        if name in self.aliases:
+            alias = self.aliases[name]
+            if "length" in alias:
+                return self._array(alias["type"], src, depth, select)
+            return self._value(alias["type"], src, depth, select)
+        if name in self.types:
+            return self._struct(_fields(self.types[name]), src, depth, select=select)
+
+        if select:
+            raise ValueError(f"{ftype} has no fields {', '.join(select)}")
+        if ftype in SCALARS:
+            return src
+        if name in self.enums:
+            return f"int({src})"
+        # Unknown to the definitions, convert by inspection
+        return f"_plain({src})"
+
+    def _array(self, ftype: str, src: str, depth: int, select: Dict = None) -> str:
+        if ftype == "u8" and not select:
+            return f"bytes({src}).hex()"
+        var = f"x{depth}"
+        value = self._value(ftype, var, depth + 1, select)
+        if value == var:
+            return f"list({src})"
+        return f"[{value} for {var} in {src}]"
+
+    def _field(self, field: List, src: str, depth: int, select: Dict = None) -> str:
+        # Options such as {"default": 4500} are not a length, as in vpp_papi
+        field = [part for part in field if not isinstance(part, dict)]
+        if len(field) > 2 and field[0] != "string":
+            return self._array(field[0], src, depth, select)
+        return self._value(field[0], src, depth, select)
+
+    def _struct(
+        self, fields: List[List], src: str, depth: int, skip=(), select: Dict = None
+    ) -> str:
+        if select:
+            unknown = set(select) - {field[1] for field in fields}
+            if unknown:
+                raise ValueError(f"Unknown fields {', '.join(sorted(unknown))}")
+
+        items = []
+        for field, attr in zip(fields, _attributes(fields)):
+            if field[1] in skip or (select and field[1] not in select):
+                continue
+            value = self._field(
+                field, f"{src}.{attr}", depth, select.get(field[1]) if select else None
+            )
+            items.append(f"{field[1]!r}: {value}")
+        return "{" + ", ".join(items) + "}"
+
+    def source(self, message: str, fields: List[str] = None) -> str:
+        """
+        Python source of the converter for a message
+
+        :param message: Name of the message, e.g. sw_interface_details
+        :param fields: Only convert these fields, nested fields are given by
+                       their path, e.g. route.prefix
+        """
+
+        body = self._struct(
+            _fields(self.messages[message]),
+            "r",
+            0,
+            skip=SKIP_FIELDS,
+            select=field_tree(fields) if fields else None,
+        )
+        return (
+            "def convert_all(records):\n"
+            f"    return [{body} for r in records]\n"
+            "\n"
+            "def convert(r):\n"
+            f"    return {body}\n"
+        )
+
+    def _compile(self, message: str, fields: List[str] = None) -> Union[Tuple, None]:
+        key = (message, tuple(fields or ()))
+        if key not in self._converters:
+            if message not in self.messages:
+                return None
+            namespace = {"_plain": record_to_dict}
+            code = compile(
+                self.source(message, fields), f"<vpp_serializer {message}>", "exec"
+            )
+            exec(code, namespace)
+            self._converters[key] = namespace["convert_all"], namespace["convert"]
+        return self._converters[key]
+
+    def converter(
+        self, message: str, fields: List[str] = None
+    ) -> Union[Callable[[Iterable], List], None]:
+        """
+        Converter for a list of records of a message
+
+        Fields that are not selected are never touched, so projecting a large
+        dump on a few fields also saves converting the rest.
+
+        :param message: Name of the message, e.g. sw_interface_details
+        :param fields: Only convert these fields, see source
+        :return: Function converting a list of records, or None when the
+                 message is not defined
+        :raises ValueError: When a field is not part of the message
+        """
+
+        converters = self._compile(message, fields)
+        return converters[0] if converters else None
+
+    def record_converter(
+        self, message: str, fields: List[str] = None
+    ) -> Union[Callable[[Any], Dict], None]:
+        """Converter for a single record of a message, see converter"""
+
+        converters = self._compile(message, fields)
+        return converters[1] if converters else None
+
+    def details(self, funcname: str) -> Union[str, None]:
+        """The message that carries the records of a dump"""
+
+        service = self.services.get(funcname)
+        if not service:
+            return None
+        return service.get("stream_msg", service.get("reply"))
+
+    def for_dump(
+        self, funcname: str, fields: List[str] = None
+    ) -> Union[Callable[[Iterable], List], None]:
+        """Converter for the records a dump returns, see converter"""
+
+        details = self.details(funcname)
+        return self.converter(details, fields) if details else None
+
+
+def load_serializers(connection: Any) -> MessageSerializers:
+    """
+    Build the serializers for the API definitions a connection uses
+
+    :param connection: VPPApiClient instance, or a broker connection, which
+                       uses the default definitions
+    """
+
+    files = getattr(connection, "apifiles", None)
+    if not files:
+        files = cached_definitions(find_api_files())
+    return MessageSerializers.from_files(files)
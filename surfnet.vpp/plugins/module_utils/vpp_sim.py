@@ -0,0 +1,645 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import time
+import struct
+import ipaddress
+from collections import Counter, namedtuple
+from typing import Any, Dict, List
+
+from .const import L2_API_PORT_TYPE
+from .vpp_stats import HEADER, ENTRY, VECTOR_HEADER, SEGMENT_VERSION, StatType
+
+# Fields of the reply messages the simulator produces, in VPP's order. The
+# message id is renamed to _0 by namedtuple, just like vpp_papi does.
+_MESSAGES = {
+    "show_version_reply": [
+        "_vl_msg_id",
+        "context",
+        "retval",
+        "program",
+        "version",
+        "build_date",
+        "build_directory",
+    ],
+    "control_ping_reply": [
+        "_vl_msg_id",
+        "context",
+        "retval",
+        "client_index",
+        "vpe_pid",
+    ],
+    "sw_interface_details": [
+        "_vl_msg_id",
+        "context",
+        "sw_if_index",
+        "sup_sw_if_index",
+        "l2_address",
+        "flags",
+        "type",
+        "link_duplex",
+        "link_speed",
+        "link_mtu",
+        "mtu",
+        "sub_id",
+        "interface_name",
+        "interface_dev_type",
+        "tag",
+    ],
+    "sw_interface_vhost_user_details": [
+        "_vl_msg_id",
+        "context",
+        "sw_if_index",
+        "interface_name",
+        "virtio_net_hdr_sz",
+        "features_first_32",
+        "features_last_32",
+        "is_server",
+        "sock_filename",
+        "num_regions",
+        "sock_errno",
+    ],
+    "bridge_domain_details": [
+        "_vl_msg_id",
+        "context",
+        "bd_id",
+        "flood",
+        "uu_flood",
+        "forward",
+        "learn",
+        "arp_term",
+        "arp_ufwd",
+        "mac_age",
+        "bd_tag",
+        "bvi_sw_if_index",
+        "uu_fwd_sw_if_index",
+        "n_sw_ifs",
+        "sw_if_details",
+    ],
+    "vl_api_bridge_domain_sw_if_t": ["context", "sw_if_index", "shg"],
+    "sw_bond_interface_details": [
+        "_vl_msg_id",
+        "context",
+        "sw_if_index",
+        "id",
+        "mode",
+        "lb",
+        "numa_only",
+        "active_members",
+        "members",
+        "interface_name",
+    ],
+    "ip_table_details": ["_vl_msg_id", "context", "table"],
+    "vl_api_ip_table_t": ["table_id", "is_ip6", "name"],
+    "ip_route_details": ["_vl_msg_id", "context", "route"],
+    "vl_api_ip_route_t": ["table_id", "stats_index", "prefix", "n_paths", "paths"],
+    "vl_api_fib_path_t": [
+        "sw_if_index",
+        "table_id",
+        "rpf_id",
+        "weight",
+        "preference",
+        "type",
+        "flags",
+        "proto",
+        "nh",
+        "n_labels",
+        "label_stack",
+    ],
+    "vl_api_fib_path_nh_t": ["address", "via_label", "obj_id", "classify_table_index"],
+    "vl_api_address_union_t": ["ip4", "ip6"],
+    "retval_reply": ["_vl_msg_id", "context", "retval"],
+    "bridge_flags_reply": [
+        "_vl_msg_id",
+        "context",
+        "retval",
+        "resulting_feature_bitmap",
+    ],
+    "sw_if_index_reply": ["_vl_msg_id", "context", "retval", "sw_if_index"],
+    "bridge_domain_add_del_v2_reply": ["_vl_msg_id", "context", "retval", "bd_id"],
+}
+
+_TUPLES = {
+    name: namedtuple(name, fields, rename=True) for name, fields in _MESSAGES.items()
+}
+
+# Interface flags as used by sw_interface_details
+IF_STATUS_API_FLAG_ADMIN_UP = 1
+IF_STATUS_API_FLAG_LINK_UP = 2
+
+# Retvals used by the simulator, see vpp_errors
+NO_SUCH_ENTRY = -6
+INVALID_SW_IF_INDEX = -2
+BD_ALREADY_EXISTS = -119
+BD_IN_USE = -120
+BD_ALREADY_HAS_BVI = -152
+
+INDEX_ANY = 0xFFFFFFFF
+
+# Bridge domain fields per flag of bridge_flags, see BRIDGE_API_FLAGS
+BD_FLAG_FIELDS = {
+    "learn": 1,
+    "forward": 2,
+    "flood": 4,
+    "uu_flood": 8,
+    "arp_term": 16,
+    "arp_ufwd": 32,
+}
+
+
+def _reply(message: str, **fields: Any):
+    """Build a reply the way vpp_papi does, with unset fields zeroed"""
+
+    cls = _TUPLES[message]
+    values = {field: 0 for field in cls._fields}
+    values.update(fields)
+    return cls(**values)
+
+
+def _address_union(address: Any):
+    """vpp_papi decodes an address union as every member it could be"""
+
+    packed = address.packed.ljust(16, b"\0")
+    return _reply(
+        "vl_api_address_union_t",
+        ip4=ipaddress.IPv4Address(packed[:4]),
+        ip6=ipaddress.IPv6Address(packed),
+    )
+
+
+# Base address the simulated VPP maps its stats segment at
+STATS_BASE = 0x7F0000000000
+# Graph nodes in the simulated stats segment
+STATS_NODES = ["ethernet-input", "l2-input", "l2-fwd", "vhost-user-input"]
+
+
+class _StatsSegmentWriter:
+    """Lays out a stats segment the way VPP does, pointers included"""
+
+    def __init__(self):
+        self.data = bytearray(HEADER.size)
+
+    def vector(self, payload: bytes, length: int) -> int:
+        """Append a vector and return VPP's pointer to its data"""
+
+        self.data.extend(b"\0" * (-len(self.data) % 8))
+        self.data.extend(struct.pack("I", length).ljust(VECTOR_HEADER, b"\0"))
+        pointer = STATS_BASE + len(self.data)
+        self.data.extend(payload)
+        return pointer
+
+    def pointers(self, pointers: List[int]) -> int:
+        return self.vector(struct.pack(f"{len(pointers)}Q", *pointers), len(pointers))
+
+    def counters(self, threads: List[List], width: int = 1) -> int:
+        vectors = [
+            self.vector(
+                struct.pack(f"{len(values) * width}Q", *self._flat(values)),
+                len(values),
+            )
+            for values in threads
+        ]
+        return self.pointers(vectors)
+
+    def names(self, names: List[str]) -> int:
+        return self.pointers(
+            [self.vector(n.encode() + b"\0", len(n) + 1) for n in names]
+        )
+
+    @staticmethod
+    def _flat(values: List) -> List[int]:
+        flat = []
+        for value in values:
+            flat.extend(value if isinstance(value, tuple) else (value,))
+        return flat
+
+    def finish(self, entries: List, epoch: int, in_progress: int) -> bytes:
+        directory = b"".join(
+            ENTRY.pack(kind, value, name.encode()) for kind, value, name in entries
+        )
+        pointer = self.vector(directory, len(entries))
+        HEADER.pack_into(
+            self.data, 0, SEGMENT_VERSION, STATS_BASE, epoch, in_progress, pointer, 0
+        )
+        return bytes(self.data)
+
+
+class SimulatedVPP:
+    """
+    In-memory model of the parts of VPP this collection manages
+
+    Every public method is named after the VPP API message it implements and
+    takes the same keyword arguments, so an instance can stand in for the api
+    attribute of a connected VPPApiClient. Arguments that are left out are
+    zero or False, as vpp_papi packs fields the API gives no default.
+
+    It lives in module_utils because the broker serves it on the target with
+    --backend sim, the unit tests and benchmarks use it as well.
+    """
+
+    def __init__(self, version: str = "23.10-release"):
+        self.version = version
+        self.pid = os.getpid()
+        self.interfaces = {}
+        self.vhost_user = {}
+        self.bridge_domains = {}
+        self.bonds = {}
+        # (table_id, is_ip6): {prefix: (next hop, sw_if_index)}
+        self.ip_tables = {(0, False): {}, (0, True): {}}
+        self._next_if_index = 0
+        self._next_vhost_instance = 0
+        self._add_interface("local0", "local", flags=0)
+
+    def _add_interface(self, name: str, dev_type: str, tag: str = "", flags: int = 0):
+        sw_if_index = self._next_if_index
+        self._next_if_index += 1
+        self.interfaces[sw_if_index] = {
+            "sw_if_index": sw_if_index,
+            "sup_sw_if_index": sw_if_index,
+            "l2_address": "02:fe:00:00:%02x:%02x"
+            % (sw_if_index >> 8 & 0xFF, sw_if_index & 0xFF),
+            "flags": flags,
+            "link_mtu": 9000,
+            "mtu": [9000, 0, 0, 0],
+            "interface_name": name,
+            "interface_dev_type": dev_type,
+            "tag": tag,
+        }
+        return sw_if_index
+
+    def _del_interface(self, sw_if_index: int):
+        for bd in self.bridge_domains.values():
+            bd["members"].pop(sw_if_index, None)
+            if bd["bvi_sw_if_index"] == sw_if_index:
+                bd["bvi_sw_if_index"] = INDEX_ANY
+        del self.interfaces[sw_if_index]
+
+    # vpe / memclnt
+    def show_version(self, **kwargs):
+        return _reply(
+            "show_version_reply", program="vpe", version=self.version, retval=0
+        )
+
+    def control_ping(self, **kwargs):
+        return _reply("control_ping_reply", vpe_pid=self.pid)
+
+    # interface
+    def sw_interface_dump(
+        self, sw_if_index: int = INDEX_ANY, name_filter_valid=False, name_filter=""
+    ):
+        reply = []
+        for intf in self.interfaces.values():
+            if sw_if_index != INDEX_ANY and intf["sw_if_index"] != sw_if_index:
+                continue
+            if name_filter_valid and name_filter not in intf["interface_name"]:
+                continue
+            reply.append(_reply("sw_interface_details", **intf))
+        return reply
+
+    def sw_interface_tag_add_del(self, sw_if_index: int, tag: str = "", is_add=True):
+        if sw_if_index not in self.interfaces:
+            return _reply("retval_reply", retval=INVALID_SW_IF_INDEX)
+        self.interfaces[sw_if_index]["tag"] = tag if is_add else ""
+        return _reply("retval_reply")
+
+    # vhost_user
+    def sw_interface_vhost_user_dump(self, sw_if_index: int = INDEX_ANY):
+        return [
+            _reply("sw_interface_vhost_user_details", **vhost)
+            for vhost in self.vhost_user.values()
+            if sw_if_index in (INDEX_ANY, vhost["sw_if_index"])
+        ]
+
+    def create_vhost_user_if(self, sock_filename: str, is_server=False, tag="", **kw):
+        name = f"VirtualEthernet0/0/{self._next_vhost_instance}"
+        self._next_vhost_instance += 1
+        sw_if_index = self._add_interface(name, "vhost-user", tag=tag)
+        self.vhost_user[sw_if_index] = {
+            "sw_if_index": sw_if_index,
+            "interface_name": name,
+            "is_server": bool(is_server),
+            "sock_filename": sock_filename,
+        }
+        return _reply("sw_if_index_reply", sw_if_index=sw_if_index)
+
+    create_vhost_user_if_v2 = create_vhost_user_if
+
+    def modify_vhost_user_if(
+        self, sw_if_index: int, sock_filename: str, is_server=False, **kwargs
+    ):
+        if sw_if_index not in self.vhost_user:
+            return _reply("retval_reply", retval=INVALID_SW_IF_INDEX)
+        self.vhost_user[sw_if_index]["sock_filename"] = sock_filename
+        self.vhost_user[sw_if_index]["is_server"] = bool(is_server)
+        return _reply("retval_reply")
+
+    modify_vhost_user_if_v2 = modify_vhost_user_if
+
+    def delete_vhost_user_if(self, sw_if_index: int):
+        if sw_if_index not in self.vhost_user:
+            return _reply("retval_reply", retval=INVALID_SW_IF_INDEX)
+        del self.vhost_user[sw_if_index]
+        self._del_interface(sw_if_index)
+        return _reply("retval_reply")
+
+    # l2
+    def bridge_domain_dump(self, bd_id: int = INDEX_ANY, sw_if_index=INDEX_ANY):
+        reply = []
+        for bd in self.bridge_domains.values():
+            if bd_id != INDEX_ANY and bd["bd_id"] != bd_id:
+                continue
+            members = [
+                _reply("vl_api_bridge_domain_sw_if_t", sw_if_index=idx, shg=shg)
+                for idx, shg in bd["members"].items()
+            ]
+            if sw_if_index != INDEX_ANY and sw_if_index not in bd["members"]:
+                continue
+            fields = {k: v for k, v in bd.items() if k != "members"}
+            reply.append(
+                _reply(
+                    "bridge_domain_details",
+                    n_sw_ifs=len(members),
+                    sw_if_details=members,
+                    **fields,
+                )
+            )
+        return reply
+
+    def bridge_domain_add_del(
+        self,
+        bd_id: int = 0,
+        flood=False,
+        uu_flood=False,
+        forward=False,
+        learn=False,
+        arp_term=False,
+        arp_ufwd=False,
+        mac_age=0,
+        bd_tag="",
+        is_add=True,
+    ):
+        if not is_add:
+            bd = self.bridge_domains.get(bd_id)
+            if bd is None:
+                return _reply("retval_reply", retval=NO_SUCH_ENTRY)
+            if bd["members"]:
+                return _reply("retval_reply", retval=BD_IN_USE)
+            del self.bridge_domains[bd_id]
+            return _reply("retval_reply")
+
+        if bd_id in (0, INDEX_ANY):
+            bd_id = max(self.bridge_domains, default=0) + 1
+        elif bd_id in self.bridge_domains:
+            return _reply("retval_reply", retval=BD_ALREADY_EXISTS)
+        self.bridge_domains[bd_id] = {
+            "bd_id": bd_id,
+            "flood": bool(flood),
+            "uu_flood": bool(uu_flood),
+            "forward": bool(forward),
+            "learn": bool(learn),
+            "arp_term": bool(arp_term),
+            "arp_ufwd": bool(arp_ufwd),
+            "mac_age": mac_age,
+            "bd_tag": bd_tag,
+            "bvi_sw_if_index": INDEX_ANY,
+            "uu_fwd_sw_if_index": INDEX_ANY,
+            "members": {},
+        }
+        return _reply("bridge_domain_add_del_v2_reply", bd_id=bd_id)
+
+    bridge_domain_add_del_v2 = bridge_domain_add_del
+
+    def bridge_flags(self, bd_id: int, is_set=True, flags=0):
+        bd = self.bridge_domains.get(bd_id)
+        if bd is None:
+            return _reply("bridge_flags_reply", retval=NO_SUCH_ENTRY)
+        for field, flag in BD_FLAG_FIELDS.items():
+            if flags & flag:
+                bd[field] = bool(is_set)
+        bitmap = sum(flag for field, flag in BD_FLAG_FIELDS.items() if bd[field])
+        return _reply("bridge_flags_reply", resulting_feature_bitmap=bitmap)
+
+    def bridge_domain_set_mac_age(self, bd_id: int, mac_age=0):
+        bd = self.bridge_domains.get(bd_id)
+        if bd is None:
+            return _reply("retval_reply", retval=NO_SUCH_ENTRY)
+        bd["mac_age"] = mac_age
+        return _reply("retval_reply")
+
+    def sw_interface_set_l2_bridge(
+        self, rx_sw_if_index: int, bd_id: int = 0, shg=0, port_type=0, enable=True
+    ):
+        if rx_sw_if_index not in self.interfaces:
+            return _reply("retval_reply", retval=INVALID_SW_IF_INDEX)
+        if enable and bd_id not in self.bridge_domains:
+            return _reply("retval_reply", retval=NO_SUCH_ENTRY)
+        bvi = port_type == L2_API_PORT_TYPE.L2_API_PORT_TYPE_BVI
+        if enable and bvi:
+            current = self.bridge_domains[bd_id]["bvi_sw_if_index"]
+            if current not in (INDEX_ANY, rx_sw_if_index):
+                return _reply("retval_reply", retval=BD_ALREADY_HAS_BVI)
+        # An interface is in one bridge domain at most, joining another moves it
+        for bd in self.bridge_domains.values():
+            bd["members"].pop(rx_sw_if_index, None)
+            if bd["bvi_sw_if_index"] == rx_sw_if_index:
+                bd["bvi_sw_if_index"] = INDEX_ANY
+        if enable:
+            self.bridge_domains[bd_id]["members"][rx_sw_if_index] = shg
+            if bvi:
+                self.bridge_domains[bd_id]["bvi_sw_if_index"] = rx_sw_if_index
+        return _reply("retval_reply")
+
+    # bond
+    def sw_bond_interface_dump(self, sw_if_index: int = INDEX_ANY):
+        return [
+            _reply("sw_bond_interface_details", **bond)
+            for bond in self.bonds.values()
+            if sw_if_index in (INDEX_ANY, bond["sw_if_index"])
+        ]
+
+    # ip
+    def ip_table_dump(self):
+        return [
+            _reply(
+                "ip_table_details",
+                table=_reply(
+                    "vl_api_ip_table_t",
+                    table_id=table_id,
+                    is_ip6=is_ip6,
+                    name=f"ipv{6 if is_ip6 else 4}-VRF:{table_id}",
+                ),
+            )
+            for table_id, is_ip6 in self.ip_tables
+        ]
+
+    def ip_route_dump(self, table: Dict = None):
+        table = table or {}
+        key = (table.get("table_id", 0), bool(table.get("is_ip6", False)))
+        reply = []
+        for prefix, (next_hop, sw_if_index) in self.ip_tables.get(key, {}).items():
+            path = _reply(
+                "vl_api_fib_path_t",
+                sw_if_index=sw_if_index,
+                table_id=key[0],
+                weight=1,
+                proto=int(key[1]),
+                nh=_reply("vl_api_fib_path_nh_t", address=_address_union(next_hop)),
+                label_stack=[],
+            )
+            route = _reply(
+                "vl_api_ip_route_t",
+                table_id=key[0],
+                prefix=prefix,
+                n_paths=1,
+                paths=[path],
+            )
+            reply.append(_reply("ip_route_details", route=route))
+        return reply
+
+    def stats_segment(self, threads: int = 2, epoch: int = 1, in_progress: int = 0):
+        """
+        A stats segment for the current interfaces, as bytes
+
+        Counters grow with the sw_if_index, and are spread over the threads,
+        so each interface has its own totals.
+        """
+
+        writer = _StatsSegmentWriter()
+        count = max(self.interfaces, default=-1) + 1
+        names = [
+            self.interfaces[i]["interface_name"] if i in self.interfaces else ""
+            for i in range(count)
+        ]
+
+        def combined(scale: int) -> List[List]:
+            return [
+                [(scale * (i + 1), scale * 64 * (i + 1)) for i in range(count)]
+                for _ in range(threads)
+            ]
+
+        # Scalars are gauges, VPP stores them as plain u64 values
+        entries = [
+            (StatType.SCALAR, 2, "/sys/vector_rate"),
+            (StatType.SCALAR, threads - 1, "/sys/num_worker_threads"),
+            (StatType.NAME_VECTOR, writer.names(names), "/if/names"),
+            (StatType.COMBINED, writer.counters(combined(10), 2), "/if/rx"),
+            (StatType.COMBINED, writer.counters(combined(20), 2), "/if/tx"),
+            (
+                StatType.SIMPLE,
+                writer.counters([list(range(count))] * threads),
+                "/if/drops",
+            ),
+            (StatType.NAME_VECTOR, writer.names(STATS_NODES), "/sys/node/names"),
+        ]
+        for scale, counter in (
+            (1, "calls"),
+            (32, "vectors"),
+            (1000, "clocks"),
+            (0, "suspends"),
+        ):
+            values = [scale * (n + 1) for n in range(len(STATS_NODES))]
+            entries.append(
+                (
+                    StatType.SIMPLE,
+                    writer.counters([values] * threads),
+                    f"/sys/node/{counter}",
+                )
+            )
+        entries.append((StatType.EMPTY, 0, "/err/unused"))
+        for sw_if_index, name in enumerate(names):
+            if name:
+                entries.append(
+                    (StatType.SYMLINK, 3 | sw_if_index << 32, f"/interfaces/{name}/rx")
+                )
+        return writer.finish(entries, epoch, in_progress)
+
+    def write_stats_segment(self, path: str, **kwargs: Any) -> str:
+        """Write stats_segment to a file, which vpp_stats can read as segment"""
+
+        with open(path + ".tmp", "wb") as fh:
+            fh.write(self.stats_segment(**kwargs))
+        os.replace(path + ".tmp", path)
+        return path
+
+    def populate(self, vhost_user: int = 0, bridge_domains: int = 0, routes: int = 0):
+        """
+        Fill the model with vhost-user ports, each in its own bridge domain, and
+        with IPv4 /24 routes in the default table
+        """
+
+        table = self.ip_tables[(0, False)]
+        for n in range(routes):
+            prefix = ipaddress.IPv4Network((0x0A000000 + (n << 8), 24))
+            table[prefix] = (ipaddress.IPv4Address("192.0.2.1"), 0)
+
+        for n in range(bridge_domains):
+            self.bridge_domain_add_del(
+                bd_id=n + 1,
+                flood=True,
+                uu_flood=True,
+                forward=True,
+                learn=True,
+                bd_tag=str(n + 1),
+            )
+        for n in range(vhost_user):
+            sw_if_index = self.create_vhost_user_if(
+                sock_filename=f"/var/sockets/sim-{n}.sock", tag=f"sim-{n}"
+            ).sw_if_index
+            if bridge_domains:
+                bd = self.bridge_domains[n % bridge_domains + 1]
+                bd["members"][sw_if_index] = 0
+
+
+class MeteredVPP:
+    """
+    Wrapper of a SimulatedVPP that counts the API calls made and delays each
+
+    Stands in for the SimulatedVPP it wraps, so benchmarks can see how many
+    round trips a module makes, and what they cost at a given latency.
+    """
+
+    def __init__(self, vpp: SimulatedVPP, latency: float = 0.0):
+        """
+        :param vpp: The simulated VPP to call
+        :param latency: Seconds every call takes at least, as a round trip to
+                        VPP would
+        """
+
+        self.vpp = vpp
+        self.latency = latency
+        self.calls = Counter()
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.vpp, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class SimulatedVPPApiClient:
+    """Drop-in replacement for VPPApiClient backed by a SimulatedVPP"""
+
+    def __init__(self, apifiles: List[str] = None, vpp: SimulatedVPP = None, **kwargs):
+        self.apifiles = apifiles or []
+        self.api = vpp or SimulatedVPP()
+        self.messages: Dict = {}
+        self.connected = False
+
+    def connect(self, name: str, *args: Any, **kwargs: Any) -> int:
+        self.connected = True
+        return 0
+
+    def disconnect(self) -> int:
+        self.connected = False
+        return 0
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import time
+import json
+from typing import Any, Dict
+
+from .vpp_common import VPPSnapshot
+from .vpp_l2 import INDEX_ANY
+
+STATE_VERSION = 1
+
+
+def build_state(connection: Any) -> Dict:
+    """
+    Snapshot of the VPP objects templates refer to, as lookup tables
+
+    Only ids are kept, indexed the way they are looked up: interfaces by name
+    and tag, vhost-user ports by socket, and bridge domains with their members,
+    plus the bridge domain of every member. This keeps the file small and
+    loading it a single json.loads, see load_state.
+
+    :param connection: VPPApiClient instance that holds an active connection
+    """
+
+    snapshot = VPPSnapshot(
+        connection, tables=["interfaces", "vhost_user", "bridge_domains"]
+    )
+
+    interfaces = {}
+    tags = {}
+    for intf in snapshot.records("interfaces"):
+        interfaces[intf.interface_name] = intf.sw_if_index
+        if intf.tag:
+            tags.setdefault(intf.tag, []).append(intf.sw_if_index)
+
+    bridge_domains = {}
+    member_of = {}
+    for bd in snapshot.records("bridge_domains"):
+        members = sorted(member.sw_if_index for member in bd.sw_if_details)
+        bridge_domains[bd.bd_id] = {
+            "tag": bd.bd_tag or "",
+            "bvi": None if bd.bvi_sw_if_index == INDEX_ANY else bd.bvi_sw_if_index,
+            "members": members,
+        }
+        for member in bd.sw_if_details:
+            member_of[member.sw_if_index] = [bd.bd_id, member.shg]
+
+    return {
+        "version": STATE_VERSION,
+        "vpe_pid": connection.api.control_ping().vpe_pid,
+        "taken": int(time.time()),
+        "interfaces": interfaces,
+        "tags": tags,
+        "vhost_user": {
+            vhost.sock_filename: vhost.sw_if_index
+            for vhost in snapshot.records("vhost_user")
+        },
+        "bridge_domains": bridge_domains,
+        "member_of": member_of,
+    }
+
+
+def load_state(data: str) -> Dict:
+    """
+    Parse a snapshot written by build_state
+
+    JSON keys are strings, the tables keyed by an id get their integer keys
+    back, so bridge_domains[100] works in a template.
+
+    :raises ValueError: When the data is not a snapshot of this version
+    """
+
+    state = json.loads(data)
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        raise ValueError("not a VPP state snapshot of a supported version")
+    for table in ("bridge_domains", "member_of"):
+        state[table] = {int(key): value for key, value in state[table].items()}
+    return state
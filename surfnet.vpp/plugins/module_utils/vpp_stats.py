@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import re
+import mmap
+import time
+import array
+import socket
+import struct
+from enum import IntEnum
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from .const import VPP_STATS_SOCKET
+
+# Layout of the stats segment as VPP (version 2) shares it:
+# version, base address, epoch, in_progress, directory vector, error vector
+HEADER = struct.Struct("QPQQPP")
+# type, value (or pointer), name
+ENTRY = struct.Struct("IQ128s")
+# Vectors are preceded by a header that starts with their length, the length
+# sits 8 bytes in front of the data
+VECTOR_LENGTH = struct.Struct("I")
+VECTOR_HEADER = 8
+SEGMENT_VERSION = 2
+
+# Times the reader starts over when VPP changed the segment while reading
+MAX_RETRIES = 100
+
+
+class StatType(IntEnum):
+    ILLEGAL = 0
+    SCALAR = 1
+    SIMPLE = 2
+    COMBINED = 3
+    NAME_VECTOR = 4
+    EMPTY = 5
+    SYMLINK = 6
+
+
+class StatsSegmentError(IOError):
+    """The stats segment could not be mapped or read"""
+
+
+class StatsSegment:
+    """
+    Read only view on the VPP stats segment
+
+    The segment is mapped into this process and counters are read in place,
+    through a memoryview, without going through the binary API. VPP bumps the
+    epoch and raises in_progress while it changes the directory, so every read
+    is repeated until it ran from start to end within a single epoch.
+    """
+
+    def __init__(self, buffer: Any):
+        """
+        :param buffer: mmap (or other buffer) holding the segment
+        """
+
+        self._buffer = buffer
+        self.view = memoryview(buffer)
+        version = self._header()[0]
+        if version != SEGMENT_VERSION:
+            self.close()
+            raise StatsSegmentError(f"Unsupported stats segment version {version}")
+        self._directory = None
+
+    @classmethod
+    def connect(cls, socket_path: str = VPP_STATS_SOCKET) -> "StatsSegment":
+        """Map the segment VPP hands out over its stats socket"""
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            sock.connect(socket_path)
+            _, ancdata, _, _ = sock.recvmsg(0, socket.CMSG_SPACE(4))
+        except OSError as e:
+            raise StatsSegmentError(f"Could not connect to {socket_path}: {e}")
+        finally:
+            sock.close()
+
+        fds = array.array("i")
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[: len(data) - (len(data) % fds.itemsize)])
+        if not fds:
+            raise StatsSegmentError(f"No stats segment received from {socket_path}")
+        return cls._map(fds[0])
+
+    @classmethod
+    def open(cls, path: str) -> "StatsSegment":
+        """Map a file that holds a stats segment, e.g. a copy of one"""
+
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            raise StatsSegmentError(f"Could not open {path}: {e}")
+        return cls._map(fd)
+
+    @classmethod
+    def _map(cls, fd: int) -> "StatsSegment":
+        try:
+            size = os.fstat(fd).st_size
+            buffer = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ)
+        except (OSError, ValueError) as e:
+            raise StatsSegmentError(f"Could not map the stats segment: {e}")
+        finally:
+            os.close(fd)
+        return cls(buffer)
+
+    def close(self) -> None:
+        self.view.release()
+        if hasattr(self._buffer, "close"):
+            self._buffer.close()
+
+    def __enter__(self) -> "StatsSegment":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _header(self) -> Tuple:
+        return HEADER.unpack_from(self.view, 0)
+
+    @property
+    def epoch(self) -> int:
+        return self._header()[2]
+
+    def _offset(self, pointer: int) -> int:
+        """Offset in the segment of a pointer into VPP's mapping of it"""
+
+        offset = pointer - self._header()[1]
+        if offset < VECTOR_HEADER or offset >= len(self.view):
+            raise StatsSegmentError(f"Pointer {pointer:#x} outside the stats segment")
+        return offset
+
+    def _vector(self, pointer: int, width: int = 8) -> memoryview:
+        """A vector of u64 (or pairs of u64, width 16) without copying it"""
+
+        offset = self._offset(pointer)
+        length = VECTOR_LENGTH.unpack_from(self.view, offset - VECTOR_HEADER)[0]
+        end = offset + length * width
+        if end > len(self.view):
+            raise StatsSegmentError(f"Vector at {pointer:#x} beyond the segment")
+        return self.view[offset:end].cast("Q")
+
+    def _string(self, pointer: int) -> Union[str, None]:
+        if not pointer:
+            return None
+        offset = self._offset(pointer)
+        length = VECTOR_LENGTH.unpack_from(self.view, offset - VECTOR_HEADER)[0]
+        raw = self.view[offset : offset + length].tobytes()
+        return raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+    def _entries(self) -> List[Tuple[int, int, str]]:
+        """The directory, (type, value, name) per entry, cached per epoch"""
+
+        header = self._header()
+        if self._directory and self._directory[0] == (header[2], header[4]):
+            return self._directory[1]
+
+        offset = self._offset(header[4])
+        length = VECTOR_LENGTH.unpack_from(self.view, offset - VECTOR_HEADER)[0]
+        entries = []
+        for index in range(length):
+            kind, value, name = ENTRY.unpack_from(
+                self.view, offset + index * ENTRY.size
+            )
+            entries.append((kind, value, name.split(b"\0", 1)[0].decode()))
+        self._directory = ((header[2], header[4]), entries)
+        return entries
+
+    def _simple(self, pointer: int, per_thread: bool) -> List:
+        threads = [self._vector(p) for p in self._vector(pointer) if p]
+        if per_thread:
+            return [t.tolist() for t in threads]
+        if len(threads) == 1:
+            return threads[0].tolist()
+        return [sum(values) for values in zip(*threads)]
+
+    def _combined(self, pointer: int, per_thread: bool) -> List:
+        threads = [self._vector(p, width=16) for p in self._vector(pointer) if p]
+        if per_thread:
+            return [
+                [dict(packets=p, bytes=b) for p, b in zip(t[0::2], t[1::2])]
+                for t in threads
+            ]
+        packets = [sum(values) for values in zip(*(t[0::2] for t in threads))]
+        octets = [sum(values) for values in zip(*(t[1::2] for t in threads))]
+        return [dict(packets=p, bytes=b) for p, b in zip(packets, octets)]
+
+    def _value(
+        self, entries: List, kind: int, value: int, per_thread: bool, targets: Dict
+    ) -> Any:
+        if kind == StatType.SCALAR:
+            # A gauge, held in the entry itself as a u64
+            return value
+        if kind == StatType.SIMPLE:
+            return self._simple(value, per_thread)
+        if kind == StatType.COMBINED:
+            return self._combined(value, per_thread)
+        if kind == StatType.NAME_VECTOR:
+            return [self._string(p) for p in self._vector(value)]
+        if kind == StatType.SYMLINK:
+            # Points at one counter of another entry: entry index, counter index.
+            # Every interface has a few, so each target is read once per dump.
+            entry, counter = value & 0xFFFFFFFF, value >> 32
+            if entry not in targets:
+                target_kind, target_value = entries[entry][:2]
+                targets[entry] = None
+                if target_kind != StatType.SYMLINK:
+                    targets[entry] = self._value(
+                        entries, target_kind, target_value, per_thread, targets
+                    )
+            target = targets[entry]
+            if target is None:
+                return None
+            if per_thread:
+                return [thread[counter] for thread in target]
+            return target[counter]
+        return None
+
+    def ls(self, patterns: Iterable[str] = None) -> List[str]:
+        """The stat paths matching any of the regular expressions"""
+
+        regexes = [re.compile(p) for p in patterns or ()]
+        return [
+            name
+            for kind, _, name in self._entries()
+            if kind not in (StatType.ILLEGAL, StatType.EMPTY)
+            and (not regexes or any(r.search(name) for r in regexes))
+        ]
+
+    def dump(
+        self, patterns: Iterable[str] = None, per_thread: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Read the stats whose path matches any of the regular expressions
+
+        :param patterns: Regular expressions, e.g. ^/if/, all stats when empty
+        :param per_thread: Keep the counters per thread instead of summing them
+        :return: Value per path; an integer for scalars, a list per interface or
+                 node index for counters and a list of names for name vectors
+        :raises StatsSegmentError: When VPP kept changing the segment
+        """
+
+        regexes = [re.compile(p) for p in patterns or ()]
+        for _ in range(MAX_RETRIES):
+            epoch = self._stable_epoch()
+            try:
+                entries = self._entries()
+                targets = {}
+                stats = {
+                    name: self._value(entries, kind, value, per_thread, targets)
+                    for kind, value, name in entries
+                    if kind not in (StatType.ILLEGAL, StatType.EMPTY)
+                    and (not regexes or any(r.search(name) for r in regexes))
+                }
+            except (StatsSegmentError, struct.error, IndexError, ValueError):
+                # Most likely a pointer VPP just replaced, try again
+                stats = None
+            header = self._header()
+            if stats is not None and header[2] == epoch and not header[3]:
+                return stats
+        raise StatsSegmentError("The stats segment kept changing while reading it")
+
+    def _stable_epoch(self) -> int:
+        for _ in range(MAX_RETRIES):
+            header = self._header()
+            if not header[3]:
+                return header[2]
+            time.sleep(0.001)
+        raise StatsSegmentError("The stats segment stays locked by VPP")
+
+
+def _by_index(stats: Dict, prefix: str, names: List) -> List[Dict]:
+    """Turn the counters below a prefix into a record per index"""
+
+    records = [{"name": name} for name in names]
+    for path, values in stats.items():
+        if not path.startswith(prefix) or path == f"{prefix}names":
+            continue
+        if not isinstance(values, list):
+            continue
+        counter = path[len(prefix) :]
+        for record, value in zip(records, values):
+            record[counter] = value
+    return records
+
+
+def interface_stats(stats: Dict) -> List[Dict]:
+    """Counters of /if/ per interface, with the interface name and index"""
+
+    records = _by_index(stats, "/if/", stats.get("/if/names") or [])
+    for sw_if_index, record in enumerate(records):
+        record["sw_if_index"] = sw_if_index
+    return [record for record in records if record["name"] is not None]
+
+
+def node_stats(stats: Dict) -> List[Dict]:
+    """Counters of /sys/node/ per graph node, with vectors per call"""
+
+    records = _by_index(stats, "/sys/node/", stats.get("/sys/node/names") or [])
+    for record in records:
+        if "vectors" in record and "calls" in record:
+            calls = record["calls"]
+            record["vectors_per_call"] = record["vectors"] / calls if calls else 0.0
+    return [record for record in records if record["name"] is not None]
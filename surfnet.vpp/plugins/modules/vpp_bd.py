@@ -19,13 +19,21 @@ from __future__ import absolute_import, division, print_function
 DOCUMENTATION = r"""
 module: vpp_bd
 short_description: Manage VPP broadcast domains
-description: Manage VPP broadcast domains one domain at a time
+description:
+  - Manage VPP broadcast domains one domain at a time, or many at once using I(bds).
+  - In list mode the bridge domain table is dumped once and only the needed
+    calls are sent to VPP.
+  - The flags and MAC age of an existing bridge domain are changed in place,
+    without recreating it. Only the options that are set are changed. Its
+    I(bd_tag) cannot be changed.
 version_added: 0.0.1
 author: SURF B.V. (@surfnet)
 
 options:
     state:
-      description: The operation mode this module is running as.
+      description:
+        - The operation mode this module is running as.
+        - In list mode this is the default for items without a state.
       default: present
       choices:
        - present
@@ -35,20 +43,81 @@ options:
       description: The number of the broadcast domain we are influencing
       type: int
     flood:
-      description: Should the bd support flooding
+      description:
+        - Should the bd support flooding
+        - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
       type: bool
-      default: true
     uu_flood:
-      description: Should the bd support unicast flooding
+      description:
+        - Should the bd support unicast flooding
+        - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
       type: bool
-      default: true
     learn:
-      description: Should the bd support MAC learning
+      description:
+        - Should the bd support MAC learning
+        - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
       type: bool
-      default: true
+    forward:
+      description: Should the bd forward unicast, left alone when not set
+      type: bool
+    arp_term:
+      description: Should the bd terminate ARP requests, left alone when not set
+      type: bool
+    arp_ufwd:
+      description: Should the bd forward unknown ARP requests, left alone when not set
+      type: bool
+    mac_age:
+      description: MAC aging time in minutes, 0 disables aging, left alone when not set
+      type: int
     bd_tag:
       description: Freeform tag to add to bd
       type: str
+    bds:
+      description:
+        - List of broadcast domains to reconcile in one task.
+        - Mutually exclusive with I(bd).
+      type: list
+      elements: dict
+      suboptions:
+        bd:
+          description: The number of the broadcast domain
+          type: int
+        state:
+          description: Whether the broadcast domain should exist, defaults to I(state)
+          type: str
+          choices:
+           - present
+           - absent
+        flood:
+          description:
+            - Should the bd support flooding
+            - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
+          type: bool
+        uu_flood:
+          description:
+            - Should the bd support unicast flooding
+            - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
+          type: bool
+        learn:
+          description:
+            - Should the bd support MAC learning
+            - Defaults to C(true) when the bd is created, left alone on an existing bd when not set.
+          type: bool
+        forward:
+          description: Should the bd forward unicast, left alone when not set
+          type: bool
+        arp_term:
+          description: Should the bd terminate ARP requests, left alone when not set
+          type: bool
+        arp_ufwd:
+          description: Should the bd forward unknown ARP requests, left alone when not set
+          type: bool
+        mac_age:
+          description: MAC aging time in minutes, 0 disables aging, left alone when not set
+          type: int
+        bd_tag:
+          description: Freeform tag to add to bd
+          type: str
 """
 
 EXAMPLES = r"""
@@ -56,68 +125,215 @@ EXAMPLES = r"""
   surfnet.vpp.vpp_bd:
     bd: 1
     bd_tag: Hello world
+
+- name: Turn off learning and age MACs after 5 minutes, without recreating the bd
+  surfnet.vpp.vpp_bd:
+    bd: 1
+    learn: false
+    mac_age: 5
+
+- name: Ensure a set of bridge domains in one task
+  surfnet.vpp.vpp_bd:
+    bds:
+      - bd: 100
+        bd_tag: tenant-a
+      - bd: 101
+        bd_tag: tenant-b
+      - bd: 99
+        state: absent
 """
 
-RETURN = r""" # """
+RETURN = r"""
+results:
+  description: Outcome per bridge domain, only returned in list mode
+  returned: when I(bds) is used
+  type: list
+  elements: dict
+summary:
+  description: Number of bridge domains created, modified, deleted, unchanged and failed
+  returned: when I(bds) is used
+  type: dict
+"""
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
     connect,
     disconnect,
-    get_version,
+    resolve_variants,
     get_error,
     api_available,
+    VPPSnapshot,
+    DeferredWrites,
 )
 from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
     VPPModuleMethods,
+    APIFamilies,
+    BRIDGE_API_FLAGS,
 )
+from typing import Any, Dict, Tuple
 
 __metaclass__ = type
 
+BD_OPTIONS = dict(
+    bd=dict(type="int", required=False, default=None),
+    flood=dict(type="bool", required=False),
+    uu_flood=dict(type="bool", required=False),
+    learn=dict(type="bool", required=False),
+    forward=dict(type="bool", required=False),
+    arp_term=dict(type="bool", required=False),
+    arp_ufwd=dict(type="bool", required=False),
+    mac_age=dict(type="int", required=False),
+    bd_tag=dict(type="str", required=False),
+)
 
-def run_module():
-    module_args = dict(
-        state=dict(
-            type="str",
-            default=VPPModuleMethods.PRESENT,
-            choices=[VPPModuleMethods.PRESENT, VPPModuleMethods.ABSENT],
-        ),
-        bd=dict(type="int", required=False, default=None),
-        flood=dict(type="bool", required=False, default=True),
-        uu_flood=dict(type="bool", required=False, default=True),
-        learn=dict(type="bool", required=False, default=True),
-        bd_tag=dict(type="str", required=False),
-    )
+# Options of an existing bridge domain that bridge_flags changes in place
+BD_FLAGS = {
+    "learn": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_LEARN,
+    "forward": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_FWD,
+    "flood": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_FLOOD,
+    "uu_flood": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_UU_FLOOD,
+    "arp_term": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_ARP_TERM,
+    "arp_ufwd": BRIDGE_API_FLAGS.BRIDGE_API_FLAG_ARP_UFWD,
+}
 
-    result = dict(changed=False, message="")
 
-    ansible_facts = dict()
+def bd_add_del(conn, variants: Dict, **kwargs: Any):
+    """Call the bridge_domain_add_del variant this VPP supports"""
 
-    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+    return getattr(conn.api, variants["bridge_domain_add_del"])(**kwargs)
 
-    if not api_available:
-        module.fail_json(
-            "VPP API could not be loaded. Please make sure vpp-papi is installed."
+
+def bd_flag_changes(spec: Dict, existing_bd: Any) -> Tuple[int, int]:
+    """
+    Flags to set and to clear to bring a bridge domain in line with its spec
+
+    Options that are not set in the spec are left as they are.
+    """
+
+    set_flags = clear_flags = BRIDGE_API_FLAGS.BRIDGE_API_FLAG_NONE
+    for option, flag in BD_FLAGS.items():
+        if spec.get(option) is None:
+            continue
+        if bool(spec[option]) and not getattr(existing_bd, option):
+            set_flags |= flag
+        elif not bool(spec[option]) and getattr(existing_bd, option):
+            clear_flags |= flag
+    return set_flags, clear_flags
+
+
+def update_bd(
+    conn,
+    spec: Dict,
+    existing_bd: Any,
+    snapshot: VPPSnapshot,
+    check_mode: bool,
+    item: Dict,
+) -> Dict:
+    """
+    Change the flags and MAC age of an existing bridge domain in place
+
+    At most one bridge_flags call sets flags, one clears them and one sets the
+    MAC age, so the domain and its L2 FIB stay up.
+    """
+
+    bd_id = existing_bd.bd_id
+    set_flags, clear_flags = bd_flag_changes(spec, existing_bd)
+    mac_age = spec.get("mac_age")
+    if mac_age is not None and mac_age == existing_bd.mac_age:
+        mac_age = None
+
+    notes = []
+    if spec.get("bd_tag") is not None and spec["bd_tag"] != existing_bd.bd_tag:
+        notes.append("bd_tag cannot be changed in place")
+
+    if not set_flags and not clear_flags and mac_age is None:
+        item["message"] = "; ".join(
+            [f"No changes needed for bridge domain {bd_id}"] + notes
+        )
+        return item
+
+    item.update(changed=True, action="modified")
+    changes = [
+        option for option, flag in BD_FLAGS.items() if flag & (set_flags | clear_flags)
+    ] + (["mac_age"] if mac_age is not None else [])
+    item["message"] = "; ".join(
+        [f"Bridge domain {bd_id} updated: {', '.join(changes)}"] + notes
+    )
+    if check_mode:
+        return item
+
+    calls = []
+    if set_flags:
+        calls.append(("bridge_flags", dict(bd_id=bd_id, is_set=True, flags=set_flags)))
+    if clear_flags:
+        calls.append(
+            ("bridge_flags", dict(bd_id=bd_id, is_set=False, flags=clear_flags))
         )
+    if mac_age is not None:
+        calls.append(("bridge_domain_set_mac_age", dict(bd_id=bd_id, mac_age=mac_age)))
 
-    conn = connect()
+    for applied, (funcname, args) in enumerate(calls):
+        vpp_repl = getattr(conn.api, funcname)(**args)
+        if vpp_repl and vpp_repl.retval != 0:
+            name, errid, text = get_error(vpp_repl.retval)
+            item.update(changed=applied > 0, failed=True, action="failed")
+            item[
+                "message"
+            ] = f"Could not update bridge domain {bd_id}: {text} ({errid})"
+            break
 
-    vpp_version = get_version(connection=conn)
+    snapshot.touch("bridge_domains", bd_id)
+    return item
 
-    bd_raw = conn.api.bridge_domain_dump()
 
-    if module.params.get("state") == VPPModuleMethods.PRESENT:
+def reconcile_bd(
+    conn,
+    variants: Dict,
+    spec: Dict,
+    snapshot: VPPSnapshot,
+    check_mode: bool,
+    writes: DeferredWrites = None,
+) -> Dict:
+    """
+    Bring one bridge domain in line with its spec
+
+    :param conn: Reference to the connection
+    :param variants: Messages to use, as returned by resolve_variants
+    :param spec: Desired bridge domain options and state
+    :param snapshot: Snapshot of VPP state, updated with the outcome
+    :param check_mode: Only report what would change
+    :param writes: Queue for a create or delete, the result is only complete
+                   once it is flushed. Without it they are sent right away.
+    :return: Result for this bridge domain
+    """
+
+    bd_id = spec.get("bd")
+    item = dict(
+        bd=bd_id,
+        state=spec["state"],
+        action="unchanged",
+        changed=False,
+        failed=False,
+        message="",
+    )
+    vpp_repl = False
 
-        has_changes = False
+    if spec["state"] == VPPModuleMethods.PRESENT:
         bd_desired_options = {
-            "bd_id": module.params.get("bd"),
-            "flood": module.params.get("flood"),
-            "uu_flood": module.params.get("uu_flood"),
-            "forward": module.params.get("forward"),
-            "learn": module.params.get("learn"),
-            "arp_term": module.params.get("arp_term"),
-            "bd_tag": module.params.get("bd_tag"),
+            "bd_id": bd_id,
+            "flood": spec.get("flood"),
+            "uu_flood": spec.get("uu_flood"),
+            "forward": spec.get("forward"),
+            "learn": spec.get("learn"),
+            "arp_term": spec.get("arp_term"),
+            "arp_ufwd": spec.get("arp_ufwd"),
+            "mac_age": spec.get("mac_age"),
+            "bd_tag": spec.get("bd_tag"),
         }
+        # A new bridge domain floods and learns unless the spec says otherwise
+        for bd_option in ("flood", "uu_flood", "learn"):
+            if bd_desired_options[bd_option] is None:
+                bd_desired_options[bd_option] = True
 
         # Convert passed options to dict, call bridge create/update afterward
         bd_call_args = {}
@@ -127,127 +343,168 @@ def run_module():
             elif bd_desired_options[bd_option] and bd_option == "bd_tag":
                 bd_call_args[bd_option] = str(bd_desired_options[bd_option])
         bd_call_args["is_add"] = 1
-        vpp_repl = False
 
         # Check if we have a fixed bridge domain id (not mandatory in v2 API call)
-        if bd_desired_options["bd_id"]:
-            bd = bd_desired_options["bd_id"]
-            bd_info = {}
-            for ent in bd_raw:
-                if int(ent.bd_id) == int(bd):
-                    bd_info = ent
-            if bd_info:
-                result["message"] = f"Bridge domain {bd} already exists. Not changing"
-                module.exit_json(**result, **ansible_facts)
-                # TODO: Fix handling of adjustments of existing bridge domains
-                # Existing BD, figure out if anything has changed
-                # curr_bd_config = bd_info._asdict()
-                #
-                # Look for changed value for existing option
-                # for curr_bd_opt in curr_bd_config.keys():
-                #    if ( curr_bd_opt in bd_desired_options and
-                #         curr_bd_config[curr_bd_opt] != bd_desired_options[curr_bd_opt]):
-                #        has_changes = True
-                # Look for newly added option that was not defined
-                # for desired_bd_opt in bd_desired_options.keys():
-                #    if desired_bd_opt not in curr_bd_config:
-                #        has_changes = True
-                #
-                # Handle any changes in bridge domain config
-                # if has_changes:
-                #    bridge_flags = BRIDGE_API_FLAGS.BRIDGE_API_FLAG_NONE
-                #    for opt in bd_desired_options.keys():
-                #        if bd_desired_options[opt]:
-                #            if opt == "flood":
-                #                bridge_flags += BRIDGE_API_FLAGS.BRIDGE_API_FLAG_FLOOD
-                #            elif opt == "uu_flood":
-                #                bridge_flags += (
-                #                    BRIDGE_API_FLAGS.BRIDGE_API_FLAG_UU_FLOOD
-                #                )
-                #            elif opt == "forward":
-                #                bridge_flags += BRIDGE_API_FLAGS.BRIDGE_API_FLAG_FWD
-                #            elif opt == "learn":
-                #                bridge_flags += BRIDGE_API_FLAGS.BRIDGE_API_FLAG_LEARN
-                #            elif opt == "arp_term":
-                #                bridge_flags += (
-                #                    BRIDGE_API_FLAGS.BRIDGE_API_FLAG_ARP_TERM
-                #                )
-                #    if not module.check_mode:
-                #        vpp_repl = conn.api.bridge_flags(
-                #            bd_id=bd, is_set=True, flags=bridge_flags
-                #        )
-                # else:
-                #    result["message"] = f"No changes needed for bridge domain {bd}"
-            # New BD with ID set
-            else:
-                has_changes = True
-                if not module.check_mode:
-                    if vpp_version[0] > 22:
-                        vpp_repl = conn.api.bridge_domain_add_del_v2(**bd_call_args)
-                    else:
-                        vpp_repl = conn.api.bridge_domain_add_del(**bd_call_args)
-        else:
-            # New BD
-            has_changes = True
-            if not module.check_mode:
-                if vpp_version[0] > 22:
-                    vpp_repl = conn.api.bridge_domain_add_del_v2(**bd_call_args)
-
-                else:
-                    vpp_repl = conn.api.bridge_domain_add_del(**bd_call_args)
-
-        if not module.check_mode:
+        existing_bd = snapshot.bridge_domain(int(bd_id)) if bd_id else None
+        if existing_bd:
+            return update_bd(conn, spec, existing_bd, snapshot, check_mode, item)
+
+        # New BD, with or without ID set
+        item.update(changed=True, action="created")
+        if check_mode:
+            return item
+
+        def created(vpp_repl: Any) -> Dict:
             if vpp_repl and vpp_repl.retval != 0:
                 name, errid, text = get_error(vpp_repl.retval)
-                module.fail_json(
-                    msg=f"Could not perform action on bridge_domain {module.params.get('bd')}: "
-                    f"{text} ({errid})",
-                    **result,
-                )
-            else:
-                if has_changes:
-                    result["changed"] = True
-                result[
+                item.update(changed=False, failed=True, action="failed")
+                item[
                     "message"
-                ] = f"Bridge domain {bd_desired_options['bd_id']} configured successfully"
-        elif has_changes:
-            result["changed"] = True
-
-    elif module.params.get("state") == VPPModuleMethods.ABSENT:
-        has_changes = False
-        bd_id = module.params.get("bd")
-
-        if bd_id:
-            for entry in bd_raw:
-                if int(entry.bd_id) == int(bd_id):
-                    # We have something to delete
-                    has_changes = True
-                    if not module.check_mode:
-                        if vpp_version[0] > 22:
-                            vpp_repl = conn.api.bridge_domain_add_del_v2(
-                                bd_id=bd_id, is_add=False
-                            )
-                        else:
-                            vpp_repl = conn.api.bridge_domain_add_del(
-                                bd_id=bd_id, is_add=False
-                            )
-
-            if not module.check_mode and has_changes:
-                if vpp_repl and vpp_repl.retval != 0:
-                    name, errid, text = get_error(vpp_repl.retval)
-                    module.fail_json(
-                        msg=f"Could not delete bridge domain {bd_id}: {text} ({errid})"
-                    )
-                else:
-                    result["changed"] = True
-                    result[
-                        "message"
-                    ] = f"Bridge domain {bd_id} has been deleted successfully"
+                ] = f"Could not perform action on bridge_domain {bd_id}: {text} ({errid})"
+                return item
 
-    module.exit_json(**result, **ansible_facts)
+            # The v2 call hands out an id when none was requested
+            new_id = bd_id or getattr(vpp_repl, "bd_id", None)
+            item["bd"] = new_id
+            if new_id:
+                snapshot.touch("bridge_domains", int(new_id))
+            item[
+                "message"
+            ] = f"Bridge domain {bd_desired_options['bd_id']} configured successfully"
+            return item
+
+        if writes is None:
+            return created(bd_add_del(conn, variants, **bd_call_args))
+        writes.add(variants["bridge_domain_add_del"], bd_call_args, created, [bd_id])
+
+    elif spec["state"] == VPPModuleMethods.ABSENT:
+        if not bd_id or not snapshot.bridge_domain(int(bd_id)):
+            return item
+
+        # We have something to delete
+        item.update(changed=True, action="deleted")
+        if check_mode:
+            return item
+
+        def deleted(vpp_repl: Any) -> Dict:
+            if vpp_repl and vpp_repl.retval != 0:
+                name, errid, text = get_error(vpp_repl.retval)
+                item.update(changed=False, failed=True, action="failed")
+                item[
+                    "message"
+                ] = f"Could not delete bridge domain {bd_id}: {text} ({errid})"
+                return item
+
+            snapshot.discard("bridge_domains", int(bd_id))
+            item["message"] = f"Bridge domain {bd_id} has been deleted successfully"
+            return item
+
+        kwargs = dict(bd_id=bd_id, is_add=False)
+        if writes is None:
+            return deleted(bd_add_del(conn, variants, **kwargs))
+        writes.add(variants["bridge_domain_add_del"], kwargs, deleted, [bd_id])
+
+    return item
+
+
+def run_module():
+    module_args = dict(
+        state=dict(
+            type="str",
+            default=VPPModuleMethods.PRESENT,
+            choices=[VPPModuleMethods.PRESENT, VPPModuleMethods.ABSENT],
+        ),
+        bds=dict(
+            type="list",
+            elements="dict",
+            required=False,
+            options=dict(
+                state=dict(
+                    type="str",
+                    required=False,
+                    choices=[VPPModuleMethods.PRESENT, VPPModuleMethods.ABSENT],
+                ),
+                **BD_OPTIONS,
+            ),
+        ),
+        **BD_OPTIONS,
+    )
+
+    result = dict(changed=False, message="")
+
+    ansible_facts = dict()
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        mutually_exclusive=[["bd", "bds"]],
+        supports_check_mode=True,
+    )
+
+    if not api_available:
+        module.fail_json(
+            "VPP API could not be loaded. Please make sure vpp-papi is installed."
+        )
+
+    conn = connect(
+        families=APIFamilies.BD,
+        messages=[
+            "bridge_domain_dump",
+            "bridge_domain_add_del",
+            "bridge_flags",
+            "bridge_domain_set_mac_age",
+        ],
+    )
+
+    variants = resolve_variants(conn)
+
+    # One dump for the whole run, indexed so every lookup is O(1)
+    snapshot = VPPSnapshot(conn, tables=["bridge_domains"])
+
+    if module.params.get("bds") is None:
+        spec = dict(module.params)
+        item = reconcile_bd(conn, variants, spec, snapshot, module.check_mode)
+        disconnect(connection=conn)
+
+        result["changed"] = item["changed"]
+        result["message"] = item["message"]
+        if item["failed"]:
+            result["changed"] = False
+            module.fail_json(msg=item["message"], **result)
+        module.exit_json(**result, **ansible_facts)
+
+    # Creates and deletes go out pipelined, see DeferredWrites
+    writes = DeferredWrites(conn)
+    results = []
+    for spec in module.params["bds"]:
+        spec = dict(spec)
+        if spec.get("state") is None:
+            spec["state"] = module.params["state"]
+
+        if writes.touches([spec.get("bd")]):
+            writes.flush()
+        results.append(
+            reconcile_bd(conn, variants, spec, snapshot, module.check_mode, writes)
+        )
+    writes.flush()
 
     disconnect(connection=conn)
 
+    summary = dict(created=0, modified=0, deleted=0, unchanged=0, failed=0)
+    for item in results:
+        summary[item["action"]] += 1
+
+    result["changed"] = any(item["changed"] for item in results)
+    result["results"] = results
+    result["summary"] = summary
+    result["message"] = ", ".join(f"{v} {k}" for k, v in summary.items())
+    if summary["failed"]:
+        module.fail_json(
+            msg=f"{summary['failed']} of {len(results)} bridge domains failed",
+            **result,
+        )
+
+    module.exit_json(**result, **ansible_facts)
+
 
 def main():
     run_module()
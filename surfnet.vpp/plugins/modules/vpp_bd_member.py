@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+DOCUMENTATION = r"""
+module: vpp_bd_member
+short_description: Manage the member interfaces of VPP bridge domains
+description:
+  - Set which interfaces are in a bridge domain, with their split horizon
+    group, and which interface is its BVI, for many bridge domains at once.
+  - The bridge domains are dumped once and their members compared with the
+    desired ones, so only the needed attach and detach calls are sent, all on
+    one connection.
+version_added: 1.0.0
+author: SURF B.V. (@surfnet)
+
+options:
+    bridge_domains:
+      description: Desired membership per bridge domain
+      type: list
+      elements: dict
+      required: true
+      suboptions:
+        bd:
+          description: The number of the broadcast domain, it must exist
+          type: int
+          required: true
+        members:
+          description: Member interfaces, by I(interface) name or I(sw_if_index)
+          type: list
+          elements: dict
+          default: []
+          suboptions:
+            interface:
+              description: Name of the interface
+              type: str
+            sw_if_index:
+              description: Index of the interface
+              type: int
+            shg:
+              description: Split horizon group
+              type: int
+              default: 0
+        bvi:
+          description: Name or sw_if_index of the BVI interface of the bridge domain
+          type: str
+    exclusive:
+      description:
+        - Detach the members (and BVI) of the listed bridge domains that are not
+          listed.
+        - Bridge domains that are not listed are never changed, apart from losing
+          interfaces that move to a listed one.
+      type: bool
+      default: true
+extends_documentation_fragment:
+  - surfnet.vpp.vpp_journal
+"""
+
+EXAMPLES = r"""
+- name: Two VMs in bridge domain 100, with loop0 as BVI
+  surfnet.vpp.vpp_bd_member:
+    bridge_domains:
+      - bd: 100
+        bvi: loop0
+        members:
+          - interface: VirtualEthernet0/0/0
+          - interface: VirtualEthernet0/0/1
+            shg: 1
+
+- name: Add an interface, leave the other members alone
+  surfnet.vpp.vpp_bd_member:
+    exclusive: false
+    bridge_domains:
+      - bd: 100
+        members:
+          - sw_if_index: 12
+"""
+
+RETURN = r"""
+plan:
+  description: The changes, in the order they were (or in check mode would be) made
+  returned: always
+  type: list
+  elements: str
+  sample:
+    - detach VirtualEthernet0/0/4
+    - attach VirtualEthernet0/0/1 to bridge domain 100
+    - attach loop0 BVI of bridge domain 100
+summary:
+  description: Number of attach and detach calls
+  returned: always
+  type: dict
+applied:
+  description: Number of changes made, less than the length of the plan when one failed
+  returned: always
+  type: int
+resumed:
+  description: Whether the plan of an unfinished earlier run was resumed
+  returned: always
+  type: bool
+rolled_back:
+  description: Number of changes reverted
+  returned: when a change failed and rollback is set
+  type: int
+"""
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
+    connect,
+    disconnect,
+    resolve_variants,
+    api_available,
+    VPPSnapshot,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_l2 import (
+    plan_membership,
+    describe,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_journal import (
+    journal_path,
+    open_journal,
+    run_journaled,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_delta import (
+    options_digest,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
+    APIFamilies,
+)
+
+__metaclass__ = type
+
+
+def run_module():
+    module_args = dict(
+        bridge_domains=dict(
+            type="list",
+            elements="dict",
+            required=True,
+            options=dict(
+                bd=dict(type="int", required=True),
+                members=dict(
+                    type="list",
+                    elements="dict",
+                    required=False,
+                    default=[],
+                    options=dict(
+                        interface=dict(type="str", required=False),
+                        sw_if_index=dict(type="int", required=False),
+                        shg=dict(type="int", required=False, default=0),
+                    ),
+                    mutually_exclusive=[["interface", "sw_if_index"]],
+                    required_one_of=[["interface", "sw_if_index"]],
+                ),
+                bvi=dict(type="str", required=False),
+            ),
+        ),
+        exclusive=dict(type="bool", required=False, default=True),
+        journal=dict(type="str", required=False),
+        rollback=dict(type="bool", required=False, default=False),
+    )
+
+    result = dict(changed=False, message="", plan=[], applied=0, resumed=False)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    if not api_available():
+        module.fail_json(
+            "VPP API could not be loaded. Please make sure vpp-papi is installed."
+        )
+
+    path = None
+    if module.params["journal"] is not None:
+        try:
+            path = journal_path(module.params["journal"])
+        except ValueError as e:
+            module.fail_json(msg=str(e), **result)
+
+    conn = connect(
+        families=APIFamilies.BD + ["interface"],
+        messages=[
+            "bridge_domain_dump",
+            "sw_interface_dump",
+            "sw_interface_set_l2_bridge",
+        ],
+    )
+
+    variants = resolve_variants(conn)
+
+    # A journal of an unfinished run of the same declaration is resumed as is
+    vpe_pid = conn.api.control_ping().vpe_pid
+    digest = options_digest(
+        [module.params[key] for key in ("bridge_domains", "exclusive")]
+    )
+    journal, reason = open_journal(path, vpe_pid, digest)
+    if reason:
+        module.warn(f"Not resuming journal {path}: {reason}")
+
+    result["resumed"] = journal is not None
+    snapshot = None
+    if journal:
+        plan = [journal.steps[position] for position in journal.pending()]
+    else:
+        # One dump of each table, every lookup after that is a dict access
+        snapshot = VPPSnapshot(conn, tables=["bridge_domains", "interfaces"])
+
+        try:
+            plan = plan_membership(
+                snapshot, module.params["bridge_domains"], module.params["exclusive"]
+            )
+        except ValueError as e:
+            disconnect(connection=conn)
+            module.fail_json(msg=str(e), **result)
+
+    result["plan"] = [describe(step) for step in plan]
+    result["summary"] = {
+        action: sum(1 for step in plan if step.action == action)
+        for action in ("attach", "detach")
+    }
+    result["changed"] = bool(plan)
+
+    if not plan or module.check_mode:
+        disconnect(connection=conn)
+        result["message"] = f"{len(plan)} changes" if plan else "No changes needed"
+        module.exit_json(**result)
+
+    try:
+        error = run_journaled(
+            conn,
+            variants,
+            plan,
+            journal,
+            snapshot,
+            path,
+            vpe_pid,
+            digest,
+            module.params["rollback"],
+            result,
+        )
+    except (IOError, OSError) as e:
+        disconnect(connection=conn)
+        module.fail_json(msg=f"Cannot write journal {path}: {e}", **result)
+    disconnect(connection=conn)
+    if error:
+        module.fail_json(msg=error, **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
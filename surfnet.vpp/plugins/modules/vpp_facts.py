@@ -34,9 +34,28 @@ options:
       type: bool
       default: false
     filter:
-      description: Show a specific filter
-      type: str
-      default: ""
+      description:
+        - Dumps to gather, as a list or a comma separated string.
+        - Gathers the common dumps when empty, unknown dumps are ignored.
+      type: list
+      elements: str
+      default: []
+    where:
+      description:
+        - Only return the records of a dump that match all of its conditions,
+          keyed by dump name.
+        - Every condition has a I(field) (nested fields by their path, a list
+          along the path matches when any of its elements does), an I(op) and
+          a I(value).
+        - Records are tested as they are read from VPP, so records that do not
+          match are never held in memory or converted.
+        - Where VPP can do the filtering itself, the condition is also passed
+          in the arguments of the dump, so those records never cross the API.
+          This is done for C(sw_if_index) of C(sw_interface_dump),
+          C(sw_interface_vhost_user_dump) and C(sw_bond_interface_dump),
+          C(interface_name) of C(sw_interface_dump) (C(eq) and C(glob)) and
+          C(bd_id) of C(bridge_domain_dump).
+      type: dict
     sorting:
       description: How do sort facts
       type: str
@@ -45,18 +64,260 @@ options:
         - desc
         - ""
       default: ""
+    fields:
+      description:
+        - Only return these fields of the records of a dump, keyed by dump name.
+        - Fields are given as a list, or as a comma separated string. Nested
+          fields are selected by their path, for example C(route.prefix).
+        - Fields keep their native type (integers stay integers), also for the
+          dumps that are otherwise returned as strings.
+        - Fields that are not selected are never converted, which makes large
+          dumps a lot cheaper to gather.
+      type: dict
+    sort:
+      description:
+        - Order the records of a dump, keyed by dump name. Applied after I(where).
+        - Fields are given as a list or a comma separated string, the first
+          field sorts first. Prefix a field with C(-) to sort it in descending
+          order. Nested fields are given by their path, for example
+          C(route.prefix). Addresses and prefixes sort numerically.
+        - Records are ordered before they are converted, so with I(limit) only
+          the selected records are converted at all.
+      type: dict
+    limit:
+      description:
+        - Return at most this many records of every dump.
+        - With I(sort), the first records are taken with a bounded heap
+          instead of sorting the whole dump.
+      type: int
+    offset:
+      description:
+        - Skip this many records of every dump, to page through large dumps
+          together with I(limit).
+      type: int
+      default: 0
+    concurrency:
+      description:
+        - Number of VPP API connections used to run the dumps in parallel.
+        - The default of 1 runs all dumps one after the other on a single connection.
+        - Each extra connection loads the API definitions again, so this pays off
+          for large tables or many dumps, for example with I(all).
+      type: int
+      default: 1
+    fingerprint:
+      description:
+        - Also return a fingerprint of the VPP state as I(vpp_fingerprint).
+        - With C(only), return just the fingerprint and gather no facts.
+        - Used by the action plugin to validate cached facts.
+      type: str
+      choices:
+        - skip
+        - include
+        - only
+      default: skip
+    snapshot:
+      description:
+        - Also return a snapshot of the ids of interfaces, vhost-user ports and
+          bridge domains as I(vpp_snapshot), see the C(surfnet.vpp.vpp_state)
+          vars plugin.
+        - With C(only), return just the snapshot and gather no facts.
+        - The action plugin writes the snapshot to I(snapshot_dir) on the
+          controller and returns its path as I(vpp_snapshot_file) instead.
+      type: str
+      choices:
+        - skip
+        - include
+        - only
+      default: skip
+    snapshot_dir:
+      description:
+        - Directory on the controller to write the snapshot to, as
+          C(<inventory_hostname>.json).
+        - Defaults to the C(snapshot_dir) option of the vars plugin.
+        - Handled by the action plugin, the module itself ignores this option.
+      type: path
+    cache:
+      description:
+        - Cache the facts on the controller with the C(surfnet.vpp.vpp_facts) cache plugin.
+        - Facts are stored per host and per group of I(GatherDetails). Cached facts are
+          used until they are older than I(cache_ttl), or the fingerprint of the VPP
+          state no longer matches the one they were stored with.
+        - Handled by the action plugin, the module itself ignores this option.
+      type: bool
+      default: false
+    cache_ttl:
+      description:
+        - Seconds cached facts stay valid, 0 never expires them.
+        - Defaults to the C(_timeout) option of the cache plugin.
+      type: int
+    cache_dir:
+      description:
+        - Directory on the controller to store the cache in.
+        - Defaults to the C(_uri) option of the cache plugin.
+      type: path
+    export_dir:
+      description:
+        - Write the facts to JSON-lines files in this directory on the target,
+          instead of returning them.
+        - Records are streamed from VPP and written one at a time, so tables
+          of any size can be exported. Route dumps (for example C(ip_route_dump)
+          and C(mpls_route_dump)) are written per table, one file each.
+        - Only a manifest of the files written is returned, as I(vpp_export).
+      type: path
+    export_prefixes:
+      description:
+        - Split exported unicast routes further into one file per prefix range
+          and table. Routes outside of every range are not exported.
+        - Only used together with I(export_dir).
+      type: list
+      elements: str
+    delta:
+      description:
+        - Only return the records that were added, changed or removed since the
+          previous run, as I(vpp_delta).
+        - A fingerprint per record is kept on the target in I(delta_store).
+          Records are matched by their key, such as C(sw_if_index), C(bd_id)
+          or the table and prefix of a route.
+        - Everything is returned as added when there is no store yet, when VPP
+          restarted since or when I(fields), I(where), I(sort), I(limit) or
+          I(offset) changed, see I(vpp_delta_resync).
+        - The store is not updated in check mode.
+      type: bool
+      default: false
+    delta_store:
+      description: File on the target that holds the fingerprints for I(delta)
+      type: path
+      default: /var/cache/ansible-vpp/vpp_facts_delta.json
 """
 
 EXAMPLES = r"""
 - name: Gather all VPP facts
   surfnet.vpp.vpp_facts:
     all: true
+
+- name: Gather interface names and indexes, and bridge domains with their members
+  surfnet.vpp.vpp_facts:
+    fields:
+      sw_interface_dump: sw_if_index,interface_name
+      bridge_domain_dump:
+        - bd_id
+        - sw_if_details.sw_if_index
+
+- name: Gather the vhost-user interfaces of tenant a, and bridge domains 100 to 199
+  surfnet.vpp.vpp_facts:
+    filter: sw_interface_dump,bridge_domain_dump
+    where:
+      sw_interface_dump:
+        - field: interface_dev_type
+          value: vhost-user
+        - field: tag
+          op: glob
+          value: tenant-a-*
+      bridge_domain_dump:
+        - field: bd_id
+          op: range
+          value: [100, 199]
+
+- name: Gather the 50 most recently created vhost-user ports
+  surfnet.vpp.vpp_facts:
+    filter: sw_interface_vhost_user_dump
+    sort:
+      sw_interface_vhost_user_dump: -sw_if_index
+    limit: 50
+
+- name: Gather all VPP facts over four connections
+  surfnet.vpp.vpp_facts:
+    all: true
+    concurrency: 4
+
+- name: Gather the common facts, reusing them while VPP state is unchanged
+  surfnet.vpp.vpp_facts:
+    cache: true
+    cache_ttl: 3600
+
+- name: Write the VPP object ids for the surfnet.vpp.vpp_state vars plugin
+  surfnet.vpp.vpp_facts:
+    snapshot: only
+
+- name: Export the routing tables to /var/tmp/vpp-routes, in two prefix ranges
+  surfnet.vpp.vpp_facts:
+    filter: ip_route_dump
+    export_dir: /var/tmp/vpp-routes
+    export_prefixes:
+      - 10.0.0.0/8
+      - 2001:db8::/32
+
+- name: Gather what changed in interfaces and bridge domains since the last run
+  surfnet.vpp.vpp_facts:
+    filter: sw_interface_dump,bridge_domain_dump
+    delta: true
 """
 
-RETURN = r""" # """
+RETURN = r"""
+vpp_fingerprint:
+    description: Fingerprint of the VPP state, see I(fingerprint)
+    type: str
+    returned: when fingerprint is include or only
+    sample: 5b1f0e2a9c7d3e41
+vpp_snapshot_file:
+    description: Path of the snapshot on the controller, see I(snapshot)
+    type: str
+    returned: when snapshot is include or only
+    sample: /home/ansible/.ansible/vpp_state/vpp1.json
+cached:
+    description: Whether the facts were served from the cache
+    type: bool
+    returned: when cache is true
+vpp_export:
+    description: Manifest of an export, see I(export_dir)
+    type: dict
+    returned: when export_dir is set
+    contains:
+        directory:
+            description: Directory the files were written to
+            type: str
+        files:
+            description: One entry per file, with the dump, table and prefix range it
+                holds, its path and the number of records in it
+            type: list
+            elements: dict
+            sample:
+                - dump: ip_route_dump
+                  table: ip4-0
+                  prefix: 10.0.0.0/8
+                  path: /var/tmp/vpp-routes/ip_route_dump.ip4-0.10.0.0.0_8.jsonl
+                  count: 912345
+        records:
+            description: Total number of records written
+            type: int
+        skipped:
+            description: Dumps this VPP does not support
+            type: list
+            elements: str
+vpp_delta:
+    description:
+      - Changes per dump since the previous run, see I(delta). Removed records
+        are given by their key fields.
+    type: dict
+    returned: when delta is true
+    sample:
+        sw_interface_dump:
+            added:
+                - interface_name: VirtualEthernet0/0/7
+                  sw_if_index: "8"
+            changed: []
+            removed:
+                - sw_if_index: "5"
+vpp_delta_resync:
+    description:
+      - Whether I(vpp_delta) holds all records instead of the changes, the
+        reason is in I(message).
+    type: bool
+    returned: when delta is true
+"""
 
+import ipaddress
 from ansible.module_utils.basic import AnsibleModule
-from copy import deepcopy
 from typing import Union, List
 
 __metaclass__ = type
@@ -64,14 +325,42 @@ __metaclass__ = type
 from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
     connect,
     disconnect,
-    get_version,
     to_vpp,
+    to_vpp_concurrent,
     format_fact,
+    dump_records,
+    select_records,
+    stream_dump,
+    gather_families,
     api_available,
+    state_fingerprint,
 )
 from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
     VPPModuleMethods,
     GatherDetails,
+    APIFamilies,
+    FactFormats,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_export import (
+    export_facts,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_serializer import (
+    load_serializers,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_delta import (
+    VPP_DELTA_STORE,
+    delta,
+    load_store,
+    save_store,
+    resync_reason,
+    options_digest,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_filter import (
+    compile_where,
+    pushdown,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_state import (
+    build_state,
 )
 
 
@@ -81,8 +370,26 @@ def run_module():
             type="str", default=VPPModuleMethods.GET, choices=[VPPModuleMethods.GET]
         ),
         all=dict(type="bool", required=False, default=False),
-        filter=dict(type="str", required=False, default=""),
+        filter=dict(type="list", elements="str", required=False, default=[]),
+        where=dict(type="dict", required=False),
         sorting=dict(type="str", default="", choices=["", "asc", "desc"]),
+        fields=dict(type="dict", required=False),
+        sort=dict(type="dict", required=False),
+        limit=dict(type="int", required=False),
+        offset=dict(type="int", required=False, default=0),
+        concurrency=dict(type="int", required=False, default=1),
+        fingerprint=dict(
+            type="str", default="skip", choices=["skip", "include", "only"]
+        ),
+        snapshot=dict(type="str", default="skip", choices=["skip", "include", "only"]),
+        snapshot_dir=dict(type="path", required=False),
+        cache=dict(type="bool", required=False, default=False),
+        cache_ttl=dict(type="int", required=False),
+        cache_dir=dict(type="path", required=False),
+        export_dir=dict(type="path", required=False),
+        export_prefixes=dict(type="list", elements="str", required=False),
+        delta=dict(type="bool", required=False, default=False),
+        delta_store=dict(type="path", required=False, default=VPP_DELTA_STORE),
     )
 
     result = dict(changed=False, message="")
@@ -94,7 +401,7 @@ def run_module():
     def _compile_filter(input_filter: Union[List, str]) -> List:
         """Formats a filter (user input) into something we can understand"""
         # Check if we have this in our list of queries
-        filtered_list = list
+        filtered_list = []
         if isinstance(input_filter, str):
             if input_filter in GatherDetails.ALL:
                 filtered_list = [input_filter]
@@ -109,39 +416,230 @@ def run_module():
             "VPP API could not be loaded. Please make sure vpp-papi is installed."
         )
 
-    conn = connect()
-
-    vpp_version = get_version(connection=conn)
-
     # Find what stats we are going to grab
     if module.params["all"]:
         fact_filter = GatherDetails.ALL
-    elif module.params["filter"] == "":
+    elif not module.params["filter"]:
         fact_filter = GatherDetails.COMMON
     else:
         fact_filter = _compile_filter(module.params["filter"])
 
+    if module.params["concurrency"] < 1:
+        module.fail_json(msg="concurrency must be 1 or more", **result)
+
+    fields = {}
+    for dump, dump_fields in (module.params["fields"] or {}).items():
+        if dump not in GatherDetails.ALL:
+            module.fail_json(msg=f"Unknown dump {dump} in fields", **result)
+        if isinstance(dump_fields, str):
+            dump_fields = dump_fields.split(",")
+        fields[dump] = [str(field).strip() for field in dump_fields if field]
+
+    where = {}
+    for dump, conditions in (module.params["where"] or {}).items():
+        if dump not in GatherDetails.ALL:
+            module.fail_json(msg=f"Unknown dump {dump} in where", **result)
+        if isinstance(conditions, dict):
+            conditions = [conditions]
+        try:
+            if not all(isinstance(c, dict) and "field" in c for c in conditions):
+                raise ValueError("every condition needs a field")
+            where[dump] = (compile_where(conditions), pushdown(dump, conditions))
+        except (ValueError, TypeError) as e:
+            module.fail_json(msg=f"Invalid condition for {dump}: {e}", **result)
+
+    sort = {}
+    for dump, dump_sort in (module.params["sort"] or {}).items():
+        if dump not in GatherDetails.ALL:
+            module.fail_json(msg=f"Unknown dump {dump} in sort", **result)
+        if isinstance(dump_sort, str):
+            dump_sort = dump_sort.split(",")
+        sort[dump] = [str(field).strip() for field in dump_sort if field]
+
+    if (module.params["limit"] or 0) < 0 or module.params["offset"] < 0:
+        module.fail_json(msg="limit and offset must be 0 or more", **result)
+    paging = bool(sort) or module.params["limit"] is not None or module.params["offset"]
+
+    if module.params["delta"] and module.params["export_dir"]:
+        module.fail_json(msg="delta cannot be combined with export_dir", **result)
+
+    for prefix in module.params["export_prefixes"] or []:
+        try:
+            ipaddress.ip_network(prefix, strict=False)
+        except ValueError as e:
+            module.fail_json(msg=f"Invalid prefix range {prefix}: {e}", **result)
+
+    if module.params["snapshot"] == "only":
+        conn = connect(
+            families=APIFamilies.STATE,
+            messages=[
+                "sw_interface_dump",
+                "sw_interface_vhost_user_dump",
+                "bridge_domain_dump",
+            ],
+        )
+        result["vpp_snapshot"] = build_state(conn)
+        disconnect(connection=conn)
+        module.exit_json(**result)
+
+    if module.params["fingerprint"] == "only":
+        conn = connect(
+            families=APIFamilies.FINGERPRINT,
+            messages=["sw_interface_dump", "bridge_domain_dump"],
+        )
+        result["vpp_fingerprint"] = state_fingerprint(conn)
+        disconnect(connection=conn)
+        module.exit_json(**result)
+
+    # Gathering everything needs the full set of definitions anyway
+    if module.params["all"]:
+        connect_args = {}
+    else:
+        connect_args = dict(families=gather_families(fact_filter), messages=fact_filter)
+    if module.params["fingerprint"] == "include" and connect_args:
+        connect_args["families"] += [
+            f for f in APIFamilies.FINGERPRINT if f not in connect_args["families"]
+        ]
+        connect_args["messages"] = list(fact_filter) + [
+            "sw_interface_dump",
+            "bridge_domain_dump",
+        ]
+    if module.params["snapshot"] == "include" and connect_args:
+        connect_args["families"] += [
+            f for f in APIFamilies.STATE if f not in connect_args["families"]
+        ]
+        connect_args["messages"] = list(connect_args["messages"]) + [
+            "sw_interface_dump",
+            "sw_interface_vhost_user_dump",
+            "bridge_domain_dump",
+        ]
+    conn = connect(**connect_args)
+
+    # Taken before the dumps, so a change while gathering invalidates the cache
+    if module.params["fingerprint"] == "include":
+        result["vpp_fingerprint"] = state_fingerprint(conn)
+    if module.params["snapshot"] == "include":
+        result["vpp_snapshot"] = build_state(conn)
+
+    # Converters for the dumps FactFormats does not cover
+    serializers = None
+    if module.params["export_dir"] or fields or set(fact_filter) - set(FactFormats):
+        serializers = load_serializers(conn)
+
+    for dump, dump_fields in fields.items():
+        try:
+            serializers.for_dump(dump, dump_fields)
+        except ValueError as e:
+            disconnect(connection=conn)
+            module.fail_json(msg=f"Invalid fields for {dump}: {e}", **result)
+
+    if module.params["export_dir"]:
+        try:
+            result["vpp_export"] = export_facts(
+                conn,
+                fact_filter,
+                module.params["export_dir"],
+                module.params["export_prefixes"],
+                serializers,
+                fields,
+                where,
+            )
+        except (IOError, OSError) as e:
+            disconnect(connection=conn)
+            module.fail_json(msg=f"Export failed: {e}", **result)
+        disconnect(connection=conn)
+        module.exit_json(**result)
+
+    # Run the dumps in parallel, the replies are formatted in order below
+    replies = {}
+    if module.params["concurrency"] > 1:
+        try:
+            replies = to_vpp_concurrent(
+                [str(apicmd) for apicmd in fact_filter if apicmd not in where],
+                module.params["concurrency"],
+                **connect_args,
+            )
+        except (IOError, OSError) as e:
+            disconnect(connection=conn)
+            module.fail_json(msg=f"Parallel dumps failed: {e}", **result)
+
     fact_gatherer = {}
     for apicmd in fact_filter:
-        cmd_result = to_vpp(conn, str(apicmd))
+        if apicmd in where:
+            # Filter while streaming, records that do not match are dropped
+            matches, arguments = where[apicmd]
+            try:
+                cmd_result = dict(
+                    retval=0,
+                    value=list(filter(matches, stream_dump(conn, apicmd, **arguments))),
+                )
+            except AttributeError as e:
+                disconnect(connection=conn)
+                module.fail_json(msg=f"Cannot filter {apicmd}: {e}", **result)
+        else:
+            cmd_result = replies.get(str(apicmd)) or to_vpp(conn, str(apicmd))
         if cmd_result["retval"] == 0:
             fact_name = f"vpp_{apicmd}"
-            fact_gatherer.update({fact_name: format_fact(cmd_result["value"], apicmd)})
+            records = dump_records(cmd_result["value"])
+            if paging and isinstance(records, list):
+                try:
+                    records = select_records(
+                        records,
+                        sort.get(apicmd),
+                        module.params["limit"],
+                        module.params["offset"],
+                    )
+                except AttributeError as e:
+                    disconnect(connection=conn)
+                    module.fail_json(
+                        msg=f"Cannot sort {apicmd}, no field {e.name}", **result
+                    )
+            fact_gatherer.update(
+                {
+                    fact_name: format_fact(
+                        records, apicmd, serializers, fields.get(apicmd)
+                    )
+                }
+            )
 
-    unsorted_facts = fact_gatherer
-    sorted_facts = dict
+    if module.params["delta"]:
+        # Anything that changes which records are returned, or their shape
+        options = {
+            name: module.params[name]
+            for name in ("fields", "where", "sort", "limit", "offset")
+        }
+        vpe_pid = conn.api.control_ping().vpe_pid
+        store = load_store(module.params["delta_store"])
+        reason = resync_reason(store, vpe_pid, options_digest(options))
+        if reason:
+            store = dict(vpe_pid=vpe_pid, options=options_digest(options), dumps={})
 
-    # Sort the facts if we need to
-    if module.params["sorting"] == "asc":
-        unsorted_facts = deepcopy(fact_gatherer)
-        sorted_facts = dict(sorted(unsorted_facts.items()))
-    elif module.params["sorting"] == "desc":
-        unsorted_facts = deepcopy(fact_gatherer)
-        sorted_facts = dict(sorted(unsorted_facts.items(), reverse=True))
+        changes = {}
+        for fact_name, records in fact_gatherer.items():
+            dump = fact_name[len("vpp_") :]
+            changes[dump], store["dumps"][dump] = delta(
+                dump, records, store["dumps"].get(dump)
+            )
 
-    ansible_facts = unsorted_facts if module.params["sorting"] == "" else sorted_facts
+        if not module.check_mode:
+            try:
+                save_store(module.params["delta_store"], store)
+            except (IOError, OSError) as e:
+                disconnect(connection=conn)
+                module.fail_json(msg=f"Could not save the delta store: {e}", **result)
+
+        disconnect(connection=conn)
+        result["message"] = reason
+        module.exit_json(**result, vpp_delta=changes, vpp_delta_resync=bool(reason))
+
+    # Sort the facts if we need to, only the order of the keys changes
+    ansible_facts = fact_gatherer
+    if module.params["sorting"]:
+        ansible_facts = dict(
+            sorted(fact_gatherer.items(), reverse=module.params["sorting"] == "desc")
+        )
 
-    ret = disconnect(connection=conn)
+    disconnect(connection=conn)
 
     module.exit_json(**result, **ansible_facts)
 
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+DOCUMENTATION = r"""
+module: vpp_l2_tenant
+short_description: Declare the L2 services of a host in one task
+description:
+  - Bring the bridge domains, vhost-user ports, their tags and bridge domain
+    membership of a host in line with a declaration, in one task.
+  - VPP is dumped once, the changes are planned in a safe order (ports leave a
+    bridge domain before either is deleted, and are created before they join
+    one) and applied on a single connection.
+  - Existing bridge domains are not modified, only created and removed.
+version_added: 1.0.0
+author: SURF B.V. (@surfnet)
+
+options:
+    bridge_domains:
+      description: Bridge domains that should exist
+      type: list
+      elements: dict
+      default: []
+      suboptions:
+        bd:
+          description: The number of the broadcast domain
+          type: int
+          required: true
+        bd_tag:
+          description: Freeform tag to add to bd
+          type: str
+        flood:
+          description: Should the bd support flooding
+          type: bool
+          default: true
+        uu_flood:
+          description: Should the bd support unicast flooding
+          type: bool
+          default: true
+        learn:
+          description: Should the bd support MAC learning
+          type: bool
+          default: true
+    vhost_user:
+      description: vhost-user ports that should exist
+      type: list
+      elements: dict
+      default: []
+      suboptions:
+        sock_filename:
+          description: Filename of the socket this interface communicates with
+          type: str
+          required: true
+        is_server:
+          description: Should this vhost-user interface be server (true) or client (false)
+          type: bool
+          default: false
+        tag:
+          description: Freeform tag of the interface, left alone when not set
+          type: str
+        bd:
+          description:
+            - Bridge domain the port is a member of, left alone when not set.
+            - Must be declared in I(bridge_domains) or exist already.
+          type: int
+        shg:
+          description: Split horizon group of the port in I(bd)
+          type: int
+          default: 0
+    purge_tag:
+      description:
+        - Tag prefix of the objects this declaration owns.
+        - vhost-user ports with an interface tag, and bridge domains with a
+          bd_tag, that start with it and are not declared are removed.
+        - Nothing is removed when not set.
+      type: str
+extends_documentation_fragment:
+  - surfnet.vpp.vpp_journal
+"""
+
+EXAMPLES = r"""
+- name: Tenant a, two VMs in a bridge domain of their own
+  surfnet.vpp.vpp_l2_tenant:
+    purge_tag: tenant-a
+    bridge_domains:
+      - bd: 100
+        bd_tag: tenant-a
+    vhost_user:
+      - sock_filename: vm1.sock
+        tag: tenant-a-vm1
+        bd: 100
+      - sock_filename: vm2.sock
+        tag: tenant-a-vm2
+        bd: 100
+- name: Many ports, finish or undo what was started when a run fails
+  surfnet.vpp.vpp_l2_tenant:
+    journal: tenant-b
+    rollback: true
+    vhost_user: "{{ tenant_b_ports }}"
+"""
+
+RETURN = r"""
+plan:
+  description: The changes, in the order they were (or in check mode would be) made
+  returned: always
+  type: list
+  elements: str
+  sample:
+    - create bridge domain 100
+    - create vhost user /var/sockets/vm1.sock
+    - attach /var/sockets/vm1.sock to bridge domain 100
+summary:
+  description: Number of changes per kind
+  returned: always
+  type: dict
+applied:
+  description: Number of changes made, less than the length of the plan when one failed
+  returned: always
+  type: int
+resumed:
+  description: Whether the plan of an unfinished earlier run was resumed
+  returned: always
+  type: bool
+rolled_back:
+  description: Number of changes reverted
+  returned: when a change failed and rollback is set
+  type: int
+"""
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
+    connect,
+    disconnect,
+    resolve_variants,
+    api_available,
+    VPPSnapshot,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_l2 import (
+    STEP_ORDER,
+    plan_l2,
+    describe,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_journal import (
+    journal_path,
+    open_journal,
+    run_journaled,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_delta import (
+    options_digest,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
+    VPP_SOCKET_DIR,
+    APIFamilies,
+)
+import os
+
+__metaclass__ = type
+
+
+def run_module():
+    module_args = dict(
+        bridge_domains=dict(
+            type="list",
+            elements="dict",
+            required=False,
+            default=[],
+            options=dict(
+                bd=dict(type="int", required=True),
+                bd_tag=dict(type="str", required=False),
+                flood=dict(type="bool", required=False, default=True),
+                uu_flood=dict(type="bool", required=False, default=True),
+                learn=dict(type="bool", required=False, default=True),
+            ),
+        ),
+        vhost_user=dict(
+            type="list",
+            elements="dict",
+            required=False,
+            default=[],
+            options=dict(
+                sock_filename=dict(type="str", required=True),
+                is_server=dict(type="bool", required=False, default=False),
+                tag=dict(type="str", required=False),
+                bd=dict(type="int", required=False),
+                shg=dict(type="int", required=False, default=0),
+            ),
+        ),
+        purge_tag=dict(type="str", required=False),
+        journal=dict(type="str", required=False),
+        rollback=dict(type="bool", required=False, default=False),
+    )
+
+    result = dict(changed=False, message="", plan=[], applied=0, resumed=False)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    # Echoing a declaration of thousands of objects back costs more than the
+    # whole converge run, report its size instead
+    result["invocation"] = dict(
+        module_args=dict(
+            module.params,
+            bridge_domains=f"{len(module.params['bridge_domains'])} bridge domains",
+            vhost_user=f"{len(module.params['vhost_user'])} vhost-user ports",
+        )
+    )
+
+    if not api_available():
+        module.fail_json(
+            "VPP API could not be loaded. Please make sure vpp-papi is installed."
+        )
+
+    if module.params["vhost_user"] and not os.path.exists(VPP_SOCKET_DIR):
+        module.fail_json(
+            msg=f"Socket directory {VPP_SOCKET_DIR} does not exist or cannot access",
+            **result,
+        )
+
+    if module.params["purge_tag"] == "":
+        module.fail_json(
+            msg="purge_tag cannot be empty, it would own everything", **result
+        )
+
+    path = None
+    if module.params["journal"] is not None:
+        try:
+            path = journal_path(module.params["journal"])
+        except ValueError as e:
+            module.fail_json(msg=str(e), **result)
+
+    conn = connect(
+        families=APIFamilies.BD + APIFamilies.VHOSTUSER,
+        messages=[
+            "bridge_domain_dump",
+            "bridge_domain_add_del",
+            "sw_interface_dump",
+            "sw_interface_vhost_user_dump",
+            "create_vhost_user_if",
+            "sw_interface_set_l2_bridge",
+        ],
+    )
+
+    variants = resolve_variants(conn)
+
+    # A journal of an unfinished run of the same declaration is resumed as is
+    vpe_pid = conn.api.control_ping().vpe_pid
+    digest = options_digest(
+        [module.params[key] for key in ("bridge_domains", "vhost_user", "purge_tag")]
+    )
+    journal, reason = open_journal(path, vpe_pid, digest)
+    if reason:
+        module.warn(f"Not resuming journal {path}: {reason}")
+
+    result["resumed"] = journal is not None
+    snapshot = None
+    if journal:
+        plan = [journal.steps[position] for position in journal.pending()]
+    else:
+        # One dump per table for the whole declaration
+        snapshot = VPPSnapshot(
+            conn, tables=["bridge_domains", "vhost_user", "interfaces"]
+        )
+
+        try:
+            plan = plan_l2(
+                snapshot,
+                module.params["bridge_domains"],
+                module.params["vhost_user"],
+                module.params["purge_tag"],
+            )
+        except ValueError as e:
+            disconnect(connection=conn)
+            module.fail_json(msg=str(e), **result)
+
+    result["plan"] = [describe(step) for step in plan]
+    result["summary"] = {
+        action: sum(1 for step in plan if step.action == action)
+        for action in STEP_ORDER
+    }
+    result["changed"] = bool(plan)
+
+    if not plan or module.check_mode:
+        disconnect(connection=conn)
+        result["message"] = f"{len(plan)} changes" if plan else "No changes needed"
+        module.exit_json(**result)
+
+    try:
+        error = run_journaled(
+            conn,
+            variants,
+            plan,
+            journal,
+            snapshot,
+            path,
+            vpe_pid,
+            digest,
+            module.params["rollback"],
+            result,
+        )
+    except (IOError, OSError) as e:
+        disconnect(connection=conn)
+        module.fail_json(msg=f"Cannot write journal {path}: {e}", **result)
+    disconnect(connection=conn)
+    if error:
+        module.fail_json(msg=error, **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
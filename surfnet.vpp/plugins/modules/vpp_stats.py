@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+DOCUMENTATION = r"""
+module: vpp_stats
+short_description: Read counters from the VPP stats segment
+description:
+  - Read interface and graph node counters straight from the VPP stats segment.
+  - The segment is shared memory that is mapped read only, so unlike
+    M(surfnet.vpp.vpp_facts) this does not use the binary API and does not
+    hold up the control plane.
+  - Counters of all threads are summed, unless I(per_thread) is set.
+version_added: 1.0.0
+author: SURF B.V. (@surfnet)
+
+options:
+    socket:
+      description: The stats socket VPP hands out the segment on
+      type: path
+      default: /run/vpp/stats.sock
+    segment:
+      description:
+        - Map this file as stats segment instead of asking VPP for it, e.g. a
+          copy taken earlier.
+      type: path
+    patterns:
+      description:
+        - Regular expressions for the stat paths to read, as C(vpp_get_stats ls)
+          takes them.
+        - Reading fewer paths is cheaper, the directory itself is always read.
+      type: list
+      elements: str
+      default:
+        - ^/if/
+        - ^/sys/node/
+    per_thread:
+      description: Keep counters per thread instead of summing them
+      type: bool
+      default: false
+"""
+
+EXAMPLES = r"""
+- name: Read interface and node counters
+  surfnet.vpp.vpp_stats:
+
+- name: Read only the interface drop counters
+  surfnet.vpp.vpp_stats:
+    patterns:
+      - ^/if/names$
+      - ^/if/drops$
+"""
+
+RETURN = r"""
+vpp_stats:
+    description:
+      - Value per stat path. Scalars are integers, counters a list per interface
+        or node index and name vectors a list of names.
+      - Combined counters hold packets and bytes per index.
+      - With I(per_thread) every counter is a list per thread first.
+    type: dict
+    returned: always
+    sample:
+        /if/names: [local0, VirtualEthernet0/0/0]
+        /if/drops: [0, 12]
+        /if/rx: [{packets: 0, bytes: 0}, {packets: 1042, bytes: 66688}]
+vpp_interface_stats:
+    description: The /if/ counters per interface, with its name and sw_if_index
+    type: list
+    elements: dict
+    returned: when /if/names is read and per_thread is false
+    sample:
+        - name: VirtualEthernet0/0/0
+          sw_if_index: 1
+          drops: 12
+          rx: {packets: 1042, bytes: 66688}
+vpp_node_stats:
+    description:
+      - The /sys/node/ counters per graph node, with its name and the vectors
+        per call.
+    type: list
+    elements: dict
+    returned: when /sys/node/names is read and per_thread is false
+    sample:
+        - name: ethernet-input
+          calls: 1200
+          vectors: 38400
+          clocks: 912000
+          suspends: 0
+          vectors_per_call: 32.0
+epoch:
+    description: Epoch of the segment the counters were read in
+    type: int
+    returned: always
+"""
+
+import re
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_stats import (
+    StatsSegment,
+    StatsSegmentError,
+    interface_stats,
+    node_stats,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
+    VPP_STATS_SOCKET,
+)
+
+__metaclass__ = type
+
+
+def run_module():
+    module_args = dict(
+        socket=dict(type="path", required=False, default=VPP_STATS_SOCKET),
+        segment=dict(type="path", required=False),
+        patterns=dict(
+            type="list",
+            elements="str",
+            required=False,
+            default=["^/if/", "^/sys/node/"],
+        ),
+        per_thread=dict(type="bool", required=False, default=False),
+    )
+
+    result = dict(changed=False, message="")
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    try:
+        if module.params["segment"]:
+            segment = StatsSegment.open(module.params["segment"])
+        else:
+            segment = StatsSegment.connect(module.params["socket"])
+    except StatsSegmentError as e:
+        module.fail_json(msg=str(e), **result)
+
+    try:
+        with segment:
+            stats = segment.dump(module.params["patterns"], module.params["per_thread"])
+            result["epoch"] = segment.epoch
+    except StatsSegmentError as e:
+        module.fail_json(msg=str(e), **result)
+    except re.error as e:
+        module.fail_json(msg=f"Invalid pattern: {e}", **result)
+
+    result["vpp_stats"] = stats
+    if not module.params["per_thread"]:
+        if "/if/names" in stats:
+            result["vpp_interface_stats"] = interface_stats(stats)
+        if "/sys/node/names" in stats:
+            result["vpp_node_stats"] = node_stats(stats)
+
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,13 +19,17 @@ from __future__ import absolute_import, division, print_function
 DOCUMENTATION = r"""
 module: vpp_vhostuser
 short_description: Manage VPP vhost-user interfaces
-description: Manage VPP vhost-user interface one at at time
+description:
+  - Manage VPP vhost-user interface one at at time, or many at once using I(interfaces).
+  - The vhost-user table is dumped once per run and indexed by socket and interface index.
 version_added: 0.0.2
 author: SURF B.V. (@surfnet)
 
 options:
     state:
-      description: The operation mode this module is running as.
+      description:
+        - The operation mode this module is running as.
+        - In list mode this is the default for items without a state.
       default: set
       choices:
        - present
@@ -39,12 +43,40 @@ options:
       type: bool
       default: false
     sock_filename:
-      description: Filename of the socket this interface communicates with
+      description:
+        - Filename of the socket this interface communicates with
+        - Required unless I(interfaces) is used.
       type: str
-      required: true
     tag:
       description: Freeform tag to add to vhost-user interface
       type: str
+    interfaces:
+      description:
+        - List of vhost-user interfaces to manage in one task.
+        - Mutually exclusive with I(sock_filename).
+      type: list
+      elements: dict
+      suboptions:
+        sock_filename:
+          description: Filename of the socket this interface communicates with
+          type: str
+          required: true
+        state:
+          description: Whether the interface should exist, defaults to I(state)
+          type: str
+          choices:
+           - present
+           - absent
+        if_idx:
+          description: The interface number (sw_if_index) used by VPP for this interface
+          type: int
+        is_server:
+          description: Should this vhost-user interface be server (true) or client (false)
+          type: bool
+          default: false
+        tag:
+          description: Freeform tag to add to vhost-user interface
+          type: str
 """
 
 EXAMPLES = r"""
@@ -52,209 +84,324 @@ EXAMPLES = r"""
   surfnet.vpp.vpp_vhostuser:
     sock_filename: example.sock
     tag: Hello world
+
+- name: Ensure all ports of a hypervisor in one task
+  surfnet.vpp.vpp_vhostuser:
+    interfaces:
+      - sock_filename: vm1.sock
+        tag: vm1
+      - sock_filename: vm2.sock
+        tag: vm2
+      - sock_filename: old-vm.sock
+        state: absent
 """
 
-RETURN = r""" # """
+RETURN = r"""
+results:
+  description: Outcome per interface, only returned in list mode
+  returned: when I(interfaces) is used
+  type: list
+  elements: dict
+summary:
+  description: Number of interfaces created, modified, deleted, unchanged and failed
+  returned: when I(interfaces) is used
+  type: dict
+"""
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
     connect,
     disconnect,
-    get_version,
+    resolve_variants,
     get_error,
-    get_vhost_if,
     api_available,
+    VPPSnapshot,
+    DeferredWrites,
 )
 from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
     VPPModuleMethods,
     VPP_SOCKET_DIR,
+    APIFamilies,
 )
+from collections import namedtuple
+from typing import Any, Dict
 import os
 
 __metaclass__ = type
 
+VHOST_OPTIONS = dict(
+    if_idx=dict(type="int", required=False, default=None),
+    is_server=dict(type="bool", required=False, default=False),
+    tag=dict(type="str", required=False),
+)
 
-def run_module():
-    module_args = dict(
-        state=dict(
-            type="str",
-            default=VPPModuleMethods.PRESENT,
-            choices=[VPPModuleMethods.ABSENT, VPPModuleMethods.PRESENT],
-        ),
-        if_idx=dict(type="int", required=False, default=None),
-        is_server=dict(type="bool", required=False, default=False),
-        sock_filename=dict(type="str", required=True),
-        tag=dict(type="str", required=False),
+# What we know about an interface we created or changed during this run
+VhostEntry = namedtuple("VhostEntry", ["sw_if_index", "sock_filename", "is_server"])
+
+
+def reconcile_vhost(
+    conn,
+    variants: Dict,
+    spec: Dict,
+    snapshot: VPPSnapshot,
+    check_mode: bool,
+    writes: DeferredWrites = None,
+) -> Dict:
+    """
+    Bring one vhost-user interface in line with its spec
+
+    :param conn: Reference to the connection
+    :param variants: Messages to use, as returned by resolve_variants
+    :param spec: Desired interface options and state
+    :param snapshot: Snapshot of VPP state, updated with the outcome
+    :param check_mode: Only report what would change
+    :param writes: Queue for a create or delete, the result is only complete
+                   once it is flushed. Without it they are sent right away.
+    :return: Result for this interface
+    """
+
+    opt_sock_filename = str(spec.get("sock_filename"))
+    opt_sock_full_filename = os.path.join(VPP_SOCKET_DIR, opt_sock_filename)
+    if spec.get("if_idx") is not None:
+        opt_if_idx = int(spec.get("if_idx"))
+    else:
+        opt_if_idx = None
+
+    item = dict(
+        sock_filename=opt_sock_filename,
+        sw_if_index=opt_if_idx,
+        state=spec["state"],
+        action="unchanged",
+        changed=False,
+        failed=False,
+        message="",
     )
 
-    result = dict(changed=False, message="")
-
-    ansible_facts = dict()
+    # Create / change
+    if spec["state"] == VPPModuleMethods.PRESENT:
+        opt_is_server = bool(spec.get("is_server"))
+        opt_tag = str(spec.get("tag"))
 
-    module = AnsibleModule(argument_spec=module_args, supports_check_mode=False)
+        # See if the interface already exists, since we do not know for sure
+        if opt_if_idx:
+            existing_if = snapshot.vhost_user(sw_if_index=opt_if_idx)
+        else:
+            existing_if = snapshot.vhost_user(sock_filename=opt_sock_full_filename)
 
-    if not api_available:
-        module.fail_json(
-            "VPP API could not be loaded. Please make sure vpp-papi is installed."
-        )
+        # New interface requested
+        if not existing_if:
+            item.update(changed=True, action="created")
+            if check_mode:
+                return item
+
+            def created(interface: Any) -> Dict:
+                if interface and interface.retval != 0:
+                    name, errid, text = get_error(interface.retval)
+                    item.update(changed=False, failed=True, action="failed")
+                    item["message"] = (
+                        f"Could not create vhost-user interface {opt_sock_filename}:"
+                        f"{text} ({errid})"
+                    )
+                    return item
 
-    conn = connect()
+                snapshot.put(
+                    "vhost_user",
+                    VhostEntry(
+                        interface.sw_if_index, opt_sock_full_filename, opt_is_server
+                    ),
+                )
+                item["sw_if_index"] = interface.sw_if_index
+                item["message"] = (
+                    f"Succesfully created vhost-user interface at {opt_sock_filename}, "
+                    f"interface index is {interface.sw_if_index}"
+                )
+                return item
 
-    vpp_version = get_version(connection=conn)
+            funcname = variants["create_vhost_user_if"]
+            kwargs = dict(
+                is_server=opt_is_server,
+                sock_filename=opt_sock_full_filename,
+                tag=opt_tag,
+            )
+            if writes is None:
+                return created(getattr(conn.api, funcname)(**kwargs))
+            writes.add(funcname, kwargs, created, [opt_sock_full_filename])
+            return item
 
-    # Create / change
-    if module.params.get("state") == VPPModuleMethods.PRESENT:
+        # Modification of existing interface requested
+        sw_if_idx = existing_if.sw_if_index
+        item["sw_if_index"] = sw_if_idx
 
-        existing_if = None
-        opt_sock_full_filename = str
+        # Only do something if there is something to change
+        if (
+            opt_is_server == existing_if.is_server
+            and opt_sock_full_filename == existing_if.sock_filename
+        ):
+            return item
 
-        if os.path.exists(VPP_SOCKET_DIR):
-            opt_sock_full_filename = os.path.join(
-                VPP_SOCKET_DIR, module.params.get("sock_filename")
-            )
-        else:
-            module.fail_json(
-                msg=f"Socket directory {VPP_SOCKET_DIR} does not exist or cannot access",
-                **result,
-            )
+        item.update(changed=True, action="modified")
+        if check_mode:
+            return item
 
-        if module.params.get("if_idx") is not None:
-            opt_if_idx = int(module.params.get("if_idx"))
-        else:
-            opt_if_idx = None
-        opt_is_server = bool(module.params.get("is_server"))
-        opt_tag = str(module.params.get("tag"))
-        opt_sock_filename = str(module.params.get("sock_filename"))
+        res = getattr(conn.api, variants["modify_vhost_user_if"])(
+            sw_if_index=sw_if_idx,
+            is_server=opt_is_server,
+            sock_filename=opt_sock_full_filename,
+        )
 
-        # See if the interface already exists, since we do not know for sure
-        if not opt_if_idx and opt_sock_filename:
-            existing_if = get_vhost_if(
-                connection=conn, sock_filename=opt_sock_full_filename
+        if res and res.retval != 0:
+            name, errid, text = get_error(res.retval)
+            item.update(changed=False, failed=True, action="failed")
+            item["message"] = (
+                f"Could not modify vhost-user interface {opt_sock_filename}:"
+                f"{text} ({errid})"
             )
-        elif opt_if_idx:
-            existing_if = get_vhost_if(connection=conn, if_idx=opt_if_idx)
+            return item
 
-        # New interface requested
-        if not existing_if:
+        snapshot.put(
+            "vhost_user", VhostEntry(sw_if_idx, opt_sock_full_filename, opt_is_server)
+        )
+        item[
+            "message"
+        ] = f"Succesfully modified vhost-user interface at {opt_sock_filename}"
 
-            if vpp_version[0] > 22:
-                interface = conn.api.create_vhost_user_if_v2(
-                    is_server=opt_is_server,
-                    sock_filename=opt_sock_full_filename,
-                    tag=opt_tag,
+    # Delete
+    elif spec["state"] == VPPModuleMethods.ABSENT:
+        # If we have the socket, make sure it matches the ifidx we got, so we are predictable
+        if_by_filename = snapshot.vhost_user(sock_filename=opt_sock_full_filename)
+        if_by_idx = snapshot.vhost_user(sw_if_index=opt_if_idx) if opt_if_idx else None
+
+        target = if_by_idx if if_by_idx is not None else if_by_filename
+        if target is None:
+            return item
+
+        item["sw_if_index"] = target.sw_if_index
+        item.update(changed=True, action="deleted")
+        if check_mode:
+            return item
+
+        def deleted(res: Any) -> Dict:
+            if res and res.retval != 0:
+                name, errid, text = get_error(res.retval)
+                item.update(changed=False, failed=True, action="failed")
+                item["message"] = (
+                    f"Could not delete vhost-user interface at {target.sock_filename} "
+                    f"({target.sw_if_index}): {text} ({errid})"
                 )
+                return item
 
-            else:
-                interface = conn.api.create_vhost_user_if(
-                    is_server=opt_is_server,
-                    sock_filename=opt_sock_full_filename,
-                    tag=opt_tag,
-                )
+            snapshot.discard("vhost_user", target.sw_if_index)
+            item["message"] = "Succesfully deleted vhost-user interface"
+            return item
 
-            if interface and interface.retval != 0:
-                name, errid, text = get_error(interface.retval)
-                module.fail_json(
-                    msg=f"Could not create vhost-user interface {opt_sock_filename}:{text} ({errid})",
-                    **result,
-                )
-            else:
-                result["changed"] = True
-                result["message"] = (
-                    f"Succesfully created vhost-user interface at {opt_sock_filename}, "
-                    f"interface index is {interface.sw_if_index}"
-                )
+        kwargs = dict(sw_if_index=target.sw_if_index)
+        if writes is None:
+            return deleted(conn.api.delete_vhost_user_if(**kwargs))
+        keys = [target.sw_if_index, target.sock_filename]
+        writes.add("delete_vhost_user_if", kwargs, deleted, keys)
 
-        # Modification of existing interface requested
-        else:
-            sw_if_idx = existing_if.sw_if_index
-
-            # Only do something if there is something to change
-            if (
-                opt_is_server != existing_if.is_server
-                or opt_sock_filename != existing_if.sock_filename
-            ):
-
-                if vpp_version[0] > 22:
-                    res = conn.api.modify_vhost_user_if_v2(
-                        sw_if_index=sw_if_idx,
-                        is_server=opt_is_server,
-                        sock_filename=opt_sock_full_filename,
-                    )
-                else:
-                    res = conn.api.modify_vhost_user_if_v2(
-                        sw_if_index=sw_if_idx,
-                        is_server=opt_is_server,
-                        sock_filename=opt_sock_full_filename,
-                    )
+    return item
 
-                if res and res.retval != 0:
-                    name, errid, text = get_error(res.retval)
-                    module.fail_json(
-                        msg=f"Could not modify vhost-user interface {opt_sock_filename}:{text} ({errid})",
-                        **result,
-                    )
-                else:
-                    result["changed"] = True
-                    result[
-                        "message"
-                    ] = f"Succesfully modified vhost-user interface at {opt_sock_filename}"
-    # Delete
-    elif module.params.get("state") == VPPModuleMethods.ABSENT:
 
-        if module.params.get("if_idx") is not None:
-            opt_if_idx = int(module.params.get("if_idx"))
-        else:
-            opt_if_idx = None
-        opt_sock_filename = str(module.params.get("sock_filename"))
+def run_module():
+    module_args = dict(
+        state=dict(
+            type="str",
+            default=VPPModuleMethods.PRESENT,
+            choices=[VPPModuleMethods.ABSENT, VPPModuleMethods.PRESENT],
+        ),
+        sock_filename=dict(type="str", required=False),
+        interfaces=dict(
+            type="list",
+            elements="dict",
+            required=False,
+            options=dict(
+                sock_filename=dict(type="str", required=True),
+                state=dict(
+                    type="str",
+                    required=False,
+                    choices=[VPPModuleMethods.ABSENT, VPPModuleMethods.PRESENT],
+                ),
+                **VHOST_OPTIONS,
+            ),
+        ),
+        **VHOST_OPTIONS,
+    )
 
-        if os.path.exists(VPP_SOCKET_DIR):
-            opt_sock_full_filename = os.path.join(
-                VPP_SOCKET_DIR, module.params.get("sock_filename")
-            )
-        else:
-            module.fail_json(
-                msg=f"Socket directory {VPP_SOCKET_DIR} does not exist or cannot access",
-                **result,
-            )
+    result = dict(changed=False, message="")
 
-        # If we have the socket, make sure it matches the ifidx we got, so we are predictable
-        if_by_filename = None
-        if_by_idx = None
+    ansible_facts = dict()
 
-        if opt_sock_filename:
-            if_by_filename = get_vhost_if(
-                connection=conn, sock_filename=opt_sock_full_filename
-            )
-        if opt_if_idx:
-            if_by_idx = get_vhost_if(connection=conn, if_idx=opt_if_idx)
+    module = AnsibleModule(
+        argument_spec=module_args,
+        mutually_exclusive=[["sock_filename", "interfaces"]],
+        required_one_of=[["sock_filename", "interfaces"]],
+        supports_check_mode=True,
+    )
 
-        if (
-            if_by_idx is not None
-            and if_by_filename is not None
-            and if_by_idx == if_by_filename
-        ):
-            res = conn.api.delete_vhost_user_if(sw_if_index=opt_if_idx)
+    if not api_available:
+        module.fail_json(
+            "VPP API could not be loaded. Please make sure vpp-papi is installed."
+        )
 
-        elif if_by_idx is not None:
-            res = conn.api.delete_vhost_user_if(sw_if_index=opt_if_idx)
+    if not os.path.exists(VPP_SOCKET_DIR):
+        module.fail_json(
+            msg=f"Socket directory {VPP_SOCKET_DIR} does not exist or cannot access",
+            **result,
+        )
 
-        elif if_by_filename is not None:
-            res = conn.api.delete_vhost_user_if(sw_if_index=if_by_filename.sw_if_index)
+    conn = connect(
+        families=APIFamilies.VHOSTUSER,
+        messages=["sw_interface_vhost_user_dump", "create_vhost_user_if"],
+    )
 
-        else:
-            res = None
+    variants = resolve_variants(conn)
+
+    # One dump for the whole run, no matter how many interfaces we handle
+    snapshot = VPPSnapshot(conn, tables=["vhost_user"])
+
+    if module.params.get("interfaces") is None:
+        spec = dict(module.params)
+        item = reconcile_vhost(conn, variants, spec, snapshot, module.check_mode)
+        disconnect(connection=conn)
+
+        result["changed"] = item["changed"]
+        result["message"] = item["message"]
+        if item["failed"]:
+            module.fail_json(msg=item["message"], **result)
+        module.exit_json(**result, **ansible_facts)
+
+    # Creates and deletes go out pipelined, see DeferredWrites
+    writes = DeferredWrites(conn)
+    results = []
+    for spec in module.params["interfaces"]:
+        spec = dict(spec)
+        if spec.get("state") is None:
+            spec["state"] = module.params["state"]
+        sock_filename = os.path.join(VPP_SOCKET_DIR, str(spec.get("sock_filename")))
+        if writes.touches([sock_filename, spec.get("if_idx")]):
+            writes.flush()
+        results.append(
+            reconcile_vhost(conn, variants, spec, snapshot, module.check_mode, writes)
+        )
+    writes.flush()
 
-        if res and res.retval != 0:
-            name, errid, text = get_error(res.retval)
-            module.fail_json(
-                msg=f"Could not delete vhost-user interface at {if_by_idx.sock_filename} ({if_by_idx.sw_if_index}):"
-                f" {text} ({errid})",
-                **result,
-            )
-        elif res:
-            result["changed"] = True
-            result["message"] = "Succesfully deleted vhost-user interface"
     disconnect(connection=conn)
+
+    summary = dict(created=0, modified=0, deleted=0, unchanged=0, failed=0)
+    for item in results:
+        summary[item["action"]] += 1
+
+    result["changed"] = any(item["changed"] for item in results)
+    result["results"] = results
+    result["summary"] = summary
+    result["message"] = ", ".join(f"{v} {k}" for k, v in summary.items())
+    if summary["failed"]:
+        module.fail_json(
+            msg=f"{summary['failed']} of {len(results)} vhost-user interfaces failed",
+            **result,
+        )
+
     module.exit_json(**result, **ansible_facts)
 
 
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from typing import Dict, List, Union
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.parsing.mod_args import ModuleArgsParser
+from ansible.plugins.action import ActionBase
+from ansible.utils.display import Display
+
+display = Display()
+
+# Task variable to turn coalescing off with
+COALESCE_VAR = "vpp_coalesce_loops"
+
+
+class CoalescingAction(ActionBase):
+    """
+    Run a looped task as one module run in list mode per host
+
+    The executor calls the action once per loop item. The first call renders
+    the arguments of every item, runs the module once with all of them as
+    list items and keeps the outcome per item; that call and the ones after it
+    return the result of their own item, so registered results look the same
+    as without coalescing.
+
+    Loops that cannot be rendered up front run item by item as before: with_*
+    lookups, until, pause, break_when, async, a delegate_to that depends on
+    the item, and items with options the list mode does not have.
+    """
+
+    # Set by the action of each module
+    MODULE = None
+    LIST_OPTION = None
+    ITEM_OPTIONS = ()
+    REQUIRED = ()
+
+    # Outcome per item of the loops in progress, by task and host. Every item
+    # of a loop on a host runs in the same worker process.
+    _loops = {}
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(CoalescingAction, self).run(tmp, task_vars)
+        del tmp
+
+        task_vars = task_vars or {}
+        key = (self._task._uuid, task_vars.get("inventory_hostname"))
+
+        outcome = self._loops.get(key)
+        if outcome is None:
+            specs = self._loop_specs(task_vars)
+            if specs is None:
+                result.update(self._execute_module(task_vars=task_vars))
+                return result
+            outcome = self._loops[key] = self._run_coalesced(specs, task_vars)
+
+        item_result = outcome.pop(0)
+        if not outcome:
+            del self._loops[key]
+        result.update(item_result)
+        return result
+
+    def _loop_specs(self, task_vars: Dict) -> Union[List[Dict], None]:
+        """The module arguments of the items that will run, None to not coalesce"""
+
+        task = self._task
+        templar = self._templar
+        loop_control = task.loop_control
+        loop_var = loop_control.loop_var if loop_control else "item"
+        # The loop and arguments as written, the executor already rendered the
+        # ones of this task for the current item
+        ds = task.get_ds()
+        if (
+            task.loop is None
+            or task.loop_with
+            or loop_var not in task_vars
+            or task.until
+            or task.async_val
+            or (loop_control and loop_control.pause)
+            # Only in ansible-core 2.18 and later
+            or (loop_control and getattr(loop_control, "break_when", None))
+            # Every item would run on the host of the first one
+            or templar.is_template(ds.get("delegate_to"))
+            or not boolean(task_vars.get(COALESCE_VAR, True))
+            or self.LIST_OPTION in task.args
+        ):
+            return None
+
+        saved = templar.available_variables
+        try:
+            items = templar.template(ds.get("loop", task.loop))
+            if not isinstance(items, list) or len(items) < 2:
+                return None
+            _, raw_args, _ = ModuleArgsParser(
+                task_ds=ds, collection_list=task.collections
+            ).parse(skip_action_validation=True)
+
+            index_var = loop_control.index_var if loop_control else None
+            specs = []
+            for index, item in enumerate(items):
+                item_vars = dict(task_vars)
+                item_vars[loop_var] = item
+                if index_var:
+                    item_vars[index_var] = index
+                templar.available_variables = item_vars
+                if task.when and not task.evaluate_conditional(templar, item_vars):
+                    continue
+                # Module defaults are in the arguments of this item already
+                spec = dict(task.args)
+                spec.update(templar.template(raw_args))
+                omit = task_vars.get("omit")
+                specs.append({k: v for k, v in spec.items() if v != omit})
+        except AnsibleError as e:
+            display.vvv(f"Not coalescing {task.get_name()}: {e}")
+            return None
+        finally:
+            templar.available_variables = saved
+
+        for spec in specs:
+            if set(spec) - set(self.ITEM_OPTIONS):
+                return None
+            if any(spec.get(option) is None for option in self.REQUIRED):
+                return None
+        return specs or None
+
+    def _run_coalesced(self, specs: List[Dict], task_vars: Dict) -> List[Dict]:
+        display.vvv(f"Running {len(specs)} loop items as one {self.MODULE} run")
+        reply = self._execute_module(
+            module_name=self.MODULE,
+            module_args={self.LIST_OPTION: specs},
+            task_vars=task_vars,
+        )
+
+        items = reply.get("results")
+        if not isinstance(items, list) or len(items) != len(specs):
+            # The run failed as a whole, e.g. VPP was not reachable
+            msg = reply.get("msg", "Module failed")
+            failure = dict(failed=True, changed=False, message=msg, msg=msg)
+            return [dict(failure) for _ in specs]
+
+        outcome = []
+        for item in items:
+            item_result = dict(changed=item["changed"], message=item["message"])
+            if item.get("failed"):
+                item_result.update(failed=True, msg=item["message"])
+            outcome.append(item_result)
+        return outcome
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+name: vpp_state
+short_description: Host variables from VPP state snapshots
+description:
+  - Loads the snapshot M(surfnet.vpp.vpp_facts) wrote for a host with I(snapshot)
+    as the C(vpp_state) variable, so templates can use the ids of VPP objects
+    without gathering facts first.
+  - C(vpp_state) holds C(interfaces) (name to sw_if_index), C(tags) (tag to a
+    list of sw_if_index), C(vhost_user) (socket to sw_if_index),
+    C(bridge_domains) (bd_id to its C(tag), C(bvi) and C(members)),
+    C(member_of) (sw_if_index to bd_id and split horizon group), and the
+    C(vpe_pid) and C(taken) time of the snapshot.
+  - A snapshot is read when the variables of its host are first needed and
+    kept in memory until the file changes.
+  - Like every vars plugin of a collection it has to be enabled, see
+    C(vars_plugins_enabled).
+version_added: 1.0.0
+author: SURF B.V. (@surfnet)
+
+options:
+  snapshot_dir:
+    description: Directory with the snapshots, one C(<inventory_hostname>.json) per host
+    default: ~/.ansible/vpp_state
+    env:
+      - name: ANSIBLE_VPP_STATE_DIR
+    ini:
+      - key: snapshot_dir
+        section: vpp_state
+    type: path
+extends_documentation_fragment:
+  - vars_plugin_staging
+"""
+
+import os
+
+from ansible.inventory.host import Host
+from ansible.plugins.vars import BaseVarsPlugin
+from ansible.utils.unsafe_proxy import wrap_var
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_state import (
+    load_state,
+)
+
+VARIABLE = "vpp_state"
+
+
+class VarsModule(BaseVarsPlugin):
+    """
+    Host variables from the snapshots of the vpp_facts action plugin
+
+    Vars plugins run for every host on every task, so a snapshot is parsed
+    once and after that only stat()ed: it is read again when its mtime or
+    size changed. Names and tags come from VPP and are marked unsafe, so they
+    are never templated.
+    """
+
+    REQUIRES_ENABLED = True
+
+    # path: (mtime_ns, size, state), shared by all instances
+    _snapshots = {}
+
+    def get_vars(self, loader, path, entities, cache=True):
+        if not isinstance(entities, list):
+            entities = [entities]
+
+        super(VarsModule, self).get_vars(loader, path, entities)
+
+        directory = os.path.expanduser(self.get_option("snapshot_dir"))
+        data = {}
+        for entity in entities:
+            # Only hosts have a snapshot, skip 'chroot' type names
+            if not isinstance(entity, Host) or os.path.sep in entity.name:
+                continue
+            state = self._load(os.path.join(directory, f"{entity.name}.json"))
+            if state is not None:
+                data[VARIABLE] = state
+        return data
+
+    def _load(self, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._snapshots.pop(path, None)
+            return None
+
+        cached = self._snapshots.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        try:
+            with open(path) as fh:
+                state = wrap_var(load_state(fh.read()))
+        except (IOError, OSError, ValueError, KeyError, AttributeError) as e:
+            # Remembered as well, so a broken file is reported once
+            self._display.warning(f"Ignoring VPP state snapshot {path}: {e}")
+            state = None
+        self._snapshots[path] = (stat.st_mtime_ns, stat.st_size, state)
+        return state
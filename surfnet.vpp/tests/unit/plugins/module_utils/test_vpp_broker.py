@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_broker import (
+    BrokerServer,
+    broker_connect,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import (
+    SimulatedVPP,
+    SimulatedVPPApiClient,
+)
+
+
+class DeadSession:
+    """The session of a VPP that restarted, every call on it fails"""
+
+    def __init__(self):
+        self.api = self
+        self.disconnected = False
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(**kwargs):
+            raise IOError("VPP API client: read failed")
+
+        return call
+
+    def disconnect(self):
+        self.disconnected = True
+        return 0
+
+
+def _session():
+    client = SimulatedVPPApiClient(vpp=SimulatedVPP())
+    client.connect("test")
+    return client
+
+
+@pytest.fixture
+def server(tmp_path):
+    sessions = []
+
+    def reconnect():
+        sessions.append(_session())
+        return sessions[-1]
+
+    server = BrokerServer(DeadSession(), str(tmp_path / "broker.sock"), 60, reconnect)
+    server.sessions = sessions
+    yield server
+    server.server_close()
+
+
+def test_reconnect_after_restart(server):
+    dead = server.backend
+
+    reply = server.dispatch({"call": "show_version"})
+
+    assert "failed" in reply["error"]
+    assert dead.disconnected
+    assert server.backend is server.sessions[0]
+    assert "value" in server.dispatch({"call": "show_version"})
+
+
+def test_no_reconnect_on_a_live_session(server):
+    server.backend = _session()
+
+    reply = server.dispatch({"call": "sw_interface_dump", "kwargs": {"bogus": 1}})
+
+    assert "error" in reply
+    assert server.sessions == []
+
+
+def test_stop_when_vpp_is_gone(tmp_path):
+    def reconnect():
+        raise IOError("Could not connect to VPP")
+
+    path = str(tmp_path / "broker.sock")
+    server = BrokerServer(DeadSession(), path, 60, reconnect)
+
+    server.dispatch({"call": "show_version"})
+    # Returns once check_backend asked the server to stop
+    server.serve_until_idle()
+
+    assert broker_connect(path) is None
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
+    DeferredWrites,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import (
+    SimulatedVPP,
+    SimulatedVPPApiClient,
+)
+
+
+def test_deferred_writes():
+    vpp = SimulatedVPP()
+    writes = DeferredWrites(SimulatedVPPApiClient(vpp=vpp))
+    replies = []
+
+    for bd_id in (1, 2):
+        writes.add(
+            "bridge_domain_add_del_v2",
+            dict(bd_id=bd_id, is_add=True),
+            replies.append,
+            [bd_id, None],
+        )
+
+    assert not vpp.bridge_domains
+    assert writes.touches([2]) and not writes.touches([3, None])
+
+    writes.flush()
+
+    assert sorted(vpp.bridge_domains) == [1, 2]
+    assert [reply.retval for reply in replies] == [0, 0]
+    assert not writes.touches([1])
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import fnmatch
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_filter import (
+    pushdown,
+)
+
+
+def _name_filter(pattern):
+    conditions = [dict(field="interface_name", op="glob", value=pattern)]
+    return pushdown("sw_interface_dump", conditions).get("name_filter")
+
+
+@pytest.mark.parametrize(
+    "pattern, name, literal",
+    [
+        ("VirtualEthernet0/0/*", "VirtualEthernet0/0/12", "VirtualEthernet0/0/"),
+        ("vhost[abcdefg]*", "vhostc0", "vhost"),
+        ("*[!x]Ethernet", "GigabitEthernet", "Ethernet"),
+        ("[]abcdefgh]eth", "]eth", "eth"),
+        ("eth[0", "eth[0", "eth[0"),
+    ],
+)
+def test_glob_pushdown(pattern, name, literal):
+    assert fnmatch.fnmatchcase(name, pattern)
+    assert _name_filter(pattern) == literal
+    # VPP matches the name filter as a substring
+    assert literal in name
+
+
+def test_glob_without_literal():
+    assert _name_filter("[abc]*") is None
+    assert pushdown(
+        "sw_interface_dump", [dict(field="interface_name", value="local0")]
+    ) == dict(name_filter="local0", name_filter_valid=True)
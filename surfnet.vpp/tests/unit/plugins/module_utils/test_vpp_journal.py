@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import copy
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
+    VPPSnapshot,
+    resolve_variants,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_journal import (
+    Journal,
+    apply_journaled,
+    open_journal,
+    rollback,
+    undo_step,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_l2 import (
+    Step,
+    plan_l2,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import (
+    SimulatedVPP,
+    SimulatedVPPApiClient,
+)
+
+DIGEST = "declaration"
+
+
+@pytest.fixture
+def vpp():
+    vpp = SimulatedVPP()
+    vpp.populate(vhost_user=2, bridge_domains=2)
+    return vpp
+
+
+@pytest.fixture
+def conn(vpp):
+    conn = SimulatedVPPApiClient(vpp=vpp)
+    conn.connect("test")
+    return conn
+
+
+def _snapshot(conn):
+    return VPPSnapshot(conn, tables=["bridge_domains", "vhost_user", "interfaces"])
+
+
+def _state(vpp):
+    return (
+        copy.deepcopy(vpp.bridge_domains),
+        sorted(
+            (vhost["sock_filename"], vhost["is_server"], vpp.interfaces[index]["tag"])
+            for index, vhost in vpp.vhost_user.items()
+        ),
+    )
+
+
+def _begin(conn, path, plan):
+    snapshot = _snapshot(conn)
+    undo = [undo_step(snapshot, step) for step in plan]
+    return Journal.begin(path, plan, undo, conn.api.control_ping().vpe_pid, DIGEST)
+
+
+def _tenant_plan(conn):
+    # Port sim-0 leaves bridge domain 1, which is deleted, and three new ports
+    # join bridge domain 3
+    return plan_l2(
+        _snapshot(conn),
+        [dict(bd=3, bd_tag="t")],
+        [dict(sock_filename=f"t{n}.sock", tag=f"t{n}", bd=3) for n in range(3)],
+        purge_tag="1",
+    )
+
+
+def test_undo_step(conn, vpp):
+    snapshot = _snapshot(conn)
+    sock = vpp.vhost_user[1]["sock_filename"]
+
+    def undo(action, target, **args):
+        return undo_step(snapshot, Step(action, target, args))
+
+    assert undo("create_bridge_domain", 9) == Step(
+        "delete_bridge_domain", 9, dict(bd_id=9, is_add=False)
+    )
+    create = undo("delete_bridge_domain", 1)
+    assert create.action == "create_bridge_domain"
+    assert create.args["bd_tag"] == "1" and create.args["learn"] is True
+    assert undo("delete_bridge_domain", 99) is None
+
+    recreate = undo("delete_vhost_user", sock, sw_if_index=1)
+    assert recreate.args == dict(sock_filename=sock, is_server=False, tag="sim-0")
+    assert undo("create_vhost_user", sock) == Step("delete_vhost_user", sock, {})
+
+    # Back to the bridge domain it is in, or out again when it is new
+    assert undo("attach", sock, sw_if_index=1, bd_id=2, shg=0) == Step(
+        "attach", sock, dict(sw_if_index=1, bd_id=1, shg=0, port_type=0)
+    )
+    assert undo("attach", "new.sock") == Step("detach", "new.sock", {})
+
+
+def test_load_skips_a_truncated_line(conn, tmp_path):
+    path = str(tmp_path / "t.journal")
+    plan = _tenant_plan(conn)
+    journal = _begin(conn, path, plan)
+    journal.confirm([0, 1], {"/var/sockets/t0.sock": 7})
+    with open(path, "a") as fh:
+        fh.write('{"op":"done","steps":[2,')
+
+    loaded = Journal.load(path)
+
+    assert loaded.steps == plan
+    assert loaded.confirmed == [0, 1]
+    assert loaded.created == {"/var/sockets/t0.sock": 7}
+    assert loaded.pending() == list(range(2, len(plan)))
+    assert loaded.unfinished
+
+
+def test_pending_and_revertible(conn):
+    journal = _begin(conn, None, _tenant_plan(conn))
+    journal.confirm([0, 1, 2], {})
+    journal.revert([2], {})
+    journal.confirm([2], {})
+
+    assert journal.pending() == list(range(3, len(journal.steps)))
+    assert journal.revertible() == [2, 1, 0]
+
+
+def test_rollback_restores_the_state(conn, vpp):
+    before = _state(vpp)
+    plan = _tenant_plan(conn)
+    journal = _begin(conn, None, plan)
+    variants = resolve_variants(conn)
+    # Make the last attach fail, after everything else was done
+    last = plan[-1]
+    plan[-1] = journal.steps[-1] = Step(last.action, last.target, dict(bd_id=42))
+
+    outcome = apply_journaled(conn, variants, journal, revert=True)
+
+    assert outcome["error"] and outcome["rollback_error"] is None
+    assert outcome["rolled_back"] == outcome["applied"] == len(plan) - 1
+    assert _state(vpp) == before
+    assert journal.status == "rolled back"
+
+
+def test_refused_step_ends_the_journal(conn, tmp_path):
+    path = str(tmp_path / "t.journal")
+    plan = _tenant_plan(conn)
+    plan[-1] = Step(plan[-1].action, plan[-1].target, dict(bd_id=42))
+    journal = _begin(conn, path, plan)
+
+    outcome = apply_journaled(conn, resolve_variants(conn), journal)
+
+    assert outcome["error"]
+    assert Journal.load(path).status == "failed"
+    assert open_journal(path, conn.api.control_ping().vpe_pid, DIGEST) == (None, "")
+
+
+def test_resume_after_a_partial_batch(conn, vpp, tmp_path, monkeypatch):
+    path = str(tmp_path / "t.journal")
+    plan = _tenant_plan(conn)
+    journal = _begin(conn, path, plan)
+    created = []
+    create = vpp.create_vhost_user_if
+
+    def lost_at_the_third(**kwargs):
+        if len(created) == 2:
+            raise IOError("VPP API client: read failed")
+        created.append(kwargs["sock_filename"])
+        return create(**kwargs)
+
+    monkeypatch.setattr(vpp, "create_vhost_user_if", lost_at_the_third)
+    monkeypatch.setattr(vpp, "create_vhost_user_if_v2", lost_at_the_third)
+    outcome = apply_journaled(conn, resolve_variants(conn), journal)
+
+    assert "Lost the connection" in outcome["error"]
+    resumed, reason = open_journal(path, conn.api.control_ping().vpe_pid, DIGEST)
+    assert reason == "" and resumed is not None
+    assert sorted(resumed.created) == sorted(created)
+    assert [plan[p].target for p in resumed.pending()][0] == "/var/sockets/t2.sock"
+
+    monkeypatch.undo()
+    outcome = apply_journaled(conn, resolve_variants(conn), resumed)
+
+    assert outcome["error"] is None
+    assert Journal.load(path).status == "complete"
+    assert sorted(v["sock_filename"] for v in vpp.vhost_user.values()) == [
+        "/var/sockets/sim-0.sock",
+        "/var/sockets/sim-1.sock",
+        "/var/sockets/t0.sock",
+        "/var/sockets/t1.sock",
+        "/var/sockets/t2.sock",
+    ]
+    assert set(vpp.bridge_domains[3]["members"]) == set(resumed.created.values())
+    assert 1 not in vpp.bridge_domains
+
+
+def test_open_journal_stale(conn, tmp_path):
+    path = str(tmp_path / "t.journal")
+    _begin(conn, path, _tenant_plan(conn))
+    pid = conn.api.control_ping().vpe_pid
+
+    assert open_journal(path, pid + 1, DIGEST)[1] == "VPP restarted since"
+    assert open_journal(path, pid, "other")[1] == "the declaration changed since"
+    assert open_journal(path, pid, DIGEST)[0] is not None
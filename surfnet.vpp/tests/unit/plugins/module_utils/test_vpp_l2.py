@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.const import (
+    L2_API_PORT_TYPE,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_common import (
+    VPPSnapshot,
+    resolve_variants,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_l2 import (
+    STEP_ORDER,
+    Step,
+    apply_plan,
+    plan_l2,
+    plan_membership,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import (
+    SimulatedVPP,
+    SimulatedVPPApiClient,
+)
+
+
+@pytest.fixture
+def vpp():
+    # Port sim-0 (sw_if_index 1) is in bridge domain 1, sim-1 (2) in 2
+    vpp = SimulatedVPP()
+    vpp.populate(vhost_user=2, bridge_domains=2)
+    return vpp
+
+
+@pytest.fixture
+def conn(vpp):
+    conn = SimulatedVPPApiClient(vpp=vpp)
+    conn.connect("test")
+    return conn
+
+
+def _snapshot(conn):
+    return VPPSnapshot(conn, tables=["bridge_domains", "vhost_user", "interfaces"])
+
+
+def _port(n, **spec):
+    return dict(sock_filename=f"sim-{n}.sock", tag=f"sim-{n}", **spec)
+
+
+def test_plan_l2_in_sync(conn):
+    plan = plan_l2(
+        _snapshot(conn),
+        [dict(bd=1), dict(bd=2)],
+        [_port(0, bd=1), _port(1, bd=2)],
+        purge_tag="sim-",
+    )
+
+    assert plan == []
+
+
+def test_plan_l2_step_order(conn):
+    plan = plan_l2(
+        _snapshot(conn),
+        [dict(bd=3, bd_tag="t")],
+        [
+            _port(1, bd=3, is_server=True),
+            dict(sock_filename="t0.sock", tag="t0", bd=3),
+        ],
+        purge_tag="sim-",
+    )
+
+    assert [step.action for step in plan] == [
+        "detach",
+        "delete_vhost_user",
+        "create_bridge_domain",
+        "create_vhost_user",
+        "modify_vhost_user",
+        "attach",
+        "attach",
+    ]
+    actions = [step.action for step in plan]
+    assert actions == sorted(actions, key=STEP_ORDER.index)
+    assert plan[0] == Step("detach", "/var/sockets/sim-0.sock", dict(sw_if_index=1))
+
+
+def test_plan_l2_purge_tag(conn, vpp):
+    vpp.sw_interface_tag_add_del(sw_if_index=2, tag="other")
+
+    plan = plan_l2(_snapshot(conn), [], [], purge_tag="sim-")
+
+    # Port sim-1 is not tagged sim- any more, the bridge domains are tagged 1
+    # and 2
+    assert plan == [
+        Step("detach", "/var/sockets/sim-0.sock", dict(sw_if_index=1)),
+        Step("delete_vhost_user", "/var/sockets/sim-0.sock", dict(sw_if_index=1)),
+    ]
+    assert plan_l2(_snapshot(conn), [], []) == []
+
+
+def test_plan_l2_port_leaves_purged_bridge_domain(conn, vpp):
+    snapshot = _snapshot(conn)
+    plan = plan_l2(snapshot, [dict(bd=3, bd_tag="3")], [_port(0, bd=3)], purge_tag="1")
+
+    # The declared port leaves bridge domain 1 before it is deleted, and only
+    # joins bridge domain 3 once that exists
+    assert [(step.action, step.target) for step in plan] == [
+        ("detach", 1),
+        ("delete_bridge_domain", 1),
+        ("create_bridge_domain", 3),
+        ("attach", "/var/sockets/sim-0.sock"),
+    ]
+
+    applied, error = apply_plan(conn, resolve_variants(conn), plan)
+
+    assert (applied, error) == (4, None)
+    assert sorted(vpp.bridge_domains) == [2, 3]
+    assert vpp.bridge_domains[3]["members"] == {1: 0}
+
+
+def test_plan_l2_keeps_joined_bridge_domains(conn):
+    # Bridge domain 2 is tagged 2 but not declared, a declared port joins it
+    plan = plan_l2(_snapshot(conn), [], [_port(1, bd=2)], purge_tag="2")
+
+    assert plan == []
+
+
+def test_plan_l2_errors(conn):
+    snapshot = _snapshot(conn)
+
+    with pytest.raises(ValueError, match="Duplicate bridge domain 3"):
+        plan_l2(snapshot, [dict(bd=3), dict(bd=3)], [])
+    with pytest.raises(ValueError, match="Duplicate vhost-user port"):
+        plan_l2(snapshot, [], [_port(0), dict(sock_filename="/var/sockets/sim-0.sock")])
+    with pytest.raises(ValueError, match="Bridge domain 9"):
+        plan_l2(snapshot, [], [_port(0, bd=9)])
+
+
+def test_plan_membership_in_sync(conn):
+    plan = plan_membership(
+        _snapshot(conn),
+        [
+            dict(bd=1, members=[dict(interface="VirtualEthernet0/0/0")]),
+            dict(bd=2, members=[dict(sw_if_index=2)]),
+        ],
+    )
+
+    assert plan == []
+
+
+def test_plan_membership_exclusive(conn, vpp):
+    vpp.sw_interface_set_l2_bridge(rx_sw_if_index=2, bd_id=1)
+    members = [dict(interface="VirtualEthernet0/0/0", shg=1)]
+
+    plan = plan_membership(_snapshot(conn), [dict(bd=1, members=members)])
+
+    # Detaches run first, the changed split horizon group is an attach
+    assert plan == [
+        Step("detach", "VirtualEthernet0/0/1", dict(sw_if_index=2)),
+        Step(
+            "attach",
+            "VirtualEthernet0/0/0",
+            dict(
+                sw_if_index=1,
+                bd_id=1,
+                shg=1,
+                port_type=L2_API_PORT_TYPE.L2_API_PORT_TYPE_NORMAL,
+            ),
+        ),
+    ]
+    plan = plan_membership(
+        _snapshot(conn), [dict(bd=1, members=members)], exclusive=False
+    )
+    assert [step.action for step in plan] == ["attach"]
+
+
+def test_plan_membership_moves(conn, vpp):
+    members = [dict(interface="VirtualEthernet0/0/0"), dict(sw_if_index=2)]
+
+    plan = plan_membership(_snapshot(conn), [dict(bd=1, members=members)])
+
+    # Port sim-1 is only attached to bridge domain 1, VPP takes it out of 2
+    assert [(step.action, step.target) for step in plan] == [
+        ("attach", "VirtualEthernet0/0/1")
+    ]
+    assert apply_plan(conn, resolve_variants(conn), plan) == (1, None)
+    assert vpp.bridge_domains[1]["members"] == {1: 0, 2: 0}
+    assert vpp.bridge_domains[2]["members"] == {}
+
+
+def test_plan_membership_bvi(conn, vpp):
+    spec = dict(bd=2, bvi="VirtualEthernet0/0/1")
+
+    plan = plan_membership(_snapshot(conn), [spec])
+
+    # Port sim-1 already is a member of bridge domain 2, not yet its BVI
+    assert plan == [
+        Step(
+            "attach",
+            "VirtualEthernet0/0/1",
+            dict(
+                sw_if_index=2,
+                bd_id=2,
+                shg=0,
+                port_type=L2_API_PORT_TYPE.L2_API_PORT_TYPE_BVI,
+            ),
+        )
+    ]
+    apply_plan(conn, resolve_variants(conn), plan)
+    assert vpp.bridge_domains[2]["bvi_sw_if_index"] == 2
+    assert plan_membership(_snapshot(conn), [spec]) == []
+
+    # A BVI that is not listed is detached, once
+    plan = plan_membership(_snapshot(conn), [dict(bd=2)])
+    assert plan == [Step("detach", "VirtualEthernet0/0/1", dict(sw_if_index=2))]
+
+
+def test_plan_membership_errors(conn):
+    snapshot = _snapshot(conn)
+
+    with pytest.raises(ValueError, match="Bridge domain 9 does not exist"):
+        plan_membership(snapshot, [dict(bd=9)])
+    with pytest.raises(ValueError, match="Interface eth9 of bridge domain 1"):
+        plan_membership(snapshot, [dict(bd=1, members=[dict(interface="eth9")])])
+    with pytest.raises(ValueError, match="bridge domains 1 and 2"):
+        plan_membership(
+            snapshot,
+            [dict(bd=1, members=[dict(sw_if_index=1)]), dict(bd=2, bvi=1)],
+        )
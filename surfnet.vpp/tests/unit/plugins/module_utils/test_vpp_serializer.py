@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import ipaddress
+from collections import namedtuple
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_serializer import (
+    MessageSerializers,
+)
+
+vpp_papi = pytest.importorskip("vpp_papi")
+
+# The parts of interface.api.json, ip.api.json, ip_types.api.json,
+# ethernet_types.api.json, fib_types.api.json and ipsec.api.json these
+# records use
+DEFINITIONS = {
+    "messages": [
+        [
+            "sw_interface_details",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["vl_api_interface_index_t", "sw_if_index"],
+            ["vl_api_mac_address_t", "l2_address"],
+            ["string", "interface_name", 64],
+            {"crc": "0x0"},
+        ],
+        [
+            "ip_route_details",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["vl_api_ip_route_t", "route"],
+            {"crc": "0x0"},
+        ],
+        [
+            "ipsec_sa_details",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["vl_api_ipsec_sad_entry_t", "entry"],
+            {"crc": "0x0"},
+        ],
+    ],
+    "types": [
+        [
+            "ip_route",
+            ["u32", "table_id"],
+            ["vl_api_prefix_t", "prefix"],
+            ["u8", "n_paths"],
+            ["vl_api_fib_path_t", "paths", 0, "n_paths"],
+        ],
+        [
+            "prefix",
+            ["vl_api_address_t", "address"],
+            ["u8", "len"],
+        ],
+        [
+            "address",
+            ["vl_api_address_family_t", "af"],
+            ["vl_api_address_union_t", "un"],
+        ],
+        [
+            "fib_path",
+            ["vl_api_interface_index_t", "sw_if_index"],
+            ["vl_api_fib_path_nh_proto_t", "proto"],
+            ["vl_api_fib_path_nh_t", "nh"],
+        ],
+        [
+            "fib_path_nh",
+            ["vl_api_address_union_t", "address"],
+            ["u32", "via_label"],
+        ],
+        [
+            "ipsec_sad_entry",
+            ["u32", "sad_id"],
+            ["u16", "udp_src_port", {"default": 4500}],
+            ["u16", "udp_dst_port", {"default": 4500}],
+        ],
+    ],
+    "unions": [
+        [
+            "address_union",
+            ["vl_api_ip4_address_t", "ip4"],
+            ["vl_api_ip6_address_t", "ip6"],
+        ],
+    ],
+    "enums": [
+        ["address_family", ["ADDRESS_IP4", 0], ["ADDRESS_IP6", 1], {"enumtype": "u8"}],
+        [
+            "fib_path_nh_proto",
+            ["FIB_API_PATH_NH_PROTO_IP4", 0],
+            ["FIB_API_PATH_NH_PROTO_IP6", 1],
+            {"enumtype": "u32"},
+        ],
+    ],
+    "aliases": {
+        "interface_index": {"type": "u32"},
+        "ip4_address": {"type": "u8", "length": 4},
+        "ip6_address": {"type": "u8", "length": 16},
+        "mac_address": {"type": "u8", "length": 6},
+    },
+    "services": {
+        "sw_interface_dump": {"reply": "sw_interface_details", "stream": True},
+        "ip_route_dump": {"reply": "ip_route_details", "stream": True},
+        "ipsec_sa_dump": {"reply": "ipsec_sa_details", "stream": True},
+    },
+}
+
+# Records the way vpp_papi decodes them
+Interface = namedtuple(
+    "sw_interface_details",
+    ["_vl_msg_id", "context", "sw_if_index", "l2_address", "interface_name"],
+    rename=True,
+)
+Route = namedtuple("ip_route_details", ["_vl_msg_id", "context", "route"], rename=True)
+IPRoute = namedtuple("vl_api_ip_route_t", ["table_id", "prefix", "n_paths", "paths"])
+FibPath = namedtuple("vl_api_fib_path_t", ["sw_if_index", "proto", "nh"])
+FibPathNh = namedtuple("vl_api_fib_path_nh_t", ["address", "via_label"])
+SA = namedtuple("ipsec_sa_details", ["_vl_msg_id", "context", "entry"], rename=True)
+SadEntry = namedtuple(
+    "vl_api_ipsec_sad_entry_t", ["sad_id", "udp_src_port", "udp_dst_port"]
+)
+AddressUnion = namedtuple("vl_api_address_union_t", ["ip4", "ip6"])
+
+
+def _address_union(address):
+    packed = address.packed.ljust(16, b"\0")
+    return AddressUnion(
+        ipaddress.IPv4Address(packed[:4]), ipaddress.IPv6Address(packed)
+    )
+
+
+@pytest.fixture
+def serializers():
+    return MessageSerializers(DEFINITIONS)
+
+
+def test_interface_mac_address(serializers):
+    record = Interface(
+        10, 1, 3, vpp_papi.MACAddress("02:fe:00:00:00:03"), "VirtualEthernet0/0/0"
+    )
+
+    assert serializers.for_dump("sw_interface_dump")([record]) == [
+        {
+            "sw_if_index": 3,
+            "l2_address": "02:fe:00:00:00:03",
+            "interface_name": "VirtualEthernet0/0/0",
+        }
+    ]
+
+
+def test_route_addresses(serializers):
+    next_hop = ipaddress.IPv4Address("192.0.2.1")
+    route = IPRoute(
+        table_id=0,
+        prefix=ipaddress.IPv4Network("10.0.0.0/24"),
+        n_paths=1,
+        paths=[FibPath(1, 0, FibPathNh(_address_union(next_hop), 0))],
+    )
+
+    (converted,) = serializers.for_dump("ip_route_dump")([Route(20, 1, route)])
+
+    assert converted["route"]["prefix"] == "10.0.0.0/24"
+    assert converted["route"]["paths"][0]["nh"]["address"] == {
+        "ip4": "192.0.2.1",
+        "ip6": "c000:201::",
+    }
+
+
+def test_route_fields(serializers):
+    route = IPRoute(
+        table_id=7,
+        prefix=ipaddress.IPv6Network("2001:db8::/32"),
+        n_paths=0,
+        paths=[],
+    )
+
+    convert = serializers.for_dump("ip_route_dump", ["route.table_id", "route.prefix"])
+
+    assert convert([Route(20, 1, route)]) == [
+        {"route": {"table_id": 7, "prefix": "2001:db8::/32"}}
+    ]
+
+
+def test_formatted_types_have_no_fields(serializers):
+    with pytest.raises(ValueError):
+        serializers.for_dump("ip_route_dump", ["route.prefix.len"])
+
+
+def test_field_options_are_not_a_length(serializers):
+    record = SA(30, 1, SadEntry(sad_id=5, udp_src_port=4500, udp_dst_port=4501))
+
+    assert serializers.for_dump("ipsec_sa_dump")([record]) == [
+        {"entry": {"sad_id": 5, "udp_src_port": 4500, "udp_dst_port": 4501}}
+    ]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.surfnet.vpp.plugins.module_utils import vpp_stats
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_stats import (
+    HEADER,
+    StatsSegment,
+    StatsSegmentError,
+    interface_stats,
+)
+from ansible_collections.surfnet.vpp.plugins.module_utils.vpp_sim import SimulatedVPP
+
+THREADS = 2
+
+
+@pytest.fixture
+def vpp():
+    vpp = SimulatedVPP()
+    vpp.populate(vhost_user=2)
+    return vpp
+
+
+@pytest.fixture
+def segment(vpp, tmp_path):
+    path = vpp.write_stats_segment(str(tmp_path / "stats"), threads=THREADS)
+    with StatsSegment.open(path) as segment:
+        yield segment
+
+
+def test_scalars(segment):
+    stats = segment.dump(["^/sys/vector_rate$", "^/sys/num_worker_threads$"])
+
+    assert stats == {"/sys/vector_rate": 2, "/sys/num_worker_threads": THREADS - 1}
+
+
+def test_name_vector(segment):
+    assert segment.dump(["^/if/names$"])["/if/names"] == [
+        "local0",
+        "VirtualEthernet0/0/0",
+        "VirtualEthernet0/0/1",
+    ]
+
+
+def test_simple_counters(segment):
+    stats = segment.dump(["^/if/drops$"])
+    assert stats["/if/drops"] == [0, THREADS, 2 * THREADS]
+
+    stats = segment.dump(["^/if/drops$"], per_thread=True)
+    assert stats["/if/drops"] == [[0, 1, 2]] * THREADS
+
+
+def test_combined_counters(segment):
+    stats = segment.dump(["^/if/rx$"])
+    assert stats["/if/rx"] == [
+        dict(packets=10 * n * THREADS, bytes=640 * n * THREADS) for n in (1, 2, 3)
+    ]
+
+    stats = segment.dump(["^/if/rx$"], per_thread=True)
+    assert (
+        stats["/if/rx"]
+        == [[dict(packets=10 * n, bytes=640 * n) for n in (1, 2, 3)]] * THREADS
+    )
+
+
+def test_symlinks(segment):
+    stats = segment.dump(["^/interfaces/"])
+
+    assert stats["/interfaces/VirtualEthernet0/0/1/rx"] == dict(
+        packets=30 * THREADS, bytes=1920 * THREADS
+    )
+    assert len(stats) == 3
+
+
+def test_interface_stats(segment):
+    records = interface_stats(segment.dump(["^/if/"]))
+
+    assert [(r["sw_if_index"], r["name"]) for r in records] == [
+        (0, "local0"),
+        (1, "VirtualEthernet0/0/0"),
+        (2, "VirtualEthernet0/0/1"),
+    ]
+    assert records[1]["tx"] == dict(packets=40 * THREADS, bytes=2560 * THREADS)
+
+
+def test_ls_skips_empty_entries(segment):
+    assert "/err/unused" not in segment.ls()
+    assert segment.ls(["^/sys/node/"]) == [
+        "/sys/node/names",
+        "/sys/node/calls",
+        "/sys/node/vectors",
+        "/sys/node/clocks",
+        "/sys/node/suspends",
+    ]
+
+
+def test_epoch_change_reads_again(vpp, monkeypatch):
+    buffer = bytearray(vpp.stats_segment(threads=THREADS))
+    segment = StatsSegment(buffer)
+    entries = StatsSegment._entries
+    calls = []
+
+    def changing(self):
+        # VPP bumps the epoch while the first read runs
+        if not calls:
+            header = list(HEADER.unpack_from(buffer, 0))
+            header[2] += 1
+            HEADER.pack_into(buffer, 0, *header)
+        calls.append(1)
+        return entries(self)
+
+    monkeypatch.setattr(StatsSegment, "_entries", changing)
+
+    assert segment.dump(["^/sys/num_worker_threads$"]) == {
+        "/sys/num_worker_threads": THREADS - 1
+    }
+    assert len(calls) == 2
+
+
+def test_in_progress_waits(vpp, monkeypatch):
+    buffer = bytearray(vpp.stats_segment(threads=THREADS, in_progress=1))
+    segment = StatsSegment(buffer)
+
+    def sleep(seconds):
+        # VPP finishes its update
+        header = list(HEADER.unpack_from(buffer, 0))
+        header[3] = 0
+        HEADER.pack_into(buffer, 0, *header)
+
+    monkeypatch.setattr(vpp_stats.time, "sleep", sleep)
+
+    assert segment.dump(["^/sys/vector_rate$"]) == {"/sys/vector_rate": 2}
+
+
+def test_in_progress_gives_up(vpp, monkeypatch):
+    segment = StatsSegment(bytearray(vpp.stats_segment(in_progress=1)))
+    monkeypatch.setattr(vpp_stats.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(StatsSegmentError):
+        segment.dump()
+
+
+def test_unsupported_version(vpp):
+    buffer = bytearray(vpp.stats_segment())
+    header = list(HEADER.unpack_from(buffer, 0))
+    header[0] = 1
+    HEADER.pack_into(buffer, 0, *header)
+
+    with pytest.raises(StatsSegmentError):
+        StatsSegment(buffer)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2023 SURF B.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generate module_utils/vpp_errors.py from the error definitions of VPP
+
+The API return values are defined in src/vnet/api_errno.h of the VPP source
+tree, as lines of the foreach_vnet_api_error macro:
+
+    _ (UNSPECIFIED, -1, "Unspecified Error")
+
+Usage:
+    tools/gen_vpp_errors.py [--version v23.10] path/to/vpp/src/vnet/api_errno.h
+
+More headers can be given, a later definition of a retval wins.
+"""
+
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+
+OUTPUT = (
+    Path(__file__).resolve().parent.parent
+    / "surfnet.vpp"
+    / "plugins"
+    / "module_utils"
+    / "vpp_errors.py"
+)
+
+# The description can span lines when the macro line is continued
+DEFINITION = re.compile(
+    r"_\s*\(\s*([A-Z0-9_]+)\s*,\s*(-?\d+)\s*,\s*((?:\"(?:[^\"\\]|\\.)*\"\s*\\?\s*)+)\)"
+)
+STRING = re.compile(r"\"((?:[^\"\\]|\\.)*)\"")
+
+HEADER = """# -*- coding: utf-8 -*-
+
+# Generated by tools/gen_vpp_errors.py from {source}, do not edit.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+# API retval: (name, description)
+ERRORS = {{
+"""
+
+
+def parse(text: str) -> dict:
+    errors = {}
+    for name, retval, description in DEFINITION.findall(text):
+        parts = STRING.findall(description)
+        errors[int(retval)] = (name, "".join(parts).encode().decode("unicode_escape"))
+    return errors
+
+
+def render(errors: dict, source: str) -> str:
+    lines = [HEADER.format(source=source)]
+    for retval in sorted(errors, reverse=True):
+        name, description = errors[retval]
+        entry = f"    {retval}: ({json.dumps(name)}, {json.dumps(description)}),\n"
+        if len(entry) > 89:
+            # Wrapped the way black would
+            entry = (
+                f"    {retval}: (\n"
+                f"        {json.dumps(name)},\n"
+                f"        {json.dumps(description)},\n"
+                "    ),\n"
+            )
+        lines.append(entry)
+    lines.append("}\n")
+    return "".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("headers", nargs="+", type=Path, help="api_errno.h files")
+    parser.add_argument("--version", help="VPP version the headers are from")
+    parser.add_argument("--output", type=Path, default=OUTPUT)
+    args = parser.parse_args()
+
+    errors = {}
+    for header in args.headers:
+        errors.update(parse(header.read_text()))
+    if not errors:
+        print("No error definitions found", file=sys.stderr)
+        return 1
+
+    source = "api_errno.h"
+    if args.version:
+        source += f" of VPP {args.version}"
+    args.output.write_text(render(errors, source))
+    print(f"Wrote {len(errors)} errors to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())